@@ -25,20 +25,27 @@
 # from your version.
 
 
+import logging
 import os
+import Queue
+import threading
 import time
 
 from gi.repository import Gdk
+from gi.repository import GLib
 from gi.repository import Gtk
 from gi.repository import GObject
  
 from xl import (
+    common,
     event, 
+    playlist,
     providers,
     settings
 )
 
 from xl.nls import gettext as _
+import xlgui
 from xlgui.guiutil import idle_add, GtkTemplate
 from xlgui.accelerators import Accelerator
 from xlgui.widgets import menu, dialogs
@@ -46,6 +53,8 @@ from xlgui.widgets import menu, dialogs
 import bpmdetect
 autodetect_enabled = bpmdetect.autodetect_supported()
 
+logger = logging.getLogger(__name__)
+
 menu_providers = [
     'track-panel-menu',
     'playlist-context-menu',
@@ -59,8 +68,10 @@ class BPMCounterPlugin(object):
     name = 'BPM'
     menuitem = None
     
+    batch_items = []
+    
     def enable(self, exaile):
-        pass
+        self.exaile = exaile
     
     def on_gui_loaded(self):
         providers.register('mainwindow-info-area-widget', self)
@@ -72,6 +83,16 @@ class BPMCounterPlugin(object):
             
             for p in menu_providers:
                 providers.register(p, self.menuitem)
+            
+            item = menu.simple_menu_item('_bpm', [],
+                _('Detect Missing BPMs'), callback=self.on_missing_menuitem)
+            item.register('menubar-tools-menu')
+            self.batch_items = [item]
+            
+            item = menu.simple_menu_item('_bpm', ['export-files'],
+                _('Autodetect BPM'), callback=self.on_playlist_menuitem)
+            item.register('playlist-panel-context-menu')
+            self.batch_items.append(item)
     
     def disable(self, exaile):
         """
@@ -83,6 +104,10 @@ class BPMCounterPlugin(object):
             for p in menu_providers:
                 providers.unregister(p, self.menuitem)
         
+        for item in self.batch_items:
+            item.unregister()
+        self.batch_items = []
+        
     def create_widget(self, info_area):
         """
             mainwindow-info-area-widget provider API method
@@ -100,7 +125,33 @@ class BPMCounterPlugin(object):
                     window = playlist_view.parent
                 else:
                     window = None
-            self.autodetect_bpm(tracks[0], window)
+            if len(tracks) > 1:
+                self.autodetect_bpm_batch(tracks)
+            else:
+                self.autodetect_bpm(tracks[0], window)
+    
+    def on_missing_menuitem(self, widget, name, parent, context):
+        self.autodetect_bpm_batch([tr for tr in self.exaile.collection
+                                   if not tr.get_tag_raw('bpm')])
+    
+    def on_playlist_menuitem(self, widget, name, parent, context):
+        pl = context['selected-playlist']
+        if isinstance(pl, playlist.SmartPlaylist):
+            pl = pl.get_playlist(self.exaile.collection)
+        self.autodetect_bpm_batch(list(pl))
+    
+    def autodetect_bpm_batch(self, tracks):
+        """
+            Detects the BPM of many tracks in the background and stores
+            the results without asking
+        """
+        if not tracks:
+            return
+        thread = BPMBatchThread(tracks, self.exaile.collection,
+            workers=settings.get_option('plugin/bpm/batch_workers', 2),
+            max_duration=settings.get_option('plugin/bpm/batch_window', 0))
+        xlgui.get_controller().progress_manager.add_monitor(thread,
+            _("Detecting BPM..."), Gtk.STOCK_EXECUTE)
             
     def autodetect_bpm(self, track, parent_window=None):
         
@@ -135,6 +186,96 @@ class BPMCounterPlugin(object):
 plugin_class = BPMCounterPlugin
 
 
+class BPMBatchThread(common.ProgressThread):
+    """
+        Detects the BPM of a list of tracks, running several GStreamer
+        pipelines at once
+    """
+    #: Number of results stored at once
+    batch_size = 50
+
+    def __init__(self, tracks, collection=None, workers=2, max_duration=0):
+        """
+            :param tracks: the tracks to analyze
+            :param collection: the collection to save once done, if any
+            :param workers: the number of tracks to analyze at once
+            :param max_duration: if not 0, only decode this many seconds
+                of each track
+        """
+        common.ProgressThread.__init__(self)
+        self.tracks = tracks
+        self.collection = collection
+        self.workers = max(1, workers)
+        self.max_duration = max_duration
+        self.stopper = threading.Event()
+
+    def stop(self):
+        """
+            Stops the thread
+        """
+        self.stopper.set()
+        common.ProgressThread.stop(self)
+
+    def _start(self, track, results):
+        # Pipelines report through the main loop, so start them there
+        def on_complete(bpm, error):
+            results.put((track, bpm, error))
+        try:
+            bpmdetect.detect_bpm(track.get_loc_for_io(), on_complete,
+                self.max_duration)
+        except Exception as e:
+            logger.exception("Could not analyze %s", track)
+            on_complete(None, str(e))
+        return False
+
+    def _store(self, found):
+        for track, bpm in found:
+            track.set_tag_raw('bpm', bpm)
+        del found[:]
+
+    def run(self):
+        """
+            Runs the thread
+        """
+        pending = list(reversed(self.tracks))
+        total = len(pending)
+        results = Queue.Queue()
+        for i in range(min(self.workers, total)):
+            GLib.idle_add(self._start, pending.pop(), results)
+
+        found = []
+        stored = 0
+        for i in xrange(total):
+            # wake up now and then to notice a stop request
+            while not self.stopper.is_set():
+                try:
+                    track, bpm, error = results.get(timeout=0.5)
+                    break
+                except Queue.Empty:
+                    pass
+            else:
+                break
+            if pending:
+                GLib.idle_add(self._start, pending.pop(), results)
+
+            if error is not None:
+                logger.warning("BPM detection failed for %s: %s", track, error)
+            elif bpm:
+                found.append((track, int(round(bpm))))
+                stored += 1
+                if len(found) >= self.batch_size:
+                    self._store(found)
+            self.emit('progress-update', (i + 1) * 100.0 / total)
+
+        self._store(found)
+        if stored and self.collection is not None:
+            self.collection.save_to_location()
+        logger.info("Detected the BPM of %d of %d tracks", stored, total)
+
+        if not self.stopper.is_set():
+            self.emit('done')
+
+
 @GtkTemplate('bpm.ui', relto=__file__)
 class BPMWidget(Gtk.Frame):
 
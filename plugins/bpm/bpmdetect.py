@@ -22,7 +22,7 @@ from gi.repository import Gst, GObject, Gio
 def autodetect_supported():
     return Gst.ElementFactory.make('bpmdetect', None) != None
 
-def detect_bpm(uri, on_complete):
+def detect_bpm(uri, on_complete, max_duration=None):
     '''
         Detects the BPM of a song using GStreamer's bpmdetect plugin
         
@@ -30,9 +30,23 @@ def detect_bpm(uri, on_complete):
                   song processing, but the bpm detector accumulates
                   the results so this will only return the last
                   result.
+
+        :param uri: the song to analyze
+        :param on_complete: called as on_complete(bpm, error) from the
+            main loop once the song was processed
+        :param max_duration: if set, only this many seconds from the
+            middle of the song are decoded, which is much faster and
+            usually good enough
     '''
     
     bpm = [None]
+    window = [max_duration]
+
+    def _finish(result, error):
+        playbin.set_state(Gst.State.NULL)
+        bus.remove_signal_watch()
+        bus.disconnect(handler)
+        on_complete(result, error)
 
     def _on_message(bus, msg):
     
@@ -51,20 +65,29 @@ def detect_bpm(uri, on_complete):
             
             if v > 0:
                 bpm[0] = v
+
+        elif msg.type == Gst.MessageType.ASYNC_DONE and window[0]:
+            # Prerolled; restrict playback to the window and start it
+            duration = window[0] * Gst.SECOND
+            window[0] = None
+            ok, length = playbin.query_duration(Gst.Format.TIME)
+            if ok and length > duration:
+                start = (length - duration) // 2
+                playbin.seek(1.0, Gst.Format.TIME, Gst.SeekFlags.FLUSH,
+                             Gst.SeekType.SET, start,
+                             Gst.SeekType.SET, start + duration)
+            playbin.set_state(Gst.State.PLAYING)
             
         elif msg.type == Gst.MessageType.ERROR:
             
-            playbin.set_state(Gst.State.NULL)
-            
             gerror, debug_info = msg.parse_error()
             if gerror:
-                on_complete(None, gerror.message.rstrip("."))
+                _finish(None, gerror.message.rstrip("."))
             else:
-                on_complete(None, debug_info)
+                _finish(None, debug_info)
             
         elif msg.type == Gst.MessageType.EOS:
-            playbin.set_state(Gst.State.NULL)
-            on_complete(bpm[0], None)
+            _finish(bpm[0], None)
     
     audio_sink = Gst.Bin.new('audiosink')
     
@@ -97,10 +120,13 @@ def detect_bpm(uri, on_complete):
     
     bus = playbin.get_bus()
     bus.add_signal_watch()
-    bus.connect('message', _on_message)
+    handler = bus.connect('message', _on_message)
 
     playbin.props.uri = uri
-    playbin.set_state(Gst.State.PLAYING)
+    if max_duration:
+        playbin.set_state(Gst.State.PAUSED)
+    else:
+        playbin.set_state(Gst.State.PLAYING)
 
 
 
@@ -339,6 +339,7 @@ class DaapManager:
     #    panel.library.daap_share.disconnect()
         panel.daap_share.disconnect()
     #    panel.net_collection.remove_library(panel.library)
+        panel.net_collection.close()
         providers.unregister('main-panel', panel)
         del self.panels[name]
 
@@ -660,7 +661,7 @@ class NetworkPanel(CollectionPanel):
         # Since we don't use a ProgressManager/Thingy, we have to call these w/out
         #  a ScanThread
         self.net_collection.rescan_libraries()
-        GObject.idle_add(self._refresh_tags_in_tree)
+        GObject.idle_add(self.load_tree)
 
 
     def save_selected(self, widget=None, event=None):
@@ -1,5 +1,6 @@
 
 import logging
+import threading
 from gi.repository import GObject
 from xl import collection, event, settings
 import spydaap.parser.exaile
@@ -17,6 +18,9 @@ class CollectionWrapper:
             self.id = id
             self.parser = spydaap.parser.exaile.ExaileParser()
             self.daap = None
+            # the server revision in which this item last changed
+            self.revision = None
+            self.track_revision = track._revision
 
         def get_dmap_raw(self):
             if self.daap is None:
@@ -32,21 +36,75 @@ class CollectionWrapper:
 
     def __init__(self, collection):
         self.collection = collection
-        self.map = []
+        self.revision = None
+        # the revision of the oldest listing get_changes can diff against
+        self.first_revision = None
+        # items in collection order
+        self.items = []
+        # id -> TrackWrapper
+        self.map = {}
+        # track -> TrackWrapper
+        self.wrappers = {}
+        # id of a removed item -> revision in which it was removed
+        self.deleted = {}
+        self.next_id = 1
+        self.lock = threading.Lock()
+
+    def update(self, revision):
+        '''
+            Brings the items up to date with the collection. Items that
+            were added or changed since the last update are marked with
+            revision, the encoded data of unchanged items is kept.
+        '''
+        with self.lock:
+            if revision == self.revision:
+                return
+            items = []
+            wrappers = {}
+            for t in self.collection:
+                w = self.wrappers.pop(t, None)
+                if w is None:
+                    w = self.TrackWrapper(self.next_id, t)
+                    w.revision = revision
+                    self.map[w.id] = w
+                    self.next_id += 1
+                elif w.track_revision != t._revision:
+                    w.daap = None
+                    w.revision = revision
+                    w.track_revision = t._revision
+                items.append(w)
+                wrappers[t] = w
+            for w in self.wrappers.itervalues():
+                del self.map[w.id]
+                self.deleted[w.id] = revision
+            self.items = items
+            self.wrappers = wrappers
+            if self.first_revision is None:
+                self.first_revision = revision
+            self.revision = revision
+
+    def get_changes(self, since):
+        '''
+            Returns the items changed after revision since and the ids
+            of the items removed meanwhile, or None if the changes are
+            not known.
+        '''
+        with self.lock:
+            if self.first_revision is None or since < self.first_revision:
+                return None
+            return ([w for w in self.items if w.revision > since],
+                    [id for id, rev in self.deleted.iteritems() if rev > since])
 
     def __iter__(self):
-        i = 0
-        self.map = []
-        for t in self.collection:
-            self.map.append(self.TrackWrapper(i, t))
-            yield self.map[i]
-            i += 1
+        if self.revision is None:
+            self.update(0)
+        return iter(self.items)
     
     def get_item_by_id(self, id):
         return self.map[int(id)]
     
     def __getitem__(self, idx):
-        return self.map[idx]
+        return self.items[idx]
 
     def __len__(self):
         return len(self.collection)
@@ -64,9 +122,11 @@ def _enable(exaile):
     port = int(settings.get_option('plugin/daapserver/port', 3689))
     name = settings.get_option('plugin/daapserver/name', 'Exaile Share')
     host = settings.get_option('plugin/daapserver/host', '0.0.0.0')
+    workers = int(settings.get_option('plugin/daapserver/workers', 8))
     
     ds = DaapServer(CollectionWrapper(exaile.collection), 
-                                        port=port, name=name, host=host)
+                                        port=port, name=name, host=host,
+                                        workers=workers)
                                         
     if( settings.get_option('plugin/daapserver/enabled', True) ):
         ds.start()
@@ -102,6 +162,8 @@ def on_settings_change(event, setting, option):
         ds.set(port=settings.get_option(option,3689))
     if option == 'plugin/daapserver/host' and ds is not None:
         ds.set(host=settings.get_option(option,'0.0.0.0'))
+    if option == 'plugin/daapserver/workers' and ds is not None:
+        ds.set(workers=int(settings.get_option(option, 8)))
     if option == 'plugin/daapserver/enabled' and ds is not None:
         enabled = setting.get_option(option, True)
         if enabled:
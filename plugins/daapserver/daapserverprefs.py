@@ -11,6 +11,10 @@ class PortPreference(widgets.SpinPreference):
     default = 3689
     name = 'plugin/daapserver/port'
     
+class WorkersPreference(widgets.SpinPreference):
+    default = 8
+    name = 'plugin/daapserver/workers'
+
 class NamePreference(widgets.Preference):
     default = 'Exaile Share'
     name = 'plugin/daapserver/name'
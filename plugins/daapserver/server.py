@@ -15,10 +15,10 @@
 #You should have received a copy of the GNU General Public License
 #along with Spydaap. If not, see <http://www.gnu.org/licenses/>.
 
-import BaseHTTPServer, SocketServer, getopt, grp, httplib, logging, os, pwd, select, signal, spydaap, sys, socket
+import BaseHTTPServer, Queue, getopt, grp, httplib, logging, os, pwd, select, signal, spydaap, sys, socket, time
 import spydaap.daap, spydaap.metadata, spydaap.containers, spydaap.cache, spydaap.server, spydaap.zeroconf
 from spydaap.daap import do
-from threading import Thread
+from threading import Lock, Thread
 from xl import common, event
 import config
 
@@ -27,29 +27,189 @@ logger = logging.getLogger('daapserver')
 
 __all__ = ['DaapServer']
 
-class MyThreadedHTTPServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
-    """Handle requests in a separate thread."""
+# Tags whose changes show up in the item lists sent to clients
+LISTED_TAGS = frozenset(['title', 'artist', 'composer', 'genre', 'album',
+    'bpm', 'year', 'tracknumber', 'tracktotal', 'discnumber', '__length',
+    '__loc'])
+
+def makeConnectionHandlerClass(handler_class):
+    """Returns a subclass of handler_class whose instances only set up
+    the connection when created, leaving the requests to be handled
+    one by one."""
+    class ConnectionHandler(handler_class):
+        def __init__(self, request, client_address, server):
+            self.request = request
+            self.client_address = client_address
+            self.server = server
+            self.setup()
+    return ConnectionHandler
+
+class Connection(object):
+    """A client connection and the request handler serving it.
+
+    The handler is kept between requests so that data it has already
+    buffered from the client is not lost."""
+
+    def __init__(self, server, request, client_address):
+        self.request = request
+        self.client_address = client_address
+        self.handler = server.connection_handler_class(request,
+                                                       client_address, server)
+        self.deadline = None
+
+    def fileno(self):
+        return self.request.fileno()
+
+    def has_buffered_request(self):
+        """Whether the client already sent the start of another request"""
+        rbuf = getattr(self.handler.rfile, '_rbuf', None)
+        return rbuf is not None and rbuf.tell() > 0
+
+    def handle_one_request(self):
+        """Serves one request, returns whether to keep the connection"""
+        self.handler.close_connection = 1
+        self.handler.handle_one_request()
+        return not self.handler.close_connection
+
+    def close(self):
+        try:
+            self.handler.finish()
+        except socket.error:
+            pass
+
+class MyThreadedHTTPServer(BaseHTTPServer.HTTPServer):
+    """Handle requests in a fixed pool of worker threads.
+
+    Workers serve one request at a time rather than a whole connection:
+    between requests, kept alive connections wait in the listening
+    thread, so idle clients do not hold on to a worker. They are closed
+    after the handler's timeout."""
     timeout = 1
 
-    def __init__(self, *args):
-        if ':' in args[0][0]:
+    def __init__(self, server_address, handler_class, workers=8):
+        if ':' in server_address[0]:
             self.address_family = socket.AF_INET6   
-        BaseHTTPServer.HTTPServer.__init__(self,*args)
+        BaseHTTPServer.HTTPServer.__init__(self, server_address,
+                                           handler_class)
+        self.connection_handler_class = \
+            makeConnectionHandlerClass(handler_class)
         self.keep_running = True
+        self.requests = Queue.Queue()
+        self.idle = set()
+        self.idle_lock = Lock()
+        # written to by workers to wake up the listening thread when a
+        # connection becomes idle again
+        (self.wakeup_r, self.wakeup_w) = os.pipe()
+        self.threads = []
+        for i in range(max(workers, 1)):
+            t = Thread(target=self.process_requests,
+                       name='DaapServer-%d' % i)
+            t.daemon = True
+            t.start()
+            self.threads.append(t)
 
     def serve_forever(self):
-        while self.keep_running:
-            self.handle_request()
+        try:
+            while self.keep_running:
+                self.handle_events()
+        finally:
+            with self.idle_lock:
+                os.close(self.wakeup_r)
+                os.close(self.wakeup_w)
+
+    def handle_events(self):
+        with self.idle_lock:
+            idle = list(self.idle)
+        try:
+            readable = select.select(
+                [self.socket, self.wakeup_r] + idle, [], [], self.timeout)[0]
+        except (select.error, socket.error, ValueError):
+            # a connection was closed while waiting
+            readable = []
+        if not self.keep_running:
+            return
+        if self.wakeup_r in readable:
+            os.read(self.wakeup_r, 512)
+        if self.socket in readable:
+            self.accept_connection()
+        now = time.time()
+        for conn in idle:
+            if conn in readable:
+                with self.idle_lock:
+                    self.idle.discard(conn)
+                self.requests.put(conn)
+            elif conn.deadline is not None and conn.deadline < now:
+                with self.idle_lock:
+                    self.idle.discard(conn)
+                self.close_connection(conn)
+
+    def accept_connection(self):
+        try:
+            (request, client_address) = self.get_request()
+        except socket.error:
+            return
+        if not self.verify_request(request, client_address):
+            self.shutdown_request(request)
+            return
+        try:
+            conn = Connection(self, request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+            self.shutdown_request(request)
+            return
+        self.wait_for_request(conn)
+
+    def wait_for_request(self, conn):
+        timeout = conn.handler.timeout
+        if timeout is not None:
+            conn.deadline = time.time() + timeout
+        with self.idle_lock:
+            if not self.keep_running:
+                self.close_connection(conn)
+                return
+            self.idle.add(conn)
+            os.write(self.wakeup_w, 'x')
+
+    def process_requests(self):
+        while True:
+            conn = self.requests.get()
+            if conn is None:
+                return
+            try:
+                keep = conn.handle_one_request()
+                # requests already buffered would not wake up select()
+                while keep and conn.has_buffered_request():
+                    keep = conn.handle_one_request()
+            except Exception:
+                self.handle_error(conn.request, conn.client_address)
+                keep = False
+            if keep and self.keep_running:
+                self.wait_for_request(conn)
+            else:
+                self.close_connection(conn)
+
+    def close_connection(self, conn):
+        conn.close()
+        self.shutdown_request(conn.request)
 
     def force_stop(self):
-        self.keep_running = False
+        for t in self.threads:
+            self.requests.put(None)
+        with self.idle_lock:
+            self.keep_running = False
+            os.write(self.wakeup_w, 'x')
+            idle = list(self.idle)
+            self.idle.clear()
+        for conn in idle:
+            self.close_connection(conn)
         self.server_close()
         
 class DaapServer():
-    def __init__(self, library, name=spydaap.server_name, host='', port=spydaap.port):
+    def __init__(self, library, name=spydaap.server_name, host='', port=spydaap.port, workers=8):
 #        Thread.__init__(self)
         self.host = host
         self.port = port
+        self.workers = workers
         self.library = library
         self.name = name
         self.httpd = None
@@ -58,6 +218,20 @@ class DaapServer():
         # Set a callback that will let us propagate library changes to clients
         event.add_callback( self.update_rev, 'libraries_modified',
                                                      library.collection) 
+        event.add_batched_callback(self.update_rev, 'tracks_added',
+                                   library.collection, 1000)
+        event.add_batched_callback(self.update_rev, 'tracks_removed',
+                                   library.collection, 1000)
+        event.add_batched_callback(self.on_track_tags_changed,
+                                   'track_tags_changed', None, 1000)
+
+    def on_track_tags_changed(self, evty, events):
+        collection = self.library.collection
+        for track, tag in events:
+            if tag in LISTED_TAGS and \
+                    collection.loc_is_member(track.get_loc_for_io()):
+                self.update_rev()
+                return
         
     def update_rev(self, *args):
         if self.handler is not None:
@@ -79,7 +253,7 @@ class DaapServer():
         self.handler = spydaap.server.makeDAAPHandlerClass(
                                         str(self.name), [], self.library, [])
         self.httpd = MyThreadedHTTPServer((self.host, self.port), 
-                                     self.handler)
+                                     self.handler, self.workers)
         
         #signal.signal(signal.SIGTERM, make_shutdown(httpd))
         #signal.signal(signal.SIGHUP, rebuild_cache)
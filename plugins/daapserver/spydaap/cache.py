@@ -55,19 +55,26 @@ class OrderedCache(object):
         self.dir = os.path.abspath(dir)
         if (not(os.path.exists(self.dir))):
             os.mkdir(self.dir)
+        # contents of the index file, read once
+        self.index = None
         
     def __iter__(self):
         return OrderedCache.Iter(self)
 
+    def get_index(self):
+        if self.index == None:
+            fi = open(os.path.join(self.dir, 'index'), 'r')
+            self.index = fi.read()
+            fi.close()
+        return self.index
+
     def get_item_by_id(self, id):
-        fi = open(os.path.join(self.dir, 'index'), 'r')
-        fi.seek((int(id) - 1) * 32)
-        cfn = fi.read(32)
-        fi.close()
+        pos = (int(id) - 1) * 32
+        cfn = self.get_index()[pos:pos + 32]
         return self.get_item_by_pid(cfn, id)
 
     def __len__(self):
-        return os.path.getsize(os.path.join(self.dir, 'index')) / 32
+        return len(self.get_index()) / 32
 
     def build_index(self, pid_list=None):
         index_fn = os.path.join(self.dir, 'index')
@@ -80,12 +87,14 @@ class OrderedCache(object):
         for pid in pid_list:
             fi.write(pid)
         fi.close()
+        self.index = None
 
     def clean(self):
         for f in os.listdir(self.dir):
             p = os.path.join(self.dir, f)
             if os.path.isfile(p):
                 os.remove(p)
+        self.index = None
         
 class OrderedCacheItem(object):
     def __init__(self, cache, pid, id):
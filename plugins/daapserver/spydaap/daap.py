@@ -123,14 +123,10 @@ class DAAPObject(object):
             # our object is a container,
             # this means we're going to have to
             # check contains[]
-            value = ''
-            for item in self.contains:
-                # get the data stream from each of the sub elements
-                if type(item) == str:
-                    #preencoded
-                    value += item
-                else:
-                    value += item.encode()
+            # get the data stream from each of the sub elements,
+            # str items are preencoded
+            value = ''.join([item if type(item) == str else item.encode()
+                             for item in self.contains])
             # get the length of the data
             length  = len(value)
             # pack: 4 byte code, 4 byte length, length bytes of value
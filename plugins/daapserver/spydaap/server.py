@@ -13,16 +13,93 @@
 #You should have received a copy of the GNU General Public License
 #along with Spydaap. If not, see <http://www.gnu.org/licenses/>.
 
-import BaseHTTPServer, errno, logging, os, re, urlparse, socket, spydaap, sys
+import BaseHTTPServer, errno, logging, os, re, urlparse, socket, spydaap, struct, sys, threading
 from spydaap.daap import do
+from spydaap.daap_data import dmapNames
+
+def split_dmap_raw(raw):
+    """Splits encoded dmap data into a list of (code, data) pairs,
+    one per top level atom."""
+    atoms = []
+    pos = 0
+    while pos + 8 <= len(raw):
+        code, length = struct.unpack('!4sI', raw[pos:pos + 8])
+        atoms.append((code, raw[pos:pos + 8 + length]))
+        pos += 8 + length
+    return atoms
+
+# bytes copied at once when sendfile is not available
+COPY_CHUNK = 256 * 1024
+
+def parse_range(value, size):
+    """Parses the value of a Range header for a resource of size bytes.
+
+    Returns (start, end) with end exclusive, or None if the header is
+    malformed or asks for several ranges, in which case the whole
+    resource should be sent. Raises ValueError if the range can not
+    be satisfied."""
+    m = re.match(r'^bytes=\s*([0-9]*)\s*-\s*([0-9]*)\s*$', value)
+    if m is None:
+        return None
+    (start, end) = m.groups()
+    if start:
+        start = int(start)
+        if end:
+            end = int(end) + 1
+            if end <= start:
+                return None
+            end = min(end, size)
+        else:
+            end = size
+    elif end:
+        # suffix range, the last end bytes
+        start = max(size - int(end), 0)
+        end = size
+        if end == start:
+            raise ValueError("empty suffix range")
+    else:
+        return None
+    if start >= size:
+        raise ValueError("range starts after the end of the resource")
+    return (start, end)
+
+def copy_file(f, wfile, start, length):
+    """Sends length bytes of file f, starting at start, to wfile.
+
+    Uses os.sendfile where available (Python 3.3+), which copies the
+    data in the kernel, otherwise copies in large chunks."""
+    sendfile = getattr(os, 'sendfile', None)
+    if sendfile is not None and hasattr(wfile, 'fileno'):
+        wfile.flush()
+        out = wfile.fileno()
+        while length > 0:
+            sent = sendfile(out, f.fileno(), start, length)
+            if sent == 0:
+                break
+            start += sent
+            length -= sent
+        return
+    f.seek(start)
+    while length > 0:
+        data = f.read(min(COPY_CHUNK, length))
+        if not data:
+            break
+        wfile.write(data)
+        length -= len(data)
 
 def makeDAAPHandlerClass(server_name, cache, md_cache, container_cache):
     session_id = 1
     log = logging.getLogger('spydaap.server')
+    # encoded item lists of the current revision, keyed by
+    # (revision, meta codes, delta)
+    item_lists = {}
+    item_list_lock = threading.Lock()
 
     class DAAPHandler(BaseHTTPServer.BaseHTTPRequestHandler):
         daap_server_revision = 1
         protocol_version = "HTTP/1.1"
+        # seconds after which idle keep-alive connections are closed
+        timeout = 30
 
         def h(self, data, **kwargs):
             self.send_response(kwargs.get('status', 200))
@@ -165,15 +242,51 @@ def makeDAAPHandlerClass(server_name, cache, md_cache, container_cache):
             self.h(d.encode())
 
         def do_GET_item_list(self, database_id):
+            query = urlparse.parse_qs(urlparse.urlparse(self.path).query)
+            meta = query.get('meta', [''])[0].split(',')
+            if 'all' in meta:
+                meta = None
+            else:
+                # unknown fields are ignored
+                meta = frozenset(dmapNames[m] for m in meta if m in dmapNames)
+            try:
+                delta = int(query.get('delta', ['0'])[0])
+            except ValueError:
+                delta = 0
+
+            with item_list_lock:
+                revision = self.daap_server_revision
+                key = (revision, meta, delta)
+                data = item_lists.get(key)
+                if data is None:
+                    # everything cached for older revisions is stale
+                    for k in item_lists.keys():
+                        if k[0] != revision:
+                            del item_lists[k]
+                    data = item_lists[key] = \
+                            self.build_item_list(revision, meta, delta)
+            self.h(data)
+
+        def build_item_list(self, revision, meta, delta):
             def build_item(md):
+                raw = md.get_dmap_raw()
+                if meta:
+                    raw = ''.join(atom for code, atom in
+                                  split_dmap_raw(raw) if code in meta)
                 return do('dmap.listingitem', 
                           [ do('dmap.itemkind', 2),
                             do('dmap.containeritemid', md.id),
                             do('dmap.itemid', md.id),
-                            md.get_dmap_raw()
-                            ])
+                            raw
+                            ]).encode()
 
-            def build():
+            if hasattr(md_cache, 'update'):
+                md_cache.update(revision)
+            changes = None
+            if delta and hasattr(md_cache, 'get_changes'):
+                changes = md_cache.get_changes(delta)
+
+            if changes is None:
                 children = [ build_item (md) for md in md_cache ]
                 file_count = len(children)
                 d = do('daap.databasesongs',
@@ -183,11 +296,19 @@ def makeDAAPHandlerClass(server_name, cache, md_cache, container_cache):
                          do('dmap.returnedcount', file_count),
                          do('dmap.listing',
                             children) ])
-                return d.encode()
-
-            data = build()
-#            data = cache.get('item_list', build)
-            self.h(data)
+            else:
+                (changed, deleted) = changes
+                children = [ build_item (md) for md in changed ]
+                d = do('daap.databasesongs',
+                       [ do('dmap.status', 200),
+                         do('dmap.updatetype', 1),
+                         do('dmap.specifiedtotalcount', len(md_cache)),
+                         do('dmap.returnedcount', len(children)),
+                         do('dmap.listing',
+                            children),
+                         do('dmap.deletedidlisting',
+                            [ do('dmap.itemid', id) for id in deleted ]) ])
+            return d.encode()
 
         def do_GET_update(self):
             mupd = do('dmap.updateresponse',
@@ -199,27 +320,54 @@ def makeDAAPHandlerClass(server_name, cache, md_cache, container_cache):
         def do_GET_item(self, database, item, format):
             try:
                 fn = md_cache.get_item_by_id(item).get_original_filename()
-            except IndexError:          # if the track isn't in the DB, we get an exception
+                f = open(fn, 'rb')
+            except (IndexError, KeyError, IOError): # if the track isn't in the DB, we get an exception
                 self.send_error(404)    # this can be caused by left overs from previous sessions
                 return
 
-            if (self.headers.has_key('Range')):
-                rs = self.headers['Range']
-                m = re.compile('bytes=([0-9]+)-([0-9]+)?').match(rs)
-                (start, end) = m.groups()
-                if end != None: end = int(end)
-                else: end = os.stat(fn).st_size
-                start = int(start)
-                f = spydaap.ContentRangeFile(fn, open(fn), start, end)
-                extra_headers={"Content-Range": "bytes %s-%s/%s"%(str(start), str(end), str(os.stat(fn).st_size))}
-                status=206
-            else: 
-                f = open(fn)
-                extra_headers={}
-                status=200
-            # this is ugly, very wrong.
-            type = "audio/%s"%(os.path.splitext(fn)[1])
-            self.h(f, type=type, status=status, extra_headers=extra_headers)
+            try:
+                size = os.fstat(f.fileno()).st_size
+                (start, end) = (0, size)
+                extra_headers = {}
+                status = 200
+                if self.headers.has_key('Range'):
+                    try:
+                        r = parse_range(self.headers['Range'], size)
+                    except ValueError:
+                        self.send_response(416)
+                        self.send_header('Content-Range', 'bytes */%d' % size)
+                        self.send_header('Content-Length', '0')
+                        self.end_headers()
+                        return
+                    if r is not None:
+                        (start, end) = r
+                        extra_headers['Content-Range'] = 'bytes %d-%d/%d' \
+                            % (start, end - 1, size)
+                        status = 206
+                # this is ugly, very wrong.
+                type = "audio/%s"%(os.path.splitext(fn)[1])
+                self.send_file(f, start, end - start, type=type,
+                               status=status, extra_headers=extra_headers)
+            finally:
+                f.close()
+
+        def send_file(self, f, start, length, **kwargs):
+            self.send_response(kwargs.get('status', 200))
+            self.send_header('Content-Type', kwargs.get('type', 'application/octet-stream'))
+            self.send_header('DAAP-Server', 'Simple')
+            self.send_header('Accept-Ranges', 'bytes')
+            for k, v in kwargs.get('extra_headers', {}).iteritems():
+                self.send_header(k, v)
+            self.send_header('Content-Length', str(length))
+            self.end_headers()
+            if hasattr(self, 'isHEAD') and self.isHEAD:
+                return
+            try:
+                copy_file(f, self.wfile, start, length)
+            except socket.error as ex:
+                if ex.errno in [errno.ECONNRESET, errno.EPIPE]:
+                    self.close_connection = 1
+                else: raise
 
         def do_GET_container_list(self, database):
             container_do = []
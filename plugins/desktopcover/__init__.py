@@ -149,20 +149,27 @@ class DesktopCover(Gtk.Window):
         """
             Updates the cover image and triggers cross-fading
         """
-        cover_data = covers.MANAGER.get_cover(track, set_only=True)
+        size = settings.get_option('plugin/desktopcover/size', 200)
+        upscale = settings.get_option('plugin/desktopcover/override_size', False)
+
+        if upscale:
+            # scaled covers are cached, but never upscaled
+            cover_data = covers.MANAGER.get_cover(track, set_only=True)
+            next_pixbuf = None
+            if cover_data is not None:
+                next_pixbuf = icons.MANAGER.pixbuf_from_data(
+                    cover_data, size=(size, size), upscale=True)
+        else:
+            next_pixbuf = covers.MANAGER.get_cover_pixbuf(track, (size, size))
 
-        if cover_data is None:
+        if next_pixbuf is None:
             self.hide()
             return
 
         if not self.props.visible:
             self.show()
 
-        size = settings.get_option('plugin/desktopcover/size', 200)
-        upscale = settings.get_option('plugin/desktopcover/override_size', False)
         pixbuf = self.image.get_pixbuf()
-        next_pixbuf = icons.MANAGER.pixbuf_from_data(
-            cover_data, size=(size, size), upscale=upscale)
         fading = settings.get_option('plugin/desktopcover/fading', False)
 
         if fading and pixbuf is not None and self._cross_fade_id is None:
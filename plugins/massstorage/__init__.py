@@ -24,12 +24,15 @@
 # do so. If you do not wish to do so, delete this exception statement
 # from your version.
 
-from xl import providers, collection, common
+from xl import providers, collection, common, settings, transcoder
 from xl.nls import gettext as _
 from xl.hal import Handler
 from xl.devices import Device
 import dbus
 import logging, os
+
+import massstorageprefs
+
 logger = logging.getLogger(__name__)
 
 PROVIDER = None
@@ -45,6 +48,9 @@ def disable(exaile):
     providers.unregister("hal", PROVIDER)
     PROVIDER = None
 
+def get_preferences_pane():
+    return massstorageprefs
+
 class MassStorageDevice(Device):
     def __init__(self, mountpoints, name=""):
         if len(mountpoints) == 0:
@@ -63,11 +69,17 @@ class MassStorageDevice(Device):
         for mountpoint in self.mountpoints:
             library = self.library_class(mountpoint)
             self.collection.add_library(library)
+        transcode_format = settings.get_option(
+                'plugin/massstorage/transcode_format', '')
+        if transcode_format not in transcoder.FORMATS:
+            transcode_format = None
         self.transfer = collection.TransferQueue(
-                self.collection.get_libraries()[0] )
+                self.collection.get_libraries()[0],
+                transcode_format=transcode_format )
         self.connected = True # set this here so the UI can react
 
     def disconnect(self):
+        self.collection.close()
         self.collection = collection.Collection(name=self.name)
         self.mountpoints = []
         self.transfer = None
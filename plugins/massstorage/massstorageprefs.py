@@ -0,0 +1,53 @@
+# Copyright (C) 2009-2010 Aren Olson
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2, or (at your option)
+# any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+#
+#
+# The developers of the Exaile media player hereby grant permission
+# for non-GPL compatible GStreamer and Exaile plugins to be used and
+# distributed together with GStreamer and Exaile. This permission is
+# above and beyond the permissions granted by the GPL license by which
+# Exaile is covered. If you modify this code, you may extend this
+# exception to your version of the code, but you are not obligated to
+# do so. If you do not wish to do so, delete this exception statement
+# from your version.
+
+import os
+
+from xl import transcoder
+from xl.nls import gettext as _
+from xlgui.preferences import widgets
+
+name = _('Mass Storage Devices')
+basedir = os.path.dirname(os.path.realpath(__file__))
+ui = os.path.join(basedir, 'massstorage_prefs.ui')
+
+class TranscodeFormatPreference(widgets.ComboPreference):
+    """
+        The format tracks are converted to when copied to a device,
+        an empty string copies them as they are
+    """
+    default = ''
+    name = 'plugin/massstorage/transcode_format'
+
+    def __init__(self, preferences, widget):
+        model = widget.get_model()
+        model.append(['', _('Keep the original format')])
+        # only offer formats the installed GStreamer plugins can encode
+        for format in sorted(transcoder.get_formats()):
+            model.append([format, format])
+        widgets.ComboPreference.__init__(self, preferences, widget)
+
+# vim: et sts=4 sw=4
@@ -24,16 +24,24 @@ from __future__ import division, print_function
 
 import os.path
 
+import Queue
+import threading
+
 from gi.repository import (
     Gdk,
     GLib,
+    Gtk,
 )
 
+import xl.common
 import xl.event
 from xl.nls import gettext as _
 import xl.player
+import xl.settings
 import xl.xdg
+import xlgui
 import xlgui.guiutil
+from xlgui.widgets import menu
 
 from cache import ExaileMoodbarCache
 from generator import SpectrumMoodbarGenerator
@@ -44,9 +52,11 @@ from widget import Moodbar
 class MoodbarPlugin:
     def __init__(self):
         self.main_controller = self.preview_controller = None
+        self.menu_items = []
 
     def enable(self, exaile):
-        self.generator = SpectrumMoodbarGenerator()
+        self.generator = SpectrumMoodbarGenerator(
+            workers=xl.settings.get_option('plugin/moodbar/workers', 2))
         self.generator.check()
 
         self.exaile = exaile
@@ -62,17 +72,48 @@ class MoodbarPlugin:
     def on_gui_loaded(self):
         self.main_controller = MoodbarController(self, xl.player.PLAYER, self.exaile.gui.main.progress_bar)
 
+        item = menu.simple_menu_item('moodbar-generate', [],
+            _('Generate Moodbars'), callback=self._on_generate_collection)
+        item.register('menubar-tools-menu')
+        self.menu_items.append(item)
+        item = menu.simple_menu_item('moodbar-generate', ['enqueue'],
+            _('Generate Moodbars'), callback=self._on_generate_selected,
+            condition_fn=lambda n, p, c: not c['selection-empty'])
+        item.register('playlist-context-menu')
+        self.menu_items.append(item)
+
     def disable(self, exaile):
         if not self.main_controller:  # Disabled more than once or before gui_loaded
             return
+        for item in self.menu_items:
+            item.unregister()
+        self.menu_items = []
         xl.event.remove_callback(self._on_preview_device_enabled, 'preview_device_enabled')
         xl.event.remove_callback(self._on_preview_device_disabling, 'preview_device_disabling')
         self.main_controller.destroy()
         if self.preview_controller:
             self.preview_controller.destroy()
         self.main_controller = self.preview_controller = None
+        self.cache.close()
         del self.exaile, self.cache, self.generator, self.painter
 
+    # Batch generation
+
+    def generate_moodbars(self, tracks):
+        """Generate the missing moodbars of tracks in the background.
+
+        :type tracks: Iterable[xl.trax.Track]
+        """
+        thread = MoodbarBatchThread(self.generator, self.cache, tracks)
+        xlgui.get_controller().progress_manager.add_monitor(thread,
+            _("Generating moodbars..."), Gtk.STOCK_EXECUTE)
+
+    def _on_generate_collection(self, widget, name, parent, context):
+        self.generate_moodbars(self.exaile.collection)
+
+    def _on_generate_selected(self, widget, name, parent, context):
+        self.generate_moodbars(context['selected-tracks'])
+
     # Preview Device events
 
     def _on_preview_device_enabled(self, event, plugin, _=None):
@@ -85,6 +126,58 @@ class MoodbarPlugin:
 plugin_class = MoodbarPlugin
 
 
+class MoodbarBatchThread(xl.common.ProgressThread):
+    """Generates the moodbars of many tracks, skipping the cached ones"""
+
+    def __init__(self, generator, cache, tracks):
+        xl.common.ProgressThread.__init__(self)
+        self.generator = generator
+        self.cache = cache
+        self.tracks = tracks
+        self.stopper = threading.Event()
+
+    def stop(self):
+        self.stopper.set()
+        xl.common.ProgressThread.stop(self)
+
+    def run(self):
+        uris = set()
+        for track in self.tracks:
+            uri = track.get_loc_for_io()
+            if uri.startswith('file://') and uri not in self.cache:
+                uris.add(uri)
+        total = len(uris)
+        if not total:
+            self.emit('done')
+            return
+
+        results = Queue.Queue()
+
+        def callback(uri, data):
+            self.cache.put(uri, data)
+            results.put(uri)
+
+        # Queued as non-urgent, so the moodbar of the playing track is still
+        # generated first; the generator's pool bounds the processes run.
+        for uri in uris:
+            self.generator.generate_async(uri, callback, urgent=False)
+
+        for i in xrange(total):
+            # wake up now and then to notice a stop request
+            while not self.stopper.is_set():
+                try:
+                    uris.discard(results.get(timeout=0.5))
+                    break
+                except Queue.Empty:
+                    pass
+            else:
+                for uri in uris:
+                    self.generator.cancel(uri, callback)
+                return
+            self.emit('progress-update', (i + 1) * 100.0 / total)
+        self.emit('done')
+
+
 # TRANSLATORS: Time format for playback progress
 def format_time(seconds, format=_("{minutes}:{seconds:02}")):
     seconds = int(round(seconds))
@@ -133,9 +226,14 @@ class MoodbarController:
             def callback(uri, data):
                 if cache:
                     cache.put(uri, data)
-                self.moodbar.set_mood(data)
+                GLib.idle_add(self._on_mood_generated, uri, data)
             self.plugin.generator.generate_async(uri, callback)
 
+    def _on_mood_generated(self, uri, data):
+        current = self.player.current
+        if self.moodbar and current and current.get_loc_for_io() == uri:
+            self.moodbar.set_mood(data)
+
     def _on_timer(self):
         assert self.moodbar
         try:
@@ -17,8 +17,14 @@
 
 from __future__ import division, print_function, unicode_literals
 
+import hashlib
+import logging
 import os
 import sys
+import threading
+
+
+logger = logging.getLogger(__name__)
 
 
 if sys.platform == 'win32':
@@ -44,25 +50,109 @@ class MoodbarCache:
 
 
 class ExaileMoodbarCache(MoodbarCache):
+    """Moodbar cache keeping all moodbars in a single file.
+
+    The file is a sequence of fixed-size records, each made of the MD5 hash of
+    a URI followed by its 3000 bytes of moodbar data. The hashes are read into
+    an index when the cache is opened; moodbars are read when requested.
+
+    Moodbars stored as one file per URI by older versions are moved into the
+    packed file when they are first requested.
+    """
+
+    DATA_SIZE = 3000
+    KEY_SIZE = 16
+    RECORD_SIZE = KEY_SIZE + DATA_SIZE
+
     def __init__(self, location):
         try:
             os.mkdir(location)
         except OSError:
             pass
         self.loc = location
+        self.lock = threading.Lock()
+        self.path = os.path.join(location, b'moods.pack')
+        mode = 'r+b' if os.path.exists(self.path) else 'w+b'
+        self.file = open(self.path, mode)
+        #: URI hash -> offset of its record
+        self.index = {}
+        self._load_index()
+
+    def _load_index(self):
+        f = self.file
+        f.seek(0, os.SEEK_END)
+        size = f.tell()
+        if size % self.RECORD_SIZE:
+            logger.warning("Truncating incomplete record in %s", self.path)
+            size -= size % self.RECORD_SIZE
+            f.truncate(size)
+        for offset in xrange(0, size, self.RECORD_SIZE):
+            f.seek(offset)
+            self.index[f.read(self.KEY_SIZE)] = offset
 
     def get(self, uri):
-        try:
-            with open(self._get_cache_path(uri), 'rb') as f:
-                return f.read()
-        except IOError:
-            return None
+        key = self._get_key(uri)
+        with self.lock:
+            offset = self.index.get(key)
+            if offset is not None and not self.file.closed:
+                self.file.seek(offset + self.KEY_SIZE)
+                return self.file.read(self.DATA_SIZE)
+        return self._import_old(uri)
 
     def put(self, uri, data):
         if data is None:
             return
-        with open(self._get_cache_path(uri), 'wb') as f:
-            f.write(data)
+        if len(data) != self.DATA_SIZE:
+            logger.warning("Not caching moodbar of unexpected size %d for %s",
+                len(data), uri)
+            return
+        key = self._get_key(uri)
+        with self.lock:
+            if self.file.closed:
+                return
+            offset = self.index.get(key)
+            if offset is None:
+                self.file.seek(0, os.SEEK_END)
+                offset = self.file.tell()
+            self.file.seek(offset)
+            self.file.write(key + data)
+            self.file.flush()
+            self.index[key] = offset
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+    def __contains__(self, uri):
+        return self._get_key(uri) in self.index or \
+            os.path.exists(self._get_cache_path(uri))
+
+    def _get_key(self, uri):
+        """
+        :type uri: bytes
+        :rtype: bytes
+        """
+        assert isinstance(uri, bytes)
+        return hashlib.md5(uri).digest()
+
+    def _import_old(self, uri):
+        """Move a moodbar stored by an older version into the packed file.
+
+        :type uri: bytes
+        :rtype: Optional[bytes]
+        """
+        path = self._get_cache_path(uri)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except IOError:
+            return None
+        self.put(uri, data)
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        return data
 
     def _get_cache_path(self, uri):
         """
@@ -17,7 +17,10 @@
 
 from __future__ import division, print_function, unicode_literals
 
+import itertools
+import logging
 import os
+import Queue
 import subprocess
 import threading
 import tempfile
@@ -25,10 +28,39 @@ import tempfile
 from gi.repository import Gio
 
 
+logger = logging.getLogger(__name__)
+
+
 class MoodbarGeneratorError(Exception): pass
 
 
 class MoodbarGenerator:
+    """Base class for moodbar generators.
+
+    Asynchronous requests are run by a pool of at most `workers` threads, so at
+    most that many generator processes run at once. Requests for a URI that is
+    already being generated are merged with the running one.
+    """
+
+    # Seconds after which idle worker threads exit
+    idle_timeout = 5
+
+    def __init__(self, workers=2):
+        """
+        :param workers: Maximum number of moodbars generated at once
+        :type workers: int
+        """
+        self.workers = workers
+        self._lock = threading.Lock()
+        # URI -> callbacks waiting for it
+        self._pending = {}
+        # (priority, sequence number, URI)
+        self._queue = Queue.PriorityQueue()
+        self._sequence = itertools.count()
+        # URIs being generated
+        self._active = set()
+        self._running = 0
+
     def check(self):
         """Check whether the generator works.
 
@@ -50,15 +82,84 @@ class MoodbarGenerator:
         """
         raise NotImplementedError
 
-    def generate_async(self, uri, callback=None):
+    def generate_async(self, uri, callback=None, urgent=True):
+        """Generate a moodbar in the background.
+
+        The callback is called from a worker thread; data is None if
+        generating failed.
+
+        :type uri: bytes
+        :type callback: Callable[[bytes, Optional[bytes]], None]
+        :param urgent: Whether to generate this moodbar before the non-urgent
+            ones already queued, e.g. because it is about to be displayed
+        :type urgent: bool
         """
+        with self._lock:
+            callbacks = self._pending.get(uri)
+            if callbacks is None:
+                callbacks = self._pending[uri] = []
+            elif not urgent:
+                callbacks.append(callback)
+                return
+            # An urgent request for a queued URI is queued again in front; the
+            # later entry is skipped as the URI is not pending anymore by then.
+            callbacks.append(callback)
+            self._queue.put((0 if urgent else 1, next(self._sequence), uri))
+            if self._running < self.workers:
+                self._running += 1
+                t = threading.Thread(name=self.__class__.__name__,
+                    target=self._work)
+                t.daemon = True
+                t.start()
+
+    def cancel(self, uri, callback):
+        """Cancel a request made with `generate_async`.
+
+        The moodbar is still generated if other requests for it remain or if it
+        is already being generated.
+
         :type uri: bytes
-        :type callback: Callable[[bytes, bytes], None]
+        :type callback: Callable[[bytes, Optional[bytes]], None]
         """
-        t = threading.Thread(name=self.__class__.__name__,
-            target=self.generate, args=(uri, callback))
-        t.daemon = True
-        t.start()
+        with self._lock:
+            callbacks = self._pending.get(uri)
+            if callbacks is None:
+                return
+            try:
+                callbacks.remove(callback)
+            except ValueError:
+                pass
+            if not callbacks and uri not in self._active:
+                del self._pending[uri]
+
+    def _work(self):
+        while True:
+            try:
+                uri = self._queue.get(timeout=self.idle_timeout)[2]
+            except Queue.Empty:
+                with self._lock:
+                    if self._queue.empty():
+                        self._running -= 1
+                        return
+                continue
+            with self._lock:
+                if uri not in self._pending or uri in self._active:
+                    continue
+                self._active.add(uri)
+            data = None
+            try:
+                data = self.generate(uri)
+            except Exception:
+                logger.exception("Failed to generate moodbar for %s", uri)
+            with self._lock:
+                callbacks = self._pending.pop(uri, ())
+                self._active.discard(uri)
+            for callback in callbacks:
+                if callback:
+                    try:
+                        callback(uri, data)
+                    except Exception:
+                        logger.exception("Error in moodbar callback")
 
 
 class SpectrumMoodbarGenerator(MoodbarGenerator):
@@ -32,14 +32,14 @@ class MoodbarPainter:
         :rtype: cairo.ImageSurface
         """
         surf = cairo.ImageSurface(cairo.FORMAT_RGB24, 1000, 1)
-        arr = surf.get_data()
-        for p in xrange(0, 1000):
-            p4 = p * 4
-            p3 = p * 3
-            # Cairo RGB24 is BGRX
-            arr[p4 + 0] = data[p3 + 2]
-            arr[p4 + 1] = data[p3 + 1]
-            arr[p4 + 2] = data[p3 + 0]
+        rgb = bytearray(data[:3000])
+        # Cairo RGB24 is BGRX
+        bgrx = bytearray(4000)
+        bgrx[0::4] = rgb[2::3]
+        bgrx[1::4] = rgb[1::3]
+        bgrx[2::4] = rgb[0::3]
+        surf.get_data()[:4000] = bytes(bgrx)
+        surf.mark_dirty()
         return surf
 
 
@@ -0,0 +1,292 @@
+import os
+import shutil
+import tempfile
+import threading
+
+import pytest
+
+from xl import collection, event, settings
+from xl.trax import track
+
+
+@pytest.yield_fixture
+def libdir():
+    d = tempfile.mkdtemp()
+    for album in range(3):
+        os.mkdir(os.path.join(d, 'album%d' % album))
+        for num in range(4):
+            open(os.path.join(d, 'album%d' % album, '%d.ogg' % num),
+                 'w').close()
+    yield d
+    shutil.rmtree(d)
+
+
+@pytest.fixture(params=[0, 3])
+def scan_workers(request, monkeypatch):
+    get_option = settings.get_option
+
+    def fake_get_option(option, default=None):
+        if option == 'collection/scan_workers':
+            return request.param
+        return get_option(option, default)
+
+    monkeypatch.setattr(settings, 'get_option', fake_get_option)
+
+    reads = []
+
+    def read_tags(self):
+        reads.append(self)
+        self.set_tag_raw('title', os.path.basename(self.get_local_path()))
+        self.set_tag_raw('__basedir',
+                         os.path.dirname(self.get_local_path()))
+        self._scan_valid = True
+        return True
+
+    monkeypatch.setattr(track.Track, 'read_tags', read_tags)
+    return reads
+
+
+def scan(coll, lib, **kwargs):
+    batches = []
+
+    def on_tracks_added(type, obj, locations):
+        batches.append(len(locations))
+
+    event.add_callback(on_tracks_added, 'tracks_added', coll)
+    try:
+        lib.rescan(**kwargs)
+    finally:
+        event.remove_callback(on_tracks_added, 'tracks_added', coll)
+    return batches
+
+
+def test_rescan_adds_tracks_in_one_batch(libdir, scan_workers):
+    coll = collection.Collection('test')
+    lib = collection.Library('file://' + libdir)
+    coll.add_library(lib)
+
+    assert scan(coll, lib) == [12]
+    assert len(coll) == 12
+    assert len(scan_workers) == 12
+    tr = coll.get_track_by_loc('file://%s/album1/2.ogg' % libdir)
+    assert tr.get_tag_raw('title') == [u'2.ogg']
+    assert tr.get_tag_raw('__date_added')
+
+
+def test_rescan_skips_unchanged_tracks(libdir, scan_workers):
+    coll = collection.Collection('test')
+    lib = collection.Library('file://' + libdir)
+    coll.add_library(lib)
+    scan(coll, lib)
+    del scan_workers[:]
+
+    assert scan(coll, lib) == []
+    assert scan_workers == []
+
+    lib.rescan(force_update=True)
+    assert len(scan_workers) == 12
+
+
+def test_incremental_rescan(libdir, scan_workers):
+    coll = collection.Collection('test')
+    lib = collection.Library('file://' + libdir)
+    coll.add_library(lib)
+    scan(coll, lib)
+    assert 'file://%s/album2' % libdir in coll._directories
+    del scan_workers[:]
+
+    lib.rescan(incremental=True)
+    assert scan_workers == []
+
+    # new files change the mtime of their directory
+    open(os.path.join(libdir, 'album2', 'new.ogg'), 'w').close()
+    # files modified in place don't
+    with open(os.path.join(libdir, 'album1', '0.ogg'), 'w') as f:
+        f.write('changed')
+
+    assert scan(coll, lib, incremental=True) == [1]
+    assert [tr.get_tag_raw('title') for tr in scan_workers] == \
+        [[u'new.ogg']]
+    del scan_workers[:]
+
+    # a full rescan notices the changed size
+    lib.rescan()
+    assert [tr.get_tag_raw('title') for tr in scan_workers] == \
+        [[u'0.ogg']]
+
+
+@pytest.mark.parametrize('incremental', [False, True])
+def test_rescan_removes_vanished_tracks(libdir, scan_workers, incremental):
+    coll = collection.Collection('test')
+    lib = collection.Library('file://' + libdir)
+    coll.add_library(lib)
+    scan(coll, lib)
+
+    os.remove(os.path.join(libdir, 'album0', '1.ogg'))
+    shutil.rmtree(os.path.join(libdir, 'album2'))
+    removed = []
+
+    def on_tracks_removed(type, obj, locations):
+        removed.append(sorted(locations))
+
+    event.add_callback(on_tracks_removed, 'tracks_removed', coll)
+    try:
+        lib.rescan(incremental=incremental)
+    finally:
+        event.remove_callback(on_tracks_removed, 'tracks_removed', coll)
+
+    assert removed == [sorted(['file://%s/album0/1.ogg' % libdir] +
+        ['file://%s/album2/%d.ogg' % (libdir, i) for i in range(4)])]
+    assert len(coll) == 7
+
+
+def test_rescan_keeps_tracks_of_unreadable_library(libdir, scan_workers):
+    coll = collection.Collection('test')
+    lib = collection.Library('file://' + libdir)
+    coll.add_library(lib)
+    scan(coll, lib)
+
+    shutil.rmtree(libdir)
+    lib.rescan()
+    assert len(coll) == 12
+    os.mkdir(libdir)
+
+
+def test_transfer_queue(libdir, scan_workers):
+    dest = tempfile.mkdtemp()
+    try:
+        coll = collection.Collection('device')
+        lib = collection.Library('file://' + dest)
+        coll.add_library(lib)
+        tracks = [track.Track('file://%s/album0/%d.ogg' % (libdir, i),
+                              scan=False) for i in range(3)]
+        for i, tr in enumerate(tracks):
+            with open(tr.get_local_path(), 'w') as f:
+                f.write('x' * 1000 * (i + 1))
+            os.utime(tr.get_local_path(), (1000000000, 1000000000))
+
+        progress = []
+
+        def on_progress(type, transfer, percent):
+            progress.append(percent)
+
+        transfer = collection.TransferQueue(lib)
+        event.add_callback(on_progress, 'track_transfer_progress', transfer)
+        try:
+            transfer.enqueue(tracks)
+            transfer.transfer()
+        finally:
+            event.remove_callback(on_progress, 'track_transfer_progress',
+                                  transfer)
+        assert sorted(os.listdir(dest)) == ['0.ogg', '1.ogg', '2.ogg']
+        assert len(coll) == 3
+        assert progress[-1] == 100
+        assert progress == sorted(progress)
+
+        # identical files are not copied again, and other files are
+        # never overwritten
+        os.remove(os.path.join(dest, '1.ogg'))
+        with open(os.path.join(dest, '2.ogg'), 'w') as f:
+            f.write('changed')
+        copied = []
+
+        def on_progress(type, transfer, percent):
+            copied.append(transfer.bytes_total)
+
+        event.add_callback(on_progress, 'track_transfer_progress', transfer)
+        try:
+            transfer.enqueue(tracks)
+            transfer.transfer()
+        finally:
+            event.remove_callback(on_progress, 'track_transfer_progress',
+                                  transfer)
+        assert copied[-1] == 2000
+        assert sorted(os.listdir(dest)) == ['0.ogg', '1.ogg', '2.ogg']
+        with open(os.path.join(dest, '2.ogg')) as f:
+            assert f.read() == 'changed'
+    finally:
+        shutil.rmtree(dest)
+
+
+def test_transfer_queue_survives_worker_errors(libdir, monkeypatch):
+    dest = tempfile.mkdtemp()
+    try:
+        lib = collection.Library('file://' + dest)
+        tracks = [track.Track('file://%s/album0/%d.ogg' % (libdir, i),
+                              scan=False) for i in range(3)]
+
+        def transfer_file(self, src, dest, size, transcode):
+            raise TypeError('unexpected')
+
+        monkeypatch.setattr(collection.TransferQueue,
+                            '_TransferQueue__transfer_file', transfer_file)
+        transfer = collection.TransferQueue(lib)
+        transfer.enqueue(tracks)
+        transfer.transfer()
+        assert not transfer.transferring
+        assert os.listdir(dest) == []
+    finally:
+        shutil.rmtree(dest)
+
+
+def test_startup_scans_are_incremental_on_request(monkeypatch):
+    coll = collection.Collection('startup')
+    thread = collection.CollectionScanThread(coll, startup_scan=True)
+    assert not thread.incremental
+
+    get_option = settings.get_option
+
+    def fake_get_option(option, default=None):
+        if option == 'collection/incremental_startup_scan':
+            return True
+        return get_option(option, default)
+
+    monkeypatch.setattr(settings, 'get_option', fake_get_option)
+    assert collection.CollectionScanThread(coll, startup_scan=True).incremental
+    assert not collection.CollectionScanThread(coll).incremental
+
+
+def test_transfer_queue_skips_duplicate_names(libdir):
+    dest = tempfile.mkdtemp()
+    try:
+        lib = collection.Library('file://' + dest)
+        tracks = [track.Track('file://%s/album%d/1.ogg' % (libdir, i),
+                              scan=False) for i in range(2)]
+        for i, tr in enumerate(tracks):
+            with open(tr.get_local_path(), 'w') as f:
+                f.write(str(i) * 10)
+
+        transfer = collection.TransferQueue(lib)
+        transfer.enqueue(tracks)
+        transfer.transfer()
+        assert os.listdir(dest) == ['1.ogg']
+        with open(os.path.join(dest, '1.ogg')) as f:
+            assert f.read() == '0' * 10
+    finally:
+        shutil.rmtree(dest)
+
+
+def test_tag_reader_pool_waits_only_down_to_limit():
+    class SlowTrack(object):
+        def __init__(self):
+            self.release = threading.Event()
+
+        def read_tags(self):
+            self.release.wait()
+
+    pool = collection._TagReaderPool(3)
+    try:
+        tracks = [SlowTrack() for i in range(3)]
+        for i, tr in enumerate(tracks):
+            pool.submit(i, tr)
+        assert list(pool.results()) == []
+
+        tracks[0].release.set()
+        assert list(pool.results(limit=2)) == [0]
+        assert len(pool) == 2
+
+        for tr in tracks:
+            tr.release.set()
+        assert list(pool.results(limit=0)) == [1, 2]
+    finally:
+        pool.close()
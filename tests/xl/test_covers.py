@@ -0,0 +1,170 @@
+import os
+import shutil
+import tempfile
+
+import pytest
+
+from xl import common
+from xl import covers
+from xl.trax import track
+
+
+@pytest.yield_fixture
+def albumdir():
+    d = tempfile.mkdtemp()
+    for name in ['01.ogg', '02.ogg', 'front.jpg', 'cover.png', 'notes.txt']:
+        open(os.path.join(d, name), 'w').close()
+    os.mkdir(os.path.join(d, 'scans.jpg'))
+    yield d
+    shutil.rmtree(d)
+
+
+def make_track(albumdir, name):
+    return track.Track('file://' + os.path.join(albumdir, name), scan=False)
+
+
+class TestLocalFileCoverFetcher(object):
+
+    def test_find_covers(self, albumdir):
+        fetcher = covers.LocalFileCoverFetcher()
+        fetcher.preferred_names = ['cover']
+        found = fetcher.find_covers(make_track(albumdir, '01.ogg'))
+        assert [os.path.basename(c) for c in found] == \
+            ['cover.png', 'front.jpg']
+
+        found = fetcher.find_covers(make_track(albumdir, '01.ogg'), limit=1)
+        assert [os.path.basename(c) for c in found] == ['cover.png']
+
+    def test_directory_listing_is_cached(self, albumdir):
+        fetcher = covers.LocalFileCoverFetcher()
+        tracks = [make_track(albumdir, '01.ogg'), make_track(albumdir, '02.ogg')]
+        mtime = 1000000000
+        os.utime(albumdir, (mtime, mtime))
+        first = fetcher.find_covers(tracks[0])
+
+        # the listing is reused while the directory looks unchanged
+        open(os.path.join(albumdir, 'back.jpg'), 'w').close()
+        os.utime(albumdir, (mtime, mtime))
+        assert fetcher.find_covers(tracks[1]) == first
+
+        os.utime(albumdir, (mtime + 10, mtime + 10))
+        found = fetcher.find_covers(tracks[1])
+        assert sorted(os.path.basename(c) for c in found) == \
+            ['back.jpg', 'cover.png', 'front.jpg']
+
+    def test_find_covers_for_tracks(self, albumdir):
+        fetcher = covers.LocalFileCoverFetcher()
+        tracks = [make_track(albumdir, '01.ogg'), make_track(albumdir, '02.ogg')]
+        found = fetcher.find_covers_for_tracks(tracks)
+        assert set(found) == set(tracks)
+        assert found[tracks[0]] == found[tracks[1]] == \
+            fetcher.find_covers(tracks[0])
+
+class TestCoverDB(object):
+
+    def test_save_and_reload(self, tmpdir):
+        path = str(tmpdir.join('covers.db'))
+        db = covers.CoverDB(path, 'covers')
+        key = ('album', (u'Album',))
+        db[key] = 'cache:abc'
+        db[('album', (u'Other',))] = 'cache:def'
+        assert db.get(key) == 'cache:abc'
+        db.save()
+
+        del db[('album', (u'Other',))]
+        db.close()
+
+        db = covers.CoverDB(path, 'covers')
+        assert db[key] == 'cache:abc'
+        assert ('album', (u'Other',)) not in db
+        assert db.pop(key) == 'cache:abc'
+        assert db.get(key, 'none') == 'none'
+
+    def test_equal_keys_share_an_entry(self, tmpdir):
+        path = str(tmpdir.join('covers.db'))
+        db = covers.CoverDB(path, 'covers')
+        db[('album', ('Album',))] = 'cache:abc'
+        db['x'] = 'cache:def'
+        db.save()
+        db.close()
+
+        db = covers.CoverDB(path, 'covers')
+        assert db[(u'album', (u'Album',))] == 'cache:abc'
+        assert db[u'x'] == 'cache:def'
+        db[u'x'] = 'cache:ghi'
+        assert db['x'] == 'cache:ghi'
+        db.close()
+
+
+def close_manager(man):
+    covers.providers.unregister('covers', man.tag_fetcher)
+    covers.providers.unregister('covers', man.localfile_fetcher)
+
+
+@pytest.yield_fixture
+def manager():
+    d = tempfile.mkdtemp()
+    man = covers.CoverManager(d)
+    yield man
+    close_manager(man)
+    shutil.rmtree(d)
+
+
+def make_album_track(n, album):
+    tr = track.Track('file:///covers/%d.ogg' % n, scan=False)
+    tr.set_tag_raw('artist', u'Artist')
+    tr.set_tag_raw('album', album)
+    return tr
+
+
+class TestCoverManager(object):
+
+    def test_misses(self, manager, monkeypatch):
+        tr = make_album_track(0, u'Album')
+        assert not manager.is_missing(tr)
+        manager._add_miss(tr)
+        assert manager.is_missing(tr)
+
+        manager.save()
+        loaded = covers.CoverManager(manager.location)
+        assert loaded.is_missing(tr)
+        close_manager(loaded)
+
+        expired = covers.time.time() + covers.MISS_EXPIRY + 1
+        monkeypatch.setattr(covers.time, 'time', lambda: expired)
+        assert not manager.is_missing(tr)
+
+    def test_import_pickle(self, tmpdir):
+        key = ('album', (u'Album',))
+        with open(str(tmpdir.join('covers.db')), 'wb') as f:
+            covers.pickle.dump({key: 'cache:abc'}, f, common.PICKLE_PROTOCOL)
+
+        man = covers.CoverManager(str(tmpdir))
+        close_manager(man)
+        assert man.db.get(key) == 'cache:abc'
+        assert tmpdir.join('covers.db-pickle.bak').check()
+        assert covers._is_sqlite_db(str(tmpdir.join('covers.db')))
+
+    def test_albums_without_cover(self, manager):
+        tracks = [make_album_track(i, album) for i, album in
+                  enumerate([u'A', u'A', u'B', u'C', u'D'])]
+        manager.db[manager._get_track_key(tracks[2])] = 'cache:b'
+        manager._add_miss(tracks[3])
+        albums = manager.get_albums_without_cover(tracks)
+        assert sorted(tr.get_tag_raw('album', join=True) for tr in albums) == \
+            [u'A', u'D']
+
+    def test_find_covers_in_bulk(self, manager, albumdir, monkeypatch):
+        tracks = [make_track(albumdir, '01.ogg'), make_track(albumdir, '02.ogg')]
+        found = manager.find_covers_in_bulk(tracks, limit=1)
+        assert found.keys() == ['localfile']
+        assert set(found['localfile']) == set(tracks)
+
+        def find_covers(track, limit=-1):
+            raise AssertionError('searched again')
+
+        monkeypatch.setattr(manager.localfile_fetcher, 'find_covers',
+                            find_covers)
+        covers_found = manager._find_covers(tracks[1], limit=1, found=found)
+        assert covers_found == \
+            ['localfile:%s' % c for c in found['localfile'][tracks[1]]]
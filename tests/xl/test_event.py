@@ -99,3 +99,106 @@ def test_thread_events():
     ncb.destroy()
 
     _finish_events()
+
+
+def test_callback_added_after_emit():
+    _init_events()
+    ncb = NormalCallback()
+    event.log_event('test', ncb, None)
+    assert ncb.called is True
+
+    # the dispatch cache must pick up callbacks added later
+    ncb2 = NormalCallback()
+    ncb.called = False
+    event.log_event('test', ncb, None)
+    assert ncb.called is True
+    assert ncb2.called is True
+
+    ncb.destroy()
+    ncb2.destroy()
+    ncb.called = ncb2.called = False
+    event.log_event('test', ncb, None)
+    assert ncb.called is False
+    assert ncb2.called is False
+
+    _finish_events()
+
+
+def test_batched_callback(monkeypatch):
+    _init_events()
+    timeouts = []
+    monkeypatch.setattr(GLib, 'timeout_add',
+            lambda delay, fn: timeouts.append(fn), raising=False)
+
+    batches = []
+
+    def on_batch(type, events, extra):
+        batches.append((type, events, extra))
+
+    event.add_batched_callback(on_batch, 'test', None, 100, 'extra')
+    event.log_event('test', 'a', 1)
+    event.log_event('test', 'b', 2)
+    event.log_event('other', 'c', 3)
+
+    # only one flush is scheduled for the pending events
+    assert len(timeouts) == 1
+    assert timeouts[0]() is False
+    assert batches == [('test', [('a', 1), ('b', 2)], 'extra')]
+
+    event.log_event('test', 'c', 3)
+    assert len(timeouts) == 2
+    timeouts[1]()
+    assert batches[1] == ('test', [('c', 3)], 'extra')
+
+    event.remove_callback(on_batch, 'test')
+    event.log_event('test', 'd', 4)
+    assert len(timeouts) == 2
+
+    _finish_events()
+
+
+def test_event_counts_and_times():
+    _init_events()
+    ncb = NormalCallback()
+
+    event.log_event('test', ncb, None)
+    assert event.EVENT_MANAGER.event_counts == {'test': 1}
+    assert event.EVENT_MANAGER.callback_times == {}
+
+    event.EVENT_MANAGER.measure_callbacks = True
+    event.log_event('test', ncb, None)
+    event.log_event('test', ncb, None)
+    assert event.EVENT_MANAGER.event_counts == {'test': 3}
+    calls, total, longest = event.EVENT_MANAGER.callback_times[
+            ('test', 'test_event.NormalCallback.on_cb')]
+    assert calls == 2
+    assert 0 <= longest <= total
+
+    ncb.destroy()
+    _finish_events()
+
+
+def test_slow_callback_warning(monkeypatch):
+    _init_events()
+    manager = event.EVENT_MANAGER
+    manager.measure_callbacks = True
+    manager.slow_callback_threshold = 0
+
+    warnings = []
+    monkeypatch.setattr(event.logger, 'warning',
+            lambda msg, *args: warnings.append(msg % args))
+
+    ncb = NormalCallback()
+    event.log_event('test', ncb, None)
+    assert len(warnings) == 1
+    assert 'test_event.NormalCallback.on_cb' in warnings[0]
+
+    stats = manager.format_stats()
+    assert 'test_event.NormalCallback.on_cb' in stats
+
+    manager.reset_stats()
+    assert manager.event_counts == {}
+    assert manager.callback_times == {}
+
+    ncb.destroy()
+    _finish_events()
@@ -0,0 +1,91 @@
+import gc
+import weakref
+
+import pytest
+
+from xl import formatter
+from xl.trax import track
+
+
+def make_track(title=u'Title'):
+    tr = track.Track('file:///formatter/foo.ogg', scan=False)
+    tr.set_tag_raw('title', title)
+    tr.set_tag_raw('artist', u'Artist')
+    tr.set_tag_raw('tracknumber', u'3/12')
+    return tr
+
+
+@pytest.mark.parametrize('template, expected', [
+    ('$title', u'Title'),
+    ('${title}', u'Title'),
+    ('$tracknumber - $title', u'3 - Title'),
+    ('${title:prefix=[, suffix=]}', u'[Title]'),
+    ('${album:prefix=[, suffix=]}|', u'|'),
+    ('${tracknumber:pad=3, padstring=0}', u'003'),
+    ('${title:prefix=\\,}', u',Title'),
+    ('$$title $title$title', u'$title TitleTitle'),
+    ('$ $', u'$ $'),
+    ('no identifiers', u'no identifiers'),
+])
+def test_format(template, expected):
+    tr = make_track()
+    assert formatter.TrackFormatter(template).format(tr) == expected
+
+
+def test_extract():
+    extractions = formatter.TrackFormatter(
+        '$title ${artist:compilate} ${album:prefix=\\=, pad=2}').extract()
+    assert extractions == {
+        'title': ('title', {}),
+        'artist:compilate': ('artist', {'compilate': True}),
+        'album:prefix=\\=, pad=2': ('album', {'prefix': '=', 'pad': '2'}),
+    }
+
+
+def test_format_change_recompiles():
+    tr = make_track()
+    f = formatter.TrackFormatter('$title')
+    assert f.format(tr) == u'Title'
+    f.props.format = '$artist'
+    assert f.format(tr) == u'Artist'
+
+
+def test_substitutions():
+    f = formatter.Formatter('${a:prefix=<, arg=x} $b ${b:pad=3, padstring=-}')
+    f._substitutions = {'a': lambda arg=None: arg, 'b': 'B'}
+    assert f.format() == '<x B --B'
+
+
+def test_cache_follows_tag_changes():
+    tr = make_track()
+    f = formatter.TrackFormatter('$title', cache_size=10)
+    assert f.format(tr) == u'Title'
+    assert len(f._cache) == 1
+
+    tr.set_tag_raw('title', u'Changed')
+    assert f.format(tr) == u'Changed'
+
+    f.props.format = '$artist'
+    assert f.format(tr) == u'Artist'
+
+
+def test_cache_skips_volatile_providers():
+    tr = make_track()
+    f = formatter.TrackFormatter('$title $__last_played', cache_size=10)
+    f.format(tr)
+    assert len(f._cache) == 0
+
+
+
+def test_cache_does_not_keep_tracks_alive():
+    tr = make_track()
+    f = formatter.TrackFormatter('$title', cache_size=10)
+    f.format(tr)
+    f.format(tr, markup_escape=True)
+    assert len(f._cache) == 1
+
+    ref = weakref.ref(tr)
+    del tr
+    gc.collect()
+    assert ref() is None
+    assert len(f._cache) == 0
@@ -0,0 +1,104 @@
+import threading
+
+import pytest
+
+from xl import lyrics
+from xl import providers
+from xl.trax import track
+
+
+class FakeLyricSearch(lyrics.LyricSearchMethod):
+
+    def __init__(self, name, result=None, event=None):
+        self.name = name
+        self.display_name = name
+        self.result = result
+        self.event = event
+        self.calls = 0
+
+    def find_lyrics(self, track):
+        self.calls += 1
+        if self.event is not None:
+            self.event.wait()
+        if self.result is None:
+            raise lyrics.LyricsNotFoundException()
+        return (self.result, self.name, '')
+
+
+@pytest.yield_fixture
+def manager(tmpdir, monkeypatch):
+    man = lyrics.MANAGER
+    monkeypatch.setattr(man, 'cache',
+            lyrics.LyricsCache(str(tmpdir.join('lyrics.cache'))))
+    monkeypatch.setattr(man, 'preferred_order', [])
+    methods = []
+
+    def add(*args, **kwargs):
+        method = FakeLyricSearch(*args, **kwargs)
+        providers.register('lyrics', method)
+        methods.append(method)
+        return method
+
+    yield man, add
+    for method in methods:
+        providers.unregister('lyrics', method)
+    man.cache.flush()
+
+
+def make_track():
+    tr = track.Track('file:///lyrics/nothere.ogg', scan=False)
+    tr.set_tag_raw('artist', u'Artist')
+    tr.set_tag_raw('title', u'Title')
+    return tr
+
+
+def test_cache_batches_writes(tmpdir):
+    cache = lyrics.LyricsCache(str(tmpdir.join('cache')), flush_delay=60)
+    cache['a'] = 1
+    cache['b'] = 2
+    del cache['b']
+    assert cache['a'] == 1
+    assert 'b' not in cache
+    assert cache.keys() == ['a']
+    assert 'a' not in cache.db
+
+    cache.flush()
+    assert cache.db['a'] == 1
+    assert 'b' not in cache.db
+
+
+def test_find_lyrics_preferred_order(manager):
+    man, add = manager
+    add('first', None)
+    add('second', u'second lyrics')
+    add('third', u'third lyrics')
+    man.preferred_order = ['third', 'first', 'second']
+
+    assert man.find_lyrics(make_track()) == \
+        (u'third lyrics', 'third', '')
+    found = man.find_all_lyrics(make_track())
+    assert [f[0] for f in found] == ['third', 'second']
+
+
+def test_find_lyrics_cached(manager):
+    man, add = manager
+    method = add('only', u'lyrics')
+    tr = make_track()
+    assert man.find_lyrics(tr)[0] == u'lyrics'
+    assert man.find_lyrics(tr)[0] == u'lyrics'
+    assert method.calls == 1
+
+
+def test_slow_provider_times_out(manager, monkeypatch):
+    man, add = manager
+    event = threading.Event()
+    add('slow', u'slow lyrics', event)
+    add('fast', u'fast lyrics')
+    man.preferred_order = ['slow', 'fast']
+    monkeypatch.setattr(lyrics.settings, 'get_option',
+            lambda name, default=None: 0.2 if name == 'lyrics/timeout'
+                else default)
+
+    found = man.find_all_lyrics(make_track())
+    assert [f[0] for f in found] == ['fast']
+    event.set()
@@ -0,0 +1,81 @@
+import time
+
+import pytest
+
+from xl import event, plugins, settings
+
+
+PLUGIN = '''
+def enable(exaile):
+    exaile.enabled.append(__name__)
+
+def disable(exaile):
+    exaile.enabled.remove(__name__)
+'''
+
+
+class FakeExaile(object):
+    loading = True
+
+    def __init__(self):
+        self.enabled = []
+
+
+@pytest.fixture
+def manager(tmpdir, monkeypatch):
+    for name, info in [('fastplugin', ''), ('lazyplugin', 'Lazy=True\n')]:
+        d = tmpdir.mkdir(name)
+        d.join('__init__.py').write(PLUGIN)
+        d.join('PLUGININFO').write("Name=_('%s')\n%s" % (name, info))
+
+    get_option = settings.get_option
+
+    def fake_get_option(option, default=None):
+        if option == 'plugins/enabled':
+            return ['lazyplugin', 'fastplugin']
+        return get_option(option, default)
+
+    monkeypatch.setattr(settings, 'get_option', fake_get_option)
+
+    # there is no main loop to run idle callbacks in the tests
+    def idle_add(func, *args):
+        func(*args)
+        return 0
+
+    monkeypatch.setattr(plugins.GLib, 'idle_add', idle_add)
+    man = plugins.PluginsManager(FakeExaile(), load=False)
+    man.plugindirs = [str(tmpdir)]
+    return man
+
+
+def test_lazy_plugins_are_enabled_after_loading(manager):
+    assert manager.is_lazy('lazyplugin')
+    assert not manager.is_lazy('fastplugin')
+
+    manager.preload_enabled()
+    assert manager.loaded_plugins.keys() == ['fastplugin']
+    manager.load_enabled()
+    assert manager.exaile.enabled == ['fastplugin']
+    assert manager.deferred_plugins == ['lazyplugin']
+    assert 'fastplugin' in manager.load_times
+    assert 'fastplugin' in manager.enable_times
+
+    manager.exaile.loading = False
+    event.log_event('exaile_loaded', manager.exaile, None)
+    timeout = time.time() + 5
+    while 'lazyplugin' not in manager.enabled_plugins and \
+            time.time() < timeout:
+        time.sleep(0.01)
+    assert sorted(manager.exaile.enabled) == ['fastplugin', 'lazyplugin']
+    assert manager.deferred_plugins == []
+
+
+def test_disable_deferred_plugin(manager):
+    manager.load_enabled()
+    assert manager.disable_plugin('lazyplugin')
+    assert manager.deferred_plugins == []
+    assert 'lazyplugin' not in manager.loaded_plugins
+
+    # enabling it explicitly does not wait for Exaile to load
+    manager.enable_plugin('lazyplugin')
+    assert 'lazyplugin' in manager.exaile.enabled
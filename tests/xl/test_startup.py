@@ -0,0 +1,62 @@
+import threading
+
+import pytest
+
+from xl import startup
+
+
+def test_phases_run_after_requirements():
+    runner = startup.PhaseRunner()
+    order = []
+    threads = {}
+    lock = threading.Lock()
+
+    def phase(name):
+        def func():
+            with lock:
+                order.append(name)
+                threads[name] = threading.current_thread()
+        return func
+
+    runner.add('a', phase('a'))
+    runner.add('b', phase('b'))
+    runner.add('main', phase('main'), main_thread=True)
+    runner.add('c', phase('c'), requires=['a', 'b'])
+    runner.add('gui', phase('gui'), requires=['c', 'main'], main_thread=True)
+    runner.run()
+
+    assert sorted(order) == ['a', 'b', 'c', 'gui', 'main']
+    assert order.index('c') > max(order.index('a'), order.index('b'))
+    assert order[-1] == 'gui'
+    assert threads['main'] is threads['gui'] is threading.current_thread()
+    assert threads['a'] is not threading.current_thread()
+    assert all(p.duration is not None for p in runner.phases)
+    assert 'gui' in runner.report()
+
+
+def test_phases_overlap():
+    runner = startup.PhaseRunner()
+    started = threading.Event()
+    runner.add('worker', lambda: started.wait(5))
+    runner.add('main', started.set, main_thread=True)
+    runner.run()
+    assert started.is_set()
+    assert runner.duration < 5
+
+
+def test_phase_errors_are_raised():
+    runner = startup.PhaseRunner()
+
+    def fail():
+        raise KeyError('broken')
+
+    runner.add('fail', fail)
+    runner.add('after', lambda: None, requires=['fail'], main_thread=True)
+    with pytest.raises(KeyError):
+        runner.run()
+
+
+def test_unknown_requirement():
+    runner = startup.PhaseRunner()
+    with pytest.raises(ValueError):
+        runner.add('a', lambda: None, requires=['b'])
@@ -0,0 +1,54 @@
+import os
+
+from xl import transcoder
+
+
+def touch(path, mtime):
+    d = os.path.dirname(path)
+    if not os.path.isdir(d):
+        os.makedirs(d)
+    open(path, 'w').close()
+    os.utime(path, (mtime, mtime))
+
+
+def test_quote():
+    assert transcoder._quote('/a "b"\\c') == '"/a \\"b\\"\\\\c"'
+
+
+def test_is_up_to_date(tmpdir):
+    source = str(tmpdir.join('a.flac'))
+    dest = str(tmpdir.join('a.ogg'))
+    touch(source, 2000)
+    assert not transcoder.is_up_to_date(source, dest)
+    touch(dest, 1000)
+    assert not transcoder.is_up_to_date(source, dest)
+    touch(dest, 3000)
+    assert transcoder.is_up_to_date(source, dest)
+
+
+def test_get_jobs(tmpdir):
+    source = str(tmpdir.join('in'))
+    dest = str(tmpdir.join('out'))
+    for name in ['b/02.flac', 'b/01.FLAC', 'a.mp3', 'cover.jpg']:
+        touch(os.path.join(source, name), 1000)
+    jobs = transcoder.get_jobs(source, dest, 'Ogg Vorbis')
+    assert [(os.path.relpath(s, source), os.path.relpath(d, dest))
+            for s, d in jobs] == [
+        ('a.mp3', 'a.ogg'),
+        ('b/01.FLAC', 'b/01.ogg'),
+        ('b/02.flac', 'b/02.ogg'),
+    ]
+
+
+def test_queue_skips_up_to_date(tmpdir):
+    source = str(tmpdir.join('a.flac'))
+    dest = str(tmpdir.join('out', 'a.ogg'))
+    touch(source, 1000)
+    touch(dest, 2000)
+    queue = transcoder.TranscodeQueue([(source, dest)], 'Ogg Vorbis')
+    done = []
+    queue.connect('done', lambda thread: done.append(True))
+    queue.run()
+    assert done
+    assert queue.skipped == [(source, dest)]
+    assert not queue.transcoded and not queue.failed
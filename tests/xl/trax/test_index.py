@@ -0,0 +1,121 @@
+import pytest
+
+from xl.trax import index
+from xl.trax import search
+from xl.trax import track
+from xl.trax import trackdb
+
+
+def make_db():
+    tdb = trackdb.TrackDB('test')
+    tracks = []
+    for i, (artist, album, rating) in enumerate([
+            (u'The Beatles', u'Abbey Road', 80),
+            (u'The Beatles', u'Help!', None),
+            (u'Beat Happening', u'Jamboree', 40),
+            (u'Bj\xf6rk', u'Post', 100),
+            (None, u'Unknown', 20)]):
+        tr = track.Track('file:///index/%d.ogg' % i, scan=False)
+        if artist is not None:
+            tr.set_tag_raw('artist', artist)
+        tr.set_tag_raw('album', album)
+        tr.set_tag_raw('__length', 100 * (i + 1))
+        if rating is not None:
+            tr.set_tag_raw('__rating', rating)
+        tracks.append(tr)
+    tdb.add_tracks(tracks)
+    return tdb, tracks
+
+
+QUERIES = [
+    'artist==Beatles',
+    'artist=="The Beatles"',
+    'artist=beat',
+    'artist==__null__',
+    '__rating>50',
+    '__rating<50',
+    '__rating==40',
+    '__length>250',
+    '__length<250',
+    'beat',
+    'beat ! album=help',
+    'artist=beat | album=post',
+    '( album=road | album=post ) __rating>50',
+    'artist~^The',
+    'bjork',
+]
+
+
+@pytest.mark.parametrize('query', QUERIES)
+def test_index_matches_linear_search(query):
+    tdb, tracks = make_db()
+    keyword_tags = ['artist', 'album']
+
+    def find(trackiter, **kwargs):
+        return set(r.track for r in search.search_tracks_from_string(
+            trackiter, query, case_sensitive=False,
+            keyword_tags=keyword_tags, **kwargs))
+
+    expected = find(list(tracks))
+    assert find(tdb) == expected
+    assert find(list(tracks), index=tdb.tag_index) == expected
+
+
+@pytest.mark.parametrize('query', ['genre==__null__', '! genre==__null__',
+                                   'genre=rock', '! genre=rock'])
+def test_index_matches_linear_search_for_empty_lists(query, monkeypatch):
+    tdb, tracks = make_db()
+    tracks[0].set_tag_raw('genre', u'Rock')
+    get_tag_search = track.Track.get_tag_search
+
+    def fake_get_tag_search(self, tag, *args, **kwargs):
+        if self is tracks[1] and tag == 'genre':
+            return []
+        return get_tag_search(self, tag, *args, **kwargs)
+
+    monkeypatch.setattr(track.Track, 'get_tag_search', fake_get_tag_search)
+    matcher = search.TracksMatcher(query, case_sensitive=False)
+    expected = set(tr for tr in tracks
+                   if matcher._match_uncompiled(search.SearchResultTrack(tr)))
+    assert (tracks[1] in expected) == query.startswith('!')
+
+    found = set(r.track for r in search.search_tracks(
+        list(tracks), [matcher], index=tdb.tag_index))
+    assert found == expected
+    assert set(r.track for r in search.search_tracks(list(tracks),
+                                                     [matcher])) == expected
+
+
+def test_index_follows_tag_changes():
+    tdb, tracks = make_db()
+    matcher = search.TracksMatcher('artist==Blur')
+    assert not list(search.search_tracks(tdb, [matcher]))
+
+    tracks[0].set_tag_raw('artist', u'Blur')
+    found = [r.track for r in search.search_tracks(tdb, [matcher])]
+    assert found == [tracks[0]]
+
+    tdb.remove(tracks[0])
+    assert not list(search.search_tracks(tdb, [matcher]))
+
+
+def test_index_derived_tags():
+    tdb, tracks = make_db()
+    assert tdb.tag_index.match_values('albumartist',
+            lambda v: v == u'Post') == set()
+    tracks[2].set_tag_raw('artist', u'Post')
+    assert tdb.tag_index.match_values('albumartist',
+            lambda v: v == u'Post') == set([tracks[2]])
+
+
+def test_match_range():
+    idx = index.TrackIndex()
+    tracks = [track.Track('file:///range/%d.ogg' % i, scan=False)
+              for i in range(5)]
+    for i, tr in enumerate(tracks):
+        tr.set_tag_raw('__playcount', i)
+    idx.add_tracks(tracks)
+
+    assert idx.match_range('__playcount', low=2) == set(tracks[3:])
+    assert idx.match_range('__playcount', high=2) == set(tracks[:2])
+    assert idx.match_range('__playcount', 0.5, 3.5) == set(tracks[1:4])
@@ -448,3 +448,57 @@ class TestSearchTracks(object):
         assert gen.next().track == tracks[2]
         with pytest.raises(StopIteration):
             gen.next()
+
+class TestCompiledMatcher(object):
+
+    QUERIES = [
+        'foo',
+        'foo bar',
+        '! foo',
+        'foo | bar',
+        '( foo | bar ) album=baz',
+        'artist==foo album=baz',
+        'artist==__null__',
+        'artist~^fo',
+        '__rating>50 foo',
+        '__rating<50 ! bar',
+    ]
+
+    def setup(self):
+        values = [(u'foo', u'baz', 60), (u'Foo Bar', u'quux', 20),
+                  (None, u'bazaar', None), (u'bar', u'foo', 80)]
+        self.tracks = []
+        for i, (artist, album, rating) in enumerate(values):
+            tr = track.Track('file:///compiled/%d' % i)
+            tr.set_tag_raw('artist', artist)
+            tr.set_tag_raw('album', album)
+            tr.set_tag_raw('__rating', rating)
+            self.tracks.append(tr)
+
+    @pytest.mark.parametrize('query', QUERIES)
+    @pytest.mark.parametrize('case_sensitive', [True, False])
+    def test_same_as_uncompiled(self, query, case_sensitive):
+        matcher = search.TracksMatcher(query, case_sensitive=case_sensitive,
+                keyword_tags=['artist', 'album'])
+        for tr in self.tracks:
+            compiled = search.SearchResultTrack(tr)
+            uncompiled = search.SearchResultTrack(tr)
+            result = matcher.match(compiled)
+            assert result == matcher._match_uncompiled(uncompiled)
+            if result:
+                assert sorted(compiled.on_tags) == sorted(uncompiled.on_tags)
+
+    def test_cheap_conditions_first(self):
+        matcher = search.TracksMatcher('! foo artist~bar album=baz '
+                'artist==foo', keyword_tags=['artist'])
+        ordered = sorted(matcher.matchers, key=search._estimate_cost)
+        assert [type(m) for m in ordered] == [search._ExactMatcher,
+                search._InMatcher, search._RegexMatcher,
+                search._NotMetaMatcher]
+
+    def test_append_matcher_recompiles(self):
+        matcher = search.TracksMatcher('foo', keyword_tags=['artist'])
+        srtr = search.SearchResultTrack(self.tracks[0])
+        assert matcher.match(srtr)
+        matcher.append_matcher(search.TracksNotInList([self.tracks[0]]))
+        assert not matcher.match(srtr)
@@ -121,6 +121,27 @@ class TestTrack(object):
             '__loc': u'uri'})
         assert tr1 is tr2
 
+    def test_compact_tags(self):
+        tags = {'artist': [u'Shared Artist'], 'genre': [u'Rock', u'Pop'],
+                '__playcount': u'3', '__length': [u'201.5'],
+                '__loc': u'file:///compact/1.ogg'}
+        tr1 = track.Track(_unpickles=tags)
+        tags = dict(tags, __loc=u'file:///compact/2.ogg',
+                    artist=[u'Shared ' + u'Artist'])
+        tr2 = track.Track(_unpickles=tags)
+
+        assert tr1.get_tag_raw('artist') == [u'Shared Artist']
+        assert tr1.get_tag_raw('artist')[0] is tr2.get_tag_raw('artist')[0]
+        assert tr1.get_tag_raw('genre') == [u'Rock', u'Pop']
+        assert tr1.get_tag_raw('__playcount') == 3
+        assert tr1.get_tag_raw('__length') == 201.5
+
+        # callers get lists of their own
+        tr1.get_tag_raw('genre').append(u'Jazz')
+        assert tr1.get_tag_raw('genre') == [u'Rock', u'Pop']
+        assert tr1._pickles()['genre'] == [u'Rock', u'Pop']
+        assert tr1._pickles()['artist'] == [u'Shared Artist']
+
     def test_takes_nonurl(self, test_track):
         tr = track.Track(test_track.filename)
 
@@ -398,6 +419,34 @@ class TestTrack(object):
         tr.set_tag_raw('coverart', u'foobar')
         assert tr.get_tag_sort('coverart') == ret
 
+    def test_get_sort_tag_cache_tag_changed(self):
+        tr = track.Track('/foo')
+        tr.set_tag_raw('artist', u'foo')
+        assert tr.get_tag_sort('artist') == u'foo foo foo foo'
+        tr.set_tag_raw('artist', u'bar')
+        assert tr.get_tag_sort('artist') == u'bar bar bar bar'
+        # albumartist is derived from artist
+        assert tr.get_tag_sort('albumartist') == u'bar bar bar bar'
+        tr.set_tag_raw('albumartistsort', u'baz')
+        assert tr.get_tag_sort('albumartist') == u'baz baz baz baz'
+
+    def test_get_sort_tag_cache_cuts_changed(self):
+        tr = track.Track('/foo')
+        tr.set_tag_raw('artist', u'the foo')
+        assert tr.get_tag_sort('artist').startswith(u'foo ')
+        settings.set_option('collection/strip_list', [])
+        track.Track._the_cuts_cb(None, None, 'collection/strip_list')
+        assert tr.get_tag_sort('artist').startswith(u'the foo ')
+
+    def test_get_sort_key(self):
+        tr = track.Track('/foo')
+        tr.set_tag_raw('artist', u'foo')
+        tr.set_tag_raw('discnumber', u'2/3')
+        fields = ('artist', 'discnumber')
+        assert tr.get_sort_key(fields) == (u'foo foo foo foo', 2)
+        tr.set_tag_raw('discnumber', u'1/3')
+        assert tr.get_sort_key(fields) == (u'foo foo foo foo', 1)
+
     ## Display Tags
     def test_get_display_tag_loc(self):
         tr = track.Track('/foo')
@@ -0,0 +1,117 @@
+import os
+import shelve
+import shutil
+import sqlite3
+import tempfile
+
+import pytest
+
+from xl.trax import trackdb
+from xl.trax import track
+
+
+@pytest.yield_fixture
+def dbdir():
+    d = tempfile.mkdtemp()
+    yield d
+    shutil.rmtree(d)
+
+
+def make_tracks(n):
+    tracks = []
+    for i in range(n):
+        tr = track.Track('file:///foo/%d.mp3' % i, scan=False)
+        tr.set_tag_raw('title', u'Title %d' % i)
+        tracks.append(tr)
+    return tracks
+
+
+def stored_keys(location):
+    db = sqlite3.connect(location)
+    try:
+        return sorted(k for (k,) in db.execute('SELECT key FROM tracks'))
+    finally:
+        db.close()
+
+
+class TestTrackDBStore(object):
+
+    def test_save_and_load(self, dbdir):
+        loc = os.path.join(dbdir, 'music.db')
+        tdb = trackdb.TrackDB('test', location=loc)
+        tdb.add_tracks(make_tracks(3))
+        tdb.save_to_location()
+
+        assert stored_keys(loc) == [0, 1, 2]
+
+        tdb2 = trackdb.TrackDB('test', location=loc)
+        assert len(tdb2) == 3
+        assert tdb2._key == 3
+        tr = tdb2.get_track_by_loc('file:///foo/1.mp3')
+        assert tr.get_tag_raw('title') == [u'Title 1']
+
+    def test_removed_tracks_are_deleted(self, dbdir):
+        loc = os.path.join(dbdir, 'music.db')
+        tdb = trackdb.TrackDB('test', location=loc)
+        tracks = make_tracks(3)
+        tdb.add_tracks(tracks)
+        tdb.save_to_location()
+
+        tdb.remove(tracks[1])
+        tdb.save_to_location()
+
+        assert stored_keys(loc) == [0, 2]
+        assert tdb._deleted_keys == []
+
+    def test_only_dirty_tracks_are_written(self, dbdir):
+        loc = os.path.join(dbdir, 'music.db')
+        tdb = trackdb.TrackDB('test', location=loc)
+        tracks = make_tracks(2)
+        tdb.add_tracks(tracks)
+        tdb.save_to_location()
+
+        assert not tracks[0]._dirty
+        tracks[0].set_tag_raw('title', u'Changed')
+        tdb.save_to_location()
+
+        assert not tracks[0]._dirty
+        tdb2 = trackdb.TrackDB('test', location=loc)
+        assert tdb2.get_track_by_loc('file:///foo/0.mp3') \
+                .get_tag_raw('title') == [u'Changed']
+
+    def test_convert_shelve_db(self, dbdir):
+        loc = os.path.join(dbdir, 'music.db')
+        pdata = shelve.open(loc, flag='c', protocol=2)
+        for i in range(2):
+            pdata['tracks-%d' % i] = (
+                {'__loc': 'file:///bar/%d.mp3' % i, 'title': [u'Old %d' % i]},
+                i, {})
+        pdata['_key'] = 2
+        pdata['_dbversion'] = 2.0
+        pdata.close()
+
+        tdb = trackdb.TrackDB('test', location=loc)
+
+        assert len(tdb) == 2
+        assert tdb._key == 2
+        assert not trackdb._is_shelve_db(loc)
+        assert stored_keys(loc) == [0, 1]
+        assert any(f.startswith('music.db') and f.endswith('-shelve.bak')
+                   for f in os.listdir(dbdir))
+
+
+def test_index_follows_own_tracks_until_closed(monkeypatch):
+    tdb = trackdb.TrackDB('test')
+    tracks = make_tracks(2)
+    tdb.add_tracks(tracks[:1])
+    updated = []
+    monkeypatch.setattr(tdb.tag_index, 'update_track',
+                        lambda tr, tag: updated.append(tr))
+
+    tracks[0].set_tag_raw('title', u'Changed')
+    tracks[1].set_tag_raw('title', u'Changed')
+    assert updated == [tracks[0]]
+
+    tdb.close()
+    tracks[0].set_tag_raw('title', u'Closed')
+    assert updated == [tracks[0]]
@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+#
+# Copyright (C) 2008-2010 Adam Olsen
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2, or (at your option)
+# any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+#
+
+#
+# Measures the throughput of the DAAP server plugin. Starts a server on
+# localhost sharing a few synthetic files, then downloads them from
+# several concurrent clients, each using a single keep-alive connection
+# and mixing whole file and range requests.
+#
+# Run from the source directory:
+#
+#   EXAILE_DIR=. PYTHONPATH=.:plugins/daapserver python tools/bench_daap.py -c 8
+#
+
+from __future__ import print_function
+
+import argparse
+import httplib
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+
+import server
+import spydaap.server
+
+
+class Item(object):
+
+    def __init__(self, id, path):
+        self.id = id
+        self.path = path
+
+    def get_original_filename(self):
+        return self.path
+
+
+class Items(object):
+
+    def __init__(self, paths):
+        self.items = [Item(i + 1, p) for i, p in enumerate(paths)]
+
+    def get_item_by_id(self, id):
+        return self.items[int(id) - 1]
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+
+def make_files(directory, count, size):
+    rand = random.Random(0)
+    block = ''.join(chr(rand.randint(0, 255)) for i in xrange(64 * 1024))
+    paths = []
+    for i in range(count):
+        path = os.path.join(directory, '%d.mp3' % i)
+        with open(path, 'wb') as f:
+            for j in range(size // len(block)):
+                f.write(block)
+        paths.append(path)
+    return paths
+
+
+def client(port, files, requests, size, results):
+    rand = random.Random()
+    conn = httplib.HTTPConnection('127.0.0.1', port)
+    received = 0
+    for i in range(requests):
+        headers = {}
+        if i % 4 == 3:
+            start = rand.randint(0, size - 1)
+            headers['Range'] = 'bytes=%d-' % start
+        conn.request('GET', '/databases/1/items/%d.mp3'
+                % rand.randint(1, files), headers=headers)
+        response = conn.getresponse()
+        received += len(response.read())
+    conn.close()
+    results.append(received)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-c', '--clients', type=int, default=8,
+            help='number of concurrent clients')
+    parser.add_argument('-r', '--requests', type=int, default=20,
+            help='requests per client')
+    parser.add_argument('-f', '--files', type=int, default=4,
+            help='number of shared files')
+    parser.add_argument('-s', '--size', type=int, default=8,
+            help='file size in MiB')
+    args = parser.parse_args()
+
+    size = args.size * 1024 * 1024
+    directory = tempfile.mkdtemp()
+    try:
+        paths = make_files(directory, args.files, size)
+        handler = spydaap.server.makeDAAPHandlerClass('bench', [],
+                Items(paths), [])
+        handler.log_message = lambda *args: None
+        httpd = server.MyThreadedHTTPServer(('127.0.0.1', 0), handler)
+        port = httpd.server_address[1]
+        serve = threading.Thread(target=httpd.serve_forever)
+        serve.daemon = True
+        serve.start()
+
+        results = []
+        clients = [threading.Thread(target=client, args=(port, args.files,
+                args.requests, size, results)) for i in range(args.clients)]
+        start = time.time()
+        for t in clients:
+            t.start()
+        for t in clients:
+            t.join()
+        elapsed = time.time() - start
+        httpd.force_stop()
+
+        total = sum(results)
+        print('%d clients, %d requests: %.0f MiB in %.2f s, %.1f MiB/s, '
+              '%.1f requests/s' % (args.clients,
+                  args.clients * args.requests, total / 1048576.0, elapsed,
+                  total / 1048576.0 / elapsed,
+                  args.clients * args.requests / elapsed))
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
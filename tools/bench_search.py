@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+#
+# Copyright (C) 2008-2010 Adam Olsen
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2, or (at your option)
+# any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+#
+
+#
+# Micro-benchmark for xl.trax.search. Matches the queries used in
+# tests/xl/trax/test_search.py (plus a few typical collection panel
+# queries) against synthetic tracks, comparing the compiled query plan,
+# the plain per-condition matching and an indexed TrackDB search.
+#
+# Run from the source directory:
+#
+#   EXAILE_DIR=. PYTHONPATH=. python tools/bench_search.py -n 100000
+#
+
+from __future__ import print_function
+
+import argparse
+import random
+import time
+
+from xl.trax import search, track, trackdb
+
+
+QUERIES = [
+    # from tests/xl/trax/test_search.py
+    'artist=foo',
+    'artist==foo',
+    '! foo',
+    'foo | bar',
+    '( foo | bar )',
+    'foo',
+    'artist=FoO',
+    'artist==__null__',
+    'motley crue',
+    u'm\xf6tley cr\xfce',
+    u'\u4e2d',
+    '2',
+    # typical collection panel queries
+    'beat happy',
+    'artist=="Artist 42" album=="Album 7"',
+    '__rating>60 genre=rock',
+    'artist~^Artist 4',
+]
+
+KEYWORD_TAGS = ['artist', 'albumartist', 'album', 'title', 'genre', 'bpm']
+
+WORDS = [u'foo', u'bar', u'baz', u'beat', u'happy', u'rock', u'motley',
+         u'crue', u'm\xf6tley', u'cr\xfce', u'\u4e2d', u'the', u'love']
+
+
+def make_tracks(count):
+    rand = random.Random(0)
+    tracks = []
+    for i in xrange(count):
+        tr = track.Track('file:///bench/%d/%d.ogg' % (i // 100, i), scan=False)
+        tr.set_tag_raw('artist', u'Artist %d %s' % (i % 997,
+            rand.choice(WORDS)), notify_changed=False)
+        tr.set_tag_raw('album', u'Album %d' % (i % 13), notify_changed=False)
+        tr.set_tag_raw('title', u' '.join(rand.sample(WORDS, 3)),
+                notify_changed=False)
+        tr.set_tag_raw('genre', rand.choice([u'rock', u'pop', u'jazz']),
+                notify_changed=False)
+        tr.set_tag_raw('bpm', unicode(rand.randint(60, 180)),
+                notify_changed=False)
+        tr.set_tag_raw('__rating', rand.choice([0, 20, 40, 60, 80, 100]),
+                notify_changed=False)
+        tracks.append(tr)
+    return tracks
+
+
+def bench(label, func, repeat):
+    best = None
+    for i in range(repeat):
+        start = time.time()
+        result = func()
+        elapsed = time.time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    print('  %-12s %8.1f ms  (%d results)' % (label, best * 1000, result))
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('-n', '--tracks', type=int, default=100000,
+            help='number of synthetic tracks')
+    parser.add_argument('-r', '--repeat', type=int, default=3,
+            help='runs per query, the best one is reported')
+    args = parser.parse_args()
+
+    print('Creating %d tracks...' % args.tracks)
+    tracks = make_tracks(args.tracks)
+    srtracks = [search.SearchResultTrack(tr) for tr in tracks]
+    tdb = trackdb.TrackDB('bench')
+    tdb.add_tracks(tracks)
+
+    totals = [0, 0, 0]
+    for query in QUERIES:
+        print(repr(query))
+        matcher = search.TracksMatcher(query, case_sensitive=False,
+                keyword_tags=KEYWORD_TAGS)
+
+        def plain():
+            return sum(1 for sr in srtracks if matcher._match_uncompiled(sr))
+
+        def compiled():
+            return sum(1 for sr in srtracks if matcher.match(sr))
+
+        def indexed():
+            # the first run also builds the index for the queried tags
+            return sum(1 for sr in search.search_tracks(tdb, [matcher]))
+
+        totals[0] += bench('plain', plain, args.repeat)
+        totals[1] += bench('compiled', compiled, args.repeat)
+        totals[2] += bench('indexed', indexed, args.repeat)
+
+    print()
+    print('Total: plain %.0f ms, compiled %.0f ms (%.1fx), indexed %.0f ms '
+          '(%.1fx)' % (totals[0] * 1000, totals[1] * 1000,
+              totals[0] / totals[1], totals[2] * 1000,
+              totals[0] / totals[2]))
+
+
+if __name__ == '__main__':
+    main()
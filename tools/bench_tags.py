@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+#
+# Copyright (C) 2008-2010 Adam Olsen
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2, or (at your option)
+# any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+#
+
+
+#
+# Measures the memory taken by Track objects. Builds the pickled tag
+# dicts of a synthetic collection, the way xl.trax.TrackDB stores them,
+# and reports the resident set size before and after turning them into
+# Track objects.
+#
+# Run from the source directory:
+#
+#   EXAILE_DIR=. PYTHONPATH=. python tools/bench_tags.py -n 250000
+#
+
+from __future__ import print_function
+
+import argparse
+import cPickle as pickle
+import gc
+import random
+import resource
+import time
+
+from xl.trax import track
+
+
+GENRES = [u'Rock', u'Pop', u'Jazz', u'Classical', u'Electronic', u'Folk',
+          u'Hip-Hop', u'Metal', u'Blues', u'Soundtrack']
+
+
+def get_rss():
+    """
+        Returns the resident set size of this process in MiB
+    """
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024.0
+    except IOError:
+        pass
+    # peak usage, in KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def make_pickles(count):
+    """
+        Returns the pickled tags of count tracks, spread over albums of
+        12 tracks and artists of 4 albums
+    """
+    rand = random.Random(0)
+    now = time.time()
+    pickles = []
+    for i in xrange(count):
+        album = i // 12
+        artist = album // 4
+        basedir = u'/music/Artist %d/Album %d' % (artist, album)
+        tags = {
+            '__loc': u'file://%s/%02d.flac' % (basedir, i % 12 + 1),
+            '__basedir': basedir,
+            '__length': rand.uniform(60, 600),
+            '__modified': now - rand.randint(0, 10 ** 8),
+            '__date_added': now - rand.randint(0, 10 ** 8),
+            '__playcount': rand.randint(1, 50),
+            '__rating': rand.choice([20, 40, 60, 80, 100]),
+            '__bitrate': 900000 + rand.randint(0, 200000),
+            'title': [u'Title %d' % i],
+            'artist': [u'Artist %d' % artist],
+            'albumartist': [u'Artist %d' % artist],
+            'album': [u'Album %d' % album],
+            'genre': [GENRES[artist % len(GENRES)]],
+            'date': [unicode(1960 + artist % 60)],
+            'tracknumber': [u'%d/12' % (i % 12 + 1)],
+            'discnumber': [u'1/1'],
+        }
+        pickles.append(pickle.dumps(tags, pickle.HIGHEST_PROTOCOL))
+    return pickles
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('-n', '--tracks', type=int, default=250000,
+            help='number of synthetic tracks')
+    args = parser.parse_args()
+
+    print('Creating %d pickled tracks...' % args.tracks)
+    pickles = make_pickles(args.tracks)
+    gc.collect()
+    before = get_rss()
+
+    start = time.time()
+    tracks = [track.Track(_unpickles=pickle.loads(p)) for p in pickles]
+    elapsed = time.time() - start
+    gc.collect()
+    after = get_rss()
+
+    print('Loaded %d tracks in %.1f s' % (len(tracks), elapsed))
+    print('RSS before loading: %7.1f MiB' % before)
+    print('RSS after loading:  %7.1f MiB' % after)
+    print('Tracks take:        %7.1f MiB (%.0f bytes per track)' % (
+        after - before, (after - before) * 1024 * 1024 / len(tracks)))
+
+
+if __name__ == '__main__':
+    main()
@@ -24,10 +24,13 @@
 from __future__ import print_function
 
 import copy
+import cPickle
 import datetime
 import os.path
 import pprint
 import shelve
+import sqlite3
+import whichdb
 
 import click
 
@@ -36,6 +39,24 @@ exaile_db = os.path.join(os.path.expanduser('~'), '.local', 'share', 'exaile',
                          'music.db')
 
 
+def open_db(db):
+    '''
+        Returns the contents of the DB as a dict, in the layout of the
+        old shelve based format
+    '''
+    if whichdb.whichdb(db):
+        return shelve.open(db, flag='r', protocol=2)
+
+    conn = sqlite3.connect(db)
+    data = {}
+    for k, v in conn.execute('SELECT key, data FROM tracks'):
+        data['tracks-%s' % k] = cPickle.loads(str(v))
+    for k, v in conn.execute('SELECT name, data FROM meta'):
+        data[k] = cPickle.loads(str(v))
+    conn.close()
+    return data
+
+
 def tracks(data):
     for k, v in data.iteritems():
         if not k.startswith('tracks-'):
@@ -50,7 +71,7 @@ def cli(ctx, db):
     '''
         Tool that allows low-level exploration of an Exaile music database
     '''
-    ctx.obj = shelve.open(db, flag='r', protocol=2)
+    ctx.obj = open_db(db)
 
 
 @cli.command()
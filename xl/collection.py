@@ -41,6 +41,7 @@ from gi.repository import Gio
 import logging
 import os
 import os.path
+import Queue
 import shutil
 import threading
 import time
@@ -51,6 +52,7 @@ from xl import (
     event,
     metadata,
     settings,
+    transcoder,
     trax,
     xdg
 )
@@ -72,22 +74,167 @@ def get_collection_by_loc(loc):
             return c
     return None
 
+# number of new tracks a library scan adds to the collection at once
+ADD_BATCH_SIZE = 500
+
+# file attributes needed by a library scan
+SCAN_ATTRIBUTES = ("standard::type,standard::is-symlink,standard::name,"
+        "standard::symlink-target,standard::size,time::modified")
+
+def _get_mtime(info):
+    """
+        Returns the modification time of a :class:`Gio.FileInfo` the way
+        it is stored in the __modified tag
+    """
+    mtime = info.get_modification_time()
+    return mtime.tv_sec + (mtime.tv_usec/100000.0)
+
+def _dir_prefix(uri):
+    """
+        Returns the prefix shared by the locations inside a directory
+    """
+    if uri.endswith('/'):
+        return uri
+    return uri + '/'
+
+def _get_size_and_mtime(gfile):
+    """
+        Returns the size and the (seconds, microseconds) modification
+        time of a :class:`Gio.File`
+
+        :raises GLib.GError: if the file cannot be queried
+    """
+    info = gfile.query_info("standard::size,time::modified,"
+            "time::modified-usec", Gio.FileQueryInfoFlags.NONE, None)
+    return info.get_size(), (info.get_attribute_uint64('time::modified'),
+            info.get_attribute_uint32('time::modified-usec'))
+
+class _TrackScan(object):
+    """
+        A track found by a library scan
+    """
+    __slots__ = ['track', 'mtime', 'size', 'read', 'new']
+
+    def __init__(self, track, mtime, size, read, new):
+        self.track = track
+        self.mtime = mtime
+        self.size = size
+        #: whether the tags have to be read from the file
+        self.read = read
+        #: whether the track is not yet part of the collection
+        self.new = new
+
+class _TagReaderPool(object):
+    """
+        Reads the tags of tracks in a pool of worker threads
+
+        Items are handed back by :meth:`results` in the order they were
+        submitted, once the tags of their track have been read. Tag
+        reading mostly waits for file I/O, which releases the GIL, so
+        threads are enough to keep several reads in flight.
+    """
+    def __init__(self, size):
+        self.size = max(0, size)
+        self._jobs = Queue.Queue()
+        self._pending = deque()
+        self._threads = []
+        for i in range(self.size):
+            thread = threading.Thread(target=self._run,
+                    name='TagReader-%d' % i)
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+
+    def __len__(self):
+        return len(self._pending)
+
+    def _run(self):
+        while True:
+            job = self._jobs.get()
+            if job is None:
+                return
+            track, done = job
+            try:
+                track.read_tags()
+            finally:
+                done.set()
+
+    def submit(self, item, track=None):
+        """
+            Queues an item
+
+            :param item: the item to hand back from :meth:`results`
+            :param track: a track whose tags are read before that
+        """
+        done = None
+        if track is not None:
+            if self.size:
+                done = threading.Event()
+                self._jobs.put((track, done))
+            else:
+                track.read_tags()
+        self._pending.append((item, done))
+
+    def results(self, limit=None):
+        """
+            Yields the finished items in submission order, stopping at
+            the first unfinished one
+
+            :param limit: while more than this many items are queued,
+                wait for unfinished ones instead of stopping, 0 to wait
+                for all of them
+        """
+        while self._pending:
+            item, done = self._pending[0]
+            if done is not None and not done.is_set():
+                if limit is None or len(self._pending) <= limit:
+                    return
+                done.wait()
+            self._pending.popleft()
+            yield item
+
+    def close(self):
+        """
+            Drops all unfinished items and stops the workers
+        """
+        self._pending.clear()
+        try:
+            while True:
+                self._jobs.get_nowait()
+        except Queue.Empty:
+            pass
+        for thread in self._threads:
+            self._jobs.put(None)
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
 class CollectionScanThread(common.ProgressThread):
     """
         Scans the collection
     """
-    def __init__(self, collection, startup_scan=False, force_update=False):
+    def __init__(self, collection, startup_scan=False, force_update=False,
+            incremental=None):
         """
             Initializes the thread
 
             :param collection: the collection to scan
             :param startup_scan: Only scan libraries scanned at startup
             :param force_update: Update files regardless whether they've changed
+            :param incremental: Skip directories that did not change since
+                the last scan. This misses tag changes which do not touch
+                the directory, so by default only startup scans do it, and
+                only if the collection/incremental_startup_scan option
+                is set
         """
         common.ProgressThread.__init__(self)
         
         self.startup_scan = startup_scan
         self.force_update = force_update
+        if incremental is None:
+            incremental = startup_scan and settings.get_option(
+                'collection/incremental_startup_scan', False)
+        self.incremental = incremental
         self.collection = collection
 
     def stop(self):
@@ -105,7 +252,8 @@ class CollectionScanThread(common.ProgressThread):
             'scan_progress_update')
 
         self.collection.rescan_libraries(startup_only=self.startup_scan,
-                                         force_update=self.force_update)
+                                         force_update=self.force_update,
+                                         incremental=self.incremental)
 
         event.remove_callback(self.on_scan_progress_update,
             'scan_progress_update')
@@ -147,7 +295,9 @@ class Collection(trax.TrackDB):
         self._running_total_count = 0
         self._frozen = False
         self._libraries_dirty = False
-        pickle_attrs += ['_serial_libraries']
+        # directory uri -> (mtime, subdirectory uris) as of the last scan
+        self._directories = {}
+        pickle_attrs += ['_serial_libraries', '_directories']
         trax.TrackDB.__init__(self, name, location=location,
                 pickle_attrs=pickle_attrs)
         COLLECTIONS.add(self)
@@ -240,9 +390,15 @@ class Collection(trax.TrackDB):
         """
         return self.libraries.values()
 
-    def rescan_libraries(self, startup_only=False, force_update=False):
+    def rescan_libraries(self, startup_only=False, force_update=False,
+            incremental=False):
         """
             Rescans all libraries associated with this Collection
+
+            :param startup_only: Only scan libraries scanned at startup
+            :param force_update: Update files regardless whether they've changed
+            :param incremental: Skip directories that did not change since
+                the last scan, see :meth:`Library.rescan`
         """
         if self._scanning:
             raise Exception("Collection is already being scanned")
@@ -266,7 +422,8 @@ class Collection(trax.TrackDB):
             
             event.add_callback(self._progress_update, 'tracks_scanned',
                 library)
-            library.rescan(notify_interval=scan_interval, force_update=force_update)
+            library.rescan(notify_interval=scan_interval,
+                    force_update=force_update, incremental=incremental)
             event.remove_callback(self._progress_update, 'tracks_scanned',
                 library)
             self._running_total_count += self._running_count
@@ -350,7 +507,7 @@ class Collection(trax.TrackDB):
             close the collection. does any work like saving to disk,
             closing network connections, etc.
         """
-        #TODO: make close() part of trackdb
+        trax.TrackDB.close(self)
         COLLECTIONS.remove(self)
 
     def delete_tracks(self, tracks):
@@ -709,33 +866,189 @@ class Library(object):
 
             returns: the Track object, None if it could not be updated
         """
+        scan = self._prepare_track(gloc, force_update=force_update)
+        if scan is None:
+            return None
+        if scan.read:
+            scan.track.read_tags()
+        added = []
+        tr = self._finish_track(scan, added)
+        if added:
+            self.collection.add_tracks(added)
+        return tr
+
+    def _prepare_track(self, gloc, info=None, force_update=False):
+        """
+            Finds the track at a given location and decides whether its
+            tags have to be read
+
+            :param info: the :class:`Gio.FileInfo` of the file with at
+                least the size and modification time, queried if None
+            :returns: a :class:`_TrackScan`, None for invalid locations
+        """
         uri = gloc.get_uri()
         if not uri: # we get segfaults if this check is removed
             return None
-        mtime = gloc.query_info("time::modified", Gio.FileQueryInfoFlags.NONE, None).get_modification_time()
-        mtime = mtime.tv_sec + (mtime.tv_usec/100000.0)
+        if info is None:
+            info = gloc.query_info("standard::size,time::modified",
+                    Gio.FileQueryInfoFlags.NONE, None)
+        mtime = _get_mtime(info)
+        size = info.get_size()
         tr = self.collection.get_track_by_loc(uri)
         if tr:
-            if force_update or tr.get_tag_raw('__modified') < mtime:
-                tr.read_tags()
-                tr.set_tag_raw('__modified', mtime)
-        else:
-            tr = trax.Track(uri)
-            if tr._scan_valid == True:
-                tr.set_tag_raw('__date_added', time.time())
-                self.collection.add(tr)
-                tr.set_tag_raw('__modified', mtime)
-
-            # Track already existed. This fixes trax.get_tracks_from_uri
-            # on windows, unknown why fix isnt needed on linux.
-            elif not tr._init:
-                self.collection.add(tr)
+            read = force_update or tr.get_tag_raw('__modified') < mtime
+            if not read:
+                oldsize = tr.get_tag_raw('__filesize')
+                read = oldsize is not None and oldsize != size
+            return _TrackScan(tr, mtime, size, read, False)
+        tr = trax.Track(uri, scan=False)
+        # tracks that already existed outside the collection keep their tags
+        return _TrackScan(tr, mtime, size, tr._init, True)
+
+    def _finish_track(self, scan, added):
+        """
+            Updates a track after its tags were read
+
+            :param scan: the :class:`_TrackScan` returned by _prepare_track
+            :param added: list new tracks for the collection are appended to
+            :returns: the Track object
+        """
+        tr = scan.track
+        if not scan.new:
+            if scan.read:
+                tr.set_tag_raw('__modified', scan.mtime)
+                tr.set_tag_raw('__filesize', scan.size)
+        elif tr._scan_valid == True:
+            tr.set_tag_raw('__date_added', time.time())
+            tr.set_tag_raw('__modified', scan.mtime)
+            tr.set_tag_raw('__filesize', scan.size)
+            added.append(tr)
+
+        # Track already existed. This fixes trax.get_tracks_from_uri
+        # on windows, unknown why fix isnt needed on linux.
+        elif not scan.read:
+            added.append(tr)
         return tr
 
-    def rescan(self, notify_interval=None, force_update=False):
+    def _walk(self, libloc, directories, incremental=False):
+        """
+            Walks through the library like :func:`common.walk`, but keeps
+            the attributes gathered while enumerating the directories so
+            that files do not need to be queried again
+
+            :param directories: dictionary the modification time and the
+                subdirectories of each walked directory are stored in
+            :param incremental: do not enumerate directories whose
+                modification time did not change since the last scan,
+                only walk their known subdirectories. Files modified in
+                place do not change the modification time of their
+                directory, so this misses tag edits.
+            :returns: a generator of (file, file type, file info) tuples.
+                The info is None for directories that were skipped.
+        """
+        known = self.collection._directories
+        try:
+            info = libloc.query_info(SCAN_ATTRIBUTES,
+                    Gio.FileQueryInfoFlags.NONE, None)
+        except GLib.Error:
+            logger.exception("Unable to scan library %s", libloc.get_uri())
+            return
+        queue = deque([(libloc, info)])
+
+        while queue:
+            dir, info = queue.pop()
+            uri = dir.get_uri()
+            mtime = _get_mtime(info)
+            record = known.get(uri)
+            if incremental and record is not None and record[0] == mtime:
+                directories[uri] = record
+                yield dir, Gio.FileType.DIRECTORY, None
+                for suburi in record[1]:
+                    subdir = Gio.File.new_for_uri(suburi)
+                    try:
+                        queue.append((subdir, subdir.query_info(
+                            SCAN_ATTRIBUTES, Gio.FileQueryInfoFlags.NONE,
+                            None)))
+                    except GLib.Error:
+                        logger.debug("Directory %s vanished", suburi)
+                continue
+
+            yield dir, Gio.FileType.DIRECTORY, info
+            subdirs = []
+            try:
+                for fileinfo in dir.enumerate_children(SCAN_ATTRIBUTES,
+                        Gio.FileQueryInfoFlags.NONE, None):
+                    fil = dir.get_child(fileinfo.get_name())
+                    # FIXME: recursive symlinks could cause an infinite loop
+                    if fileinfo.get_is_symlink():
+                        target = fileinfo.get_symlink_target()
+                        if not "://" in target and not os.path.isabs(target):
+                            fil2 = dir.get_child(target)
+                        else:
+                            fil2 = Gio.File.new_for_uri(target)
+                        # already in the collection, we'll get it anyway
+                        if fil2.has_prefix(libloc):
+                            continue
+                    type = fileinfo.get_file_type()
+                    if type == Gio.FileType.DIRECTORY:
+                        queue.append((fil, fileinfo))
+                        subdirs.append(fil.get_uri())
+                    elif type == Gio.FileType.REGULAR:
+                        yield fil, type, fileinfo
+            except GLib.Error: # why doesnt gio offer more-specific errors?
+                logger.exception("Unhandled exception while walking on %s.", dir)
+                continue
+            directories[uri] = (mtime, subdirs)
+
+    def _scan_files(self, libloc, directories, force_update=False,
+            incremental=False):
+        """
+            Walks the library, reading tags of new and modified tracks in
+            a pool of worker threads while the walk goes on
+
+            The number of workers is set by the ``collection/scan_workers``
+            option, 0 reads all tags in the calling thread.
+
+            :param directories: see :meth:`_walk`
+            :param incremental: see :meth:`_walk`
+            :returns: a generator of (file, file type, file info,
+                :class:`_TrackScan`) tuples in the order :meth:`_walk`
+                found the files; the scan is None for anything but
+                regular files
+        """
+        pool = _TagReaderPool(settings.get_option('collection/scan_workers', 4))
+        # how far the walk may run ahead of the tag reading
+        backlog = max(64, pool.size * 16)
+        try:
+            for fil, type, info in self._walk(libloc, directories,
+                    incremental):
+                scan = None
+                if type == Gio.FileType.REGULAR:
+                    scan = self._prepare_track(fil, info, force_update)
+                    if scan is None:
+                        continue
+                pool.submit((fil, type, info, scan),
+                        scan.track if scan and scan.read else None)
+                for result in pool.results(limit=backlog):
+                    yield result
+            for result in pool.results(limit=0):
+                yield result
+        finally:
+            pool.close()
+
+    def rescan(self, notify_interval=None, force_update=False,
+            incremental=False):
         """
             Rescan the associated folder and add the contained files
             to the Collection
+
+            Only files whose size or modification time changed are read
+            again, unless force_update is set.
+
+            :param incremental: skip directories whose modification time
+                did not change since the last scan. This is much faster
+                for large libraries, but only notices added, removed and
+                renamed files, not files modified in place.
         """
         # TODO: use gio's cancellable support
         
@@ -754,10 +1067,20 @@ class Library(object):
         dirtracks = deque()
         compilations = deque()
         ccheck = {}
-        for fil in common.walk(libloc):
+        added = []
+        directories = {}
+        # locations of the files found and directories walked or skipped
+        seen = set()
+        walked = []
+        unchanged = set()
+        for fil, type, info, scan in self._scan_files(libloc, directories,
+                force_update=force_update, incremental=incremental):
             count += 1
-            type = fil.query_info("standard::type", Gio.FileQueryInfoFlags.NONE, None).get_file_type()
             if type == Gio.FileType.DIRECTORY:
+                if info is None:
+                    unchanged.add(fil.get_uri())
+                else:
+                    walked.append(fil.get_uri())
                 if dirtracks:
                     for tr in dirtracks:
                         self._check_compilation(ccheck, compilations, tr)
@@ -776,9 +1099,8 @@ class Library(object):
                 compilations = deque()
                 ccheck = {}
             elif type == Gio.FileType.REGULAR:
-                tr = self.update_track(fil, force_update=force_update)
-                if not tr:
-                    continue
+                tr = self._finish_track(scan, added)
+                seen.add(tr.get_loc_for_io())
 
                 if dirtracks is not None:
                     dirtracks.append(tr)
@@ -796,43 +1118,89 @@ class Library(object):
                         dirtracks = None
 
             if self.collection and self.collection._scan_stopped:
+                if added:
+                    self.collection.add_tracks(added)
                 self.scanning = False
                 logger.info("Scan canceled")
                 return
 
+            # add new tracks in batches, so that listeners of
+            # tracks_added don't have to handle every single file
+            if len(added) >= ADD_BATCH_SIZE:
+                self.collection.add_tracks(added)
+                added = []
+
             # progress update
             if notify_interval is not None and count % notify_interval == 0:
                 event.log_event('tracks_scanned', self, count)
 
+        if added:
+            self.collection.add_tracks(added)
+
+        # only remember the directories once all their files are in the
+        # collection, otherwise a canceled scan could skip them next time
+        self._update_directories(libloc, directories)
+
         # final progress update
         if notify_interval is not None:
             event.log_event('tracks_scanned', self, count)
 
+        # directories that could not be enumerated keep their tracks
+        failed = [uri for uri in walked if uri not in directories]
+        if libloc.get_uri() in directories:
+            removals = self._find_removals(libloc, seen, unchanged, failed)
+            if removals:
+                logger.debug("Removing %d vanished tracks", len(removals))
+                self.collection.remove_tracks(removals)
+        else:
+            logger.warning("Unable to read library %s, not removing any "
+                    "tracks", self.location)
 
+        logger.info("Scan completed: %s", self.location)
+        self.scanning = False
 
-        removals = deque()
-        for tr in self.collection.tracks.itervalues():
-            tr = tr._track
-            loc = tr.get_loc_for_io()
-            if not loc:
-                continue
-            gloc = Gio.File.new_for_uri(loc)
+    def _find_removals(self, libloc, seen, unchanged, failed):
+        """
+            Finds the tracks of this library that vanished since the
+            last scan, without touching the file system
+
+            :param seen: locations of the files found by the scan
+            :param unchanged: directories skipped by an incremental scan,
+                their files are assumed to still exist
+            :param failed: directories that could not be enumerated,
+                nothing below them is removed
+            :returns: a list of :class:`xl.trax.Track`
+        """
+        prefix = _dir_prefix(libloc.get_uri())
+        failed = tuple(_dir_prefix(uri) for uri in failed)
+        removals = []
+        for loc, holder in self.collection.tracks.iteritems():
             try:
-                if not gloc.has_prefix(libloc):
+                if not loc.startswith(prefix) or loc in seen:
+                    continue
+                if loc.rsplit('/', 1)[0] in unchanged:
+                    continue
+                if failed and loc.startswith(failed):
                     continue
             except UnicodeDecodeError:
                 logger.exception("Error decoding file location")
                 continue
+            removals.append(holder._track)
+        return removals
 
-            if not gloc.query_exists(None):
-                removals.append(tr)
-
-        for tr in removals:
-            logger.debug(u"Removing %s"%unicode(tr))
-            self.collection.remove(tr)
-            
-        logger.info("Scan completed: %s", self.location)
-        self.scanning = False
+    def _update_directories(self, libloc, directories):
+        """
+            Replaces the directories recorded for this library
+        """
+        known = self.collection._directories
+        prefix = _dir_prefix(libloc.get_uri())
+        old = {}
+        for uri in known.keys():
+            if uri == libloc.get_uri() or uri.startswith(prefix):
+                old[uri] = known.pop(uri)
+        known.update(directories)
+        if old != directories:
+            self.collection._dirty = True
 
     def add(self, loc, move=False):
         """
@@ -893,13 +1261,47 @@ class Library(object):
 
 
 class TransferQueue(object):
+    """
+        Copies tracks into a library, typically the one of a portable
+        device.
+
+        Several files are copied at once, and files already present in
+        the library with the same size and modification time are
+        skipped. Other existing files are never overwritten. If a
+        transcoding format is given, tracks in other formats are
+        converted to it on the way.
+
+        Progress is reported by size through the track_transfer_progress
+        event, whose data is the percentage done. While transferring,
+        :attr:`rate` holds the throughput in bytes per second and
+        :attr:`eta` the estimated remaining seconds, or None.
+    """
 
-    def __init__(self, library):
+    def __init__(self, library, workers=3, transcode_format=None,
+            transcode_quality=None):
+        """
+            :param library: the :class:`Library` to transfer to
+            :param workers: how many files to copy at once
+            :param transcode_format: a key of
+                :data:`xl.transcoder.FORMATS` to convert tracks to, or
+                None to copy them as they are
+            :param transcode_quality: the quality to transcode with,
+                None for the format's default
+        """
         self.library = library
         self.queue = []
-        self.current_pos = -1
         self.transferring = False
+        self.workers = workers
+        self.transcode_format = transcode_format
+        self.transcode_quality = transcode_quality
+        self.bytes_total = 0
+        self.bytes_done = 0
+        self.rate = 0.0
+        self.eta = None
         self._stop = False
+        self._lock = threading.Lock()
+        self._cancellables = set()
+        self._transcoders = set()
 
     def enqueue(self, tracks):
         self.queue.extend(tracks)
@@ -923,31 +1325,218 @@ class TransferQueue(object):
             This is NOT asynchronous
         """
         self.transferring = True
-        self.current_pos += 1
+        self._stop = False
+        threads = []
         try:
-            while self.current_pos  < len(self.queue) and not self._stop:
-                track = self.queue[self.current_pos]
-                loc = track.get_loc_for_io()
-                self.library.add(loc)
-
-                # TODO: make this be based on filesize not count
-                progress = self.current_pos * 100 / len(self.queue)
-                event.log_event('track_transfer_progress', self, progress)
-
-                self.current_pos += 1
+            jobs, present = self.__get_jobs()
+            for loc in present:
+                self.__add_to_collection(loc)
+
+            self.bytes_total = sum(job[2] for job in jobs)
+            self.bytes_done = 0
+            self.rate = 0.0
+            self.eta = None
+            start = time.time()
+
+            pending = Queue.Queue()
+            for job in jobs:
+                pending.put(job)
+            results = Queue.Queue()
+            for i in xrange(min(self.workers, len(jobs))):
+                thread = threading.Thread(target=self.__work,
+                        args=(pending, results),
+                        name='TransferQueue worker %d' % i)
+                thread.daemon = True
+                thread.start()
+                threads.append(thread)
+
+            remaining = len(jobs)
+            while remaining and not self._stop:
+                # wake up now and then to report progress
+                try:
+                    loc = results.get(timeout=0.5)
+                except Queue.Empty:
+                    pass
+                else:
+                    remaining -= 1
+                    if loc is not None:
+                        self.__add_to_collection(loc)
+                self.__update_progress(start)
         finally:
+            self.cancel()
+            for thread in threads:
+                thread.join()
             self.queue = []
             self.transferring = False
-            self.current_pos = -1
             self._stop = False
+            self.rate = 0.0
+            self.eta = None
             event.log_event('track_transfer_progress', self, 100)
 
     def cancel(self):
         """
             Cancel the current transfer
         """
-        # TODO: make this stop mid-file as well?
         self._stop = True
+        with self._lock:
+            for cancellable in self._cancellables:
+                cancellable.cancel()
+            for tc in self._transcoders:
+                tc.cancel()
+
+    def __get_jobs(self):
+        """
+            Returns the (source, dest, size, transcode) files to transfer
+            and the locations of the tracks already in the library.
+
+            Files are never overwritten: tracks whose destination exists
+            without being a copy of them, or is taken by an earlier
+            track of the queue, are skipped.
+        """
+        libdir = Gio.File.new_for_uri(self.library.location)
+        extension = None
+        if self.transcode_format is not None:
+            extension = transcoder.FORMATS[self.transcode_format]['extension']
+        jobs = []
+        present = []
+        # lowercase, as devices often use case insensitive file systems
+        taken = set()
+        for track in self.queue:
+            src = Gio.File.new_for_uri(track.get_loc_for_io())
+            basename = src.get_basename()
+            root, ext = os.path.splitext(basename)
+            # the transcoder only reads and writes local files
+            transcode = extension is not None and \
+                ext[1:].lower() != extension and \
+                src.get_path() is not None and libdir.get_path() is not None
+            if transcode:
+                basename = '%s.%s' % (root, extension)
+            dest = libdir.resolve_relative_path(basename)
+            key = dest.get_uri().lower()
+            if key in taken:
+                logger.warning("Cannot transfer %s: another track is "
+                        "transferred to %s", src.get_uri(), dest.get_uri())
+                continue
+            taken.add(key)
+            try:
+                size, mtime = _get_size_and_mtime(src)
+            except GLib.GError as e:
+                logger.warning("Cannot transfer %s: %s", src.get_uri(), e)
+                continue
+            try:
+                dest_size, dest_mtime = _get_size_and_mtime(dest)
+            except GLib.GError:
+                pass
+            else:
+                # outputs of the transcoder differ in size, but are
+                # written after their source
+                if (transcode and dest_mtime >= mtime) or \
+                        (dest_size, dest_mtime) == (size, mtime):
+                    present.append(dest.get_uri())
+                else:
+                    logger.warning("Cannot transfer %s: %s already exists",
+                            src.get_uri(), dest.get_uri())
+                continue
+            jobs.append((src, dest, size, transcode))
+        return jobs, present
+
+    def __work(self, pending, results):
+        while not self._stop:
+            try:
+                job = pending.get_nowait()
+            except Queue.Empty:
+                return
+            try:
+                result = self.__transfer_file(*job)
+            except Exception:
+                # every job must yield a result or transfer() never ends
+                logger.exception("Could not transfer %s", job[0].get_uri())
+                result = None
+            results.put(result)
+
+    def __transfer_file(self, src, dest, size, transcode):
+        """
+            Copies or transcodes one file, returning the location of the
+            result or None on failure
+        """
+        copied = [0]
+
+        def on_progress(current, total, *args):
+            with self._lock:
+                self.bytes_done += current - copied[0]
+            copied[0] = current
+
+        # copies are written next to their destination and then moved
+        # into place, so that failures only ever delete our own files
+        root, ext = os.path.splitext(dest.get_basename())
+        partial = dest.get_parent().get_child('.%s.part%s' % (root, ext))
+        cancellable = Gio.Cancellable()
+        with self._lock:
+            self._cancellables.add(cancellable)
+        try:
+            if transcode:
+                self.__transcode(src, dest)
+            else:
+                # keeping the modification time lets the next transfer
+                # recognize the file
+                src.copy(partial, Gio.FileCopyFlags.OVERWRITE |
+                        Gio.FileCopyFlags.ALL_METADATA, cancellable,
+                        on_progress, None)
+                partial.move(dest, Gio.FileCopyFlags.ALL_METADATA,
+                        cancellable, None, None)
+            return dest.get_uri()
+        except (GLib.GError, transcoder.TranscodeError, IOError,
+                OSError) as e:
+            if not self._stop:
+                logger.warning("Could not transfer %s: %s",
+                        src.get_uri(), e)
+            if not transcode:
+                try:
+                    partial.delete(None)
+                except GLib.GError:
+                    pass
+            return None
+        finally:
+            with self._lock:
+                self._cancellables.discard(cancellable)
+                self.bytes_done += size - copied[0]
+
+    def __transcode(self, src, dest):
+        tc = transcoder.Transcoder(self.transcode_format,
+                self.transcode_quality)
+        with self._lock:
+            if self._stop:
+                raise transcoder.TranscodeError(_('Cancelled'))
+            self._transcoders.add(tc)
+        try:
+            if not tc.transcode_file(src.get_path(), dest.get_path(),
+                    overwrite=False):
+                raise transcoder.TranscodeError(_('Cancelled'))
+        finally:
+            with self._lock:
+                self._transcoders.discard(tc)
+
+    def __add_to_collection(self, loc):
+        if self.library.collection is None or \
+                self.library.collection.loc_is_member(loc):
+            return
+        tr = trax.Track(loc)
+        if tr._scan_valid:
+            self.library.collection.add(tr)
+
+    def __update_progress(self, start):
+        with self._lock:
+            done = self.bytes_done
+        elapsed = time.time() - start
+        if elapsed > 0 and done:
+            self.rate = done / elapsed
+            self.eta = (self.bytes_total - done) / self.rate
+        if self.bytes_total:
+            # 100 is only sent once everything is done
+            progress = min(done * 100 // self.bytes_total, 99)
+        else:
+            progress = 0
+        event.log_event('track_transfer_progress', self, progress)
 
 
 # vim: et sts=4 sw=4
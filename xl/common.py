@@ -647,7 +647,8 @@ class ProgressThread(GObject.GObject, threading.Thread):
         A basic thread with progress updates. The thread should emit
         the progress-update signal periodically. The contents must
         be number between 0 and 100, or a tuple of (n, total) where
-        n is the current step.
+        n is the current step. The optional progress-text signal
+        carries a short status text shown next to the progress.
     """
     __gsignals__ = {
         'progress-update': (
@@ -655,6 +656,11 @@ class ProgressThread(GObject.GObject, threading.Thread):
             None,
             (GObject.TYPE_PYOBJECT,)
         ),
+        'progress-text': (
+            GObject.SignalFlags.RUN_FIRST,
+            None,
+            (GObject.TYPE_PYOBJECT,)
+        ),
         # TODO: Check if 'stopped' is required
         'done': (
             GObject.SignalFlags.RUN_FIRST,
@@ -29,11 +29,17 @@ Provides the base for obtaining and storing covers, also known
 as album art.
 """
 
+from gi.repository import GdkPixbuf
 from gi.repository import GLib
 from gi.repository import Gio
 import logging
 import hashlib
+import json
 import os
+import Queue
+import sqlite3
+import threading
+import time
 try:
     import cPickle as pickle
 except ImportError:
@@ -51,6 +57,13 @@ from xl import (
 
 logger = logging.getLogger(__name__)
 
+# Number of scaled covers kept in memory by CoverManager.get_cover_pixbuf
+SIZED_CACHE_SIZE = 128
+# Number of directories whose cover candidates LocalFileCoverFetcher keeps
+DIRECTORY_CACHE_SIZE = 1000
+# Seconds for which albums without cover are only searched locally
+MISS_EXPIRY = 7 * 24 * 60 * 60
+
 
 # TODO: maybe this could go into common.py instead? could be
 # useful in other areas.
@@ -115,6 +128,175 @@ class Cacher(object):
         return None
 
 
+def _pixbuf_from_data(data, size):
+    """
+        Decodes image data into a pixbuf fitting into size, keeping
+        the ratio and never upscaling. Returns None on failure.
+    """
+    def on_size_prepared(loader, width, height):
+        scale = min(size[0] / float(width), size[1] / float(height))
+
+        if scale < 1.0:
+            loader.set_size(max(1, int(width * scale)),
+                max(1, int(height * scale)))
+
+    loader = GdkPixbuf.PixbufLoader()
+    loader.connect('size-prepared', on_size_prepared)
+
+    try:
+        loader.write(data)
+        loader.close()
+    except GLib.GError:
+        return None
+
+    return loader.get_pixbuf()
+
+
+def _is_sqlite_db(path):
+    """
+        Returns whether path holds an SQLite database
+    """
+    try:
+        with open(path, 'rb') as f:
+            return f.read(16) == 'SQLite format 3\x00'
+    except IOError:
+        return False
+
+
+def _normalize_key(key):
+    """
+        Turns byte strings into unicode and tuples into lists
+    """
+    if isinstance(key, str):
+        return key.decode('utf-8', 'replace')
+    if isinstance(key, (tuple, list)):
+        return [_normalize_key(k) for k in key]
+    return key
+
+
+class CoverDB(object):
+    """
+        Dictionary-like mapping stored in a table of an SQLite database.
+
+        Entries are read from the database when they are first looked
+        up, and changes are kept in memory until :meth:`save` writes
+        them in one transaction. Saving therefore only costs as much as
+        the number of entries changed since the last save.
+
+        Keys must be built from strings, numbers and tuples. They are
+        stored as JSON, with byte strings decoded as UTF-8 and tuples
+        as lists, so keys which compare equal are stored the same way.
+    """
+    _deleted = object()
+
+    def __init__(self, path, table):
+        """
+            :param path: the database file, created if needed
+            :param table: the table holding the entries
+        """
+        self.table = table
+        self._lock = threading.Lock()
+        # encoded key -> value, None for keys not in the database
+        self._cache = {}
+        # encoded key -> value or _deleted, not yet saved
+        self._pending = {}
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('CREATE TABLE IF NOT EXISTS %s '
+                '(key TEXT PRIMARY KEY, value NOT NULL)' % table)
+        self._conn.commit()
+
+    @staticmethod
+    def _encode(key):
+        return json.dumps(_normalize_key(key), separators=(',', ':'))
+
+    def _lookup(self, key):
+        key = self._encode(key)
+        with self._lock:
+            try:
+                return self._cache[key]
+            except KeyError:
+                pass
+            row = self._conn.execute('SELECT value FROM %s WHERE key = ?'
+                    % self.table, (key,)).fetchone()
+            value = self._cache[key] = row[0] if row else None
+            return value
+
+    def get(self, key, default=None):
+        value = self._lookup(key)
+        if value is None:
+            return default
+        return value
+
+    def __getitem__(self, key):
+        value = self._lookup(key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key):
+        return self._lookup(key) is not None
+
+    def __setitem__(self, key, value):
+        if value is None:
+            raise ValueError("None can not be stored")
+        key = self._encode(key)
+        with self._lock:
+            self._cache[key] = self._pending[key] = value
+
+    def __delitem__(self, key):
+        if self.pop(key, None) is None:
+            raise KeyError(key)
+
+    def pop(self, key, default=None):
+        value = self._lookup(key)
+        if value is None:
+            return default
+        key = self._encode(key)
+        with self._lock:
+            self._cache[key] = None
+            self._pending[key] = self._deleted
+        return value
+
+    def update(self, items):
+        """
+            Sets many entries at once
+
+            :param items: a dict or an iterable of (key, value) pairs
+        """
+        if isinstance(items, dict):
+            items = items.iteritems()
+        for key, value in items:
+            self[key] = value
+
+    def save(self):
+        """
+            Writes all pending changes to the database
+        """
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            if not pending:
+                return
+            try:
+                with self._conn:
+                    self._conn.executemany('DELETE FROM %s WHERE key = ?'
+                            % self.table, ((key,) for key, value in
+                                pending.iteritems() if value is self._deleted))
+                    self._conn.executemany('INSERT OR REPLACE INTO %s '
+                            '(key, value) VALUES (?, ?)' % self.table,
+                            ((key, value) for key, value in
+                                pending.iteritems()
+                                if value is not self._deleted))
+            except sqlite3.Error:
+                logger.exception("Failed to save %s", self.table)
+                # keep the changes for the next attempt
+                self._pending = pending
+
+    def close(self):
+        self.save()
+        with self._lock:
+            self._conn.close()
+
+
 class CoverManager(providers.ProviderHandler):
     """
         Handles finding covers from various sources.
@@ -125,11 +307,19 @@ class CoverManager(providers.ProviderHandler):
         """
         providers.ProviderHandler.__init__(self, "covers")
         self.__cache = Cacher(os.path.join(location, 'cache'))
+        # (db_string, size) -> pixbuf, db_string None is the default cover
+        self.__sized = common.LimitedCache(SIZED_CACHE_SIZE)
+        self.__sized_lock = threading.Lock()
+        self.__sized_dir = os.path.join(location, 'sized')
         self.location = location
         self.methods = {}
         self.order = settings.get_option(
                 'covers/preferred_order', [])
-        self.db = {}
+        #: :class:`CoverDB` mapping album keys to db strings
+        self.db = None
+        #: :class:`CoverDB` mapping album keys to the time of the last
+        #: search that found no cover
+        self.misses = None
         self.load()
         for method in self.get_providers():
             self.on_provider_added(method)
@@ -236,11 +426,24 @@ class CoverManager(providers.ProviderHandler):
         """
         if track is None:
             return
+        return self._find_covers(track, limit, local_only)
+
+    def _find_covers(self, track, limit=-1, local_only=False, found=None):
+        """
+            Same as find_covers, but can be called from several
+            threads at once
+
+            :param found: results of methods already searched in bulk,
+                    see find_covers_in_bulk
+        """
         covers = []
         for method in self._get_methods(fixed=True):
             if local_only and method.use_cache:
                 continue
-            new = method.find_covers(track, limit=limit)
+            try:
+                new = found[method.name][track]
+            except (TypeError, KeyError):
+                new = method.find_covers(track, limit=limit)
             new = ["%s:%s"%(method.name, x) for x in new]
             covers.extend(new)
             if limit != -1 and len(covers) >= limit:
@@ -258,15 +461,103 @@ class CoverManager(providers.ProviderHandler):
             :param data: The raw cover data to store for the track.  Will
                     only be stored if the method has use_cache=True
         """
+        if self._store_cover(track, db_string, data):
+            self.timeout_save()
+            event.log_event('cover_set', self, track)
+
+    def _store_cover(self, track, db_string, data=None):
+        """
+            Sets the cover for a track without saving the db or
+            emitting any event. Returns whether the cover was set.
+        """
         name = db_string.split(":", 1)[0]
         method = self.methods.get(name)
         if method and method.use_cache and data:
             db_string = "cache:%s"%self.__cache.add(data)
         key = self._get_track_key(track)
+        if not key:
+            return False
+        old_db_string = self.db.get(key)
+        if old_db_string:
+            self.__remove_sized(old_db_string)
+        self.__remove_sized(db_string)
+        self.db[key] = db_string
+        self.misses.pop(key, None)
+        return True
+
+    def find_covers_in_bulk(self, tracks, limit=-1):
+        """
+            Lets the methods able to search many tracks at once, such as
+            the local file method, find the covers of all given tracks
+
+            :returns: a dictionary mapping the name of each of these
+                    methods to their results, which can be passed to
+                    fetch_cover
+        """
+        found = {}
+        for method in self._get_methods(fixed=True):
+            find = getattr(method, 'find_covers_for_tracks', None)
+            if find is not None:
+                found[method.name] = find(tracks, limit=limit)
+        return found
+
+    def fetch_cover(self, track, local_only=False, found=None):
+        """
+            Searches the cover of a track and stores it, without
+            saving the db. Remembers when no cover was found, see
+            is_missing. Can be called from several threads at once.
+
+            :param track: the track to fetch the cover for
+            :param local_only: If True, will only search local sources.
+            :param found: results of find_covers_in_bulk to use instead
+                    of searching these methods again
+            :returns: whether a cover was found
+        """
+        for db_string in self._find_covers(track, limit=1,
+                local_only=local_only, found=found):
+            data = self.get_cover_data(db_string)
+            if data and self._store_cover(track, db_string, data):
+                event.log_event('cover_set', self, track)
+                return True
+        self._add_miss(track)
+        return False
+
+    def is_missing(self, track):
+        """
+            Returns whether a recent search found no cover for a track.
+            Such tracks are only searched in local sources until the
+            result expires after MISS_EXPIRY seconds.
+        """
+        missed = self.misses.get(self._get_track_key(track))
+        return missed is not None and time.time() - missed < MISS_EXPIRY
+
+    def _add_miss(self, track):
+        """
+            Remembers that no cover was found for a track
+        """
+        key = self._get_track_key(track)
         if key:
-            self.db[key] = db_string
-            self.timeout_save()
-            event.log_event('cover_set', self, track)
+            self.misses[key] = time.time()
+
+    def get_albums_without_cover(self, tracks):
+        """
+            Groups tracks by album and returns one track of each album
+            that has no cover set and wasn't recently searched in vain
+
+            :param tracks: the tracks to check
+            :returns: a list of tracks
+        """
+        albums = {}
+        now = time.time()
+        for track in tracks:
+            key = self._get_track_key(track)
+            if key is None or key in albums or key in self.db:
+                continue
+            missed = self.misses.get(key)
+            if missed is not None and now - missed < MISS_EXPIRY:
+                continue
+            albums[key] = track
+        return albums.values()
 
     def remove_cover(self, track):
         """
@@ -279,6 +570,7 @@ class CoverManager(providers.ProviderHandler):
         if db_string:
             del self.db[key]
             self.__cache.remove(db_string)
+            self.__remove_sized(db_string)
             self.timeout_save()
             event.log_event('cover_removed', self, track)
 
@@ -307,7 +599,9 @@ class CoverManager(providers.ProviderHandler):
         if set_only:
             return self.get_default_cover() if use_default else None
 
-        covers = self.find_covers(track, limit=1)
+        # don't wait for remote sources which found nothing last time
+        local_only = self.is_missing(track)
+        covers = self.find_covers(track, limit=1, local_only=local_only)
         if covers:
             cover = covers[0]
             data = self.get_cover_data(cover, use_default=use_default)
@@ -315,6 +609,10 @@ class CoverManager(providers.ProviderHandler):
                 self.set_cover(track, cover, data)
             return data
 
+        if not local_only:
+            self._add_miss(track)
+            self.timeout_save()
+
         return self.get_default_cover() if use_default else None
 
     def get_cover_data(self, db_string, use_default=False):
@@ -337,6 +635,140 @@ class CoverManager(providers.ProviderHandler):
             ret = self.get_default_cover()
         return ret
 
+    def get_cover_pixbuf(self, track, size, set_only=True,
+            use_default=False):
+        """
+            Get the cover for a given track as pixbuf scaled to fit
+            into size, keeping its ratio. Covers are never upscaled.
+
+            Scaled covers are kept in memory and on disk per size, so
+            repeated calls don't need to read and decode the full size
+            cover again.
+
+            :param track: the Track to get the cover for.
+            :param size: the maximum (width, height) of the pixbuf
+            :param set_only: Only retrieve covers that have been set
+                    in the db. Otherwise, backends are searched and
+                    the cover found is stored like in get_cover.
+            :param use_default: If True, returns the default cover instead
+                    of None when no covers are found.
+        """
+        size = tuple(size)
+        pixbuf = None
+
+        if track is not None:
+            db_string = self.get_db_string(track)
+
+            if db_string is None and not set_only:
+                data = self.get_cover(track)
+                db_string = self.get_db_string(track)
+
+                # the cover can't be stored without album info
+                if db_string is None and data:
+                    pixbuf = _pixbuf_from_data(data, size)
+
+            if db_string:
+                pixbuf = self.__get_sized(db_string, size)
+
+        if pixbuf is None and use_default:
+            pixbuf = self.__get_sized(None, size)
+
+        return pixbuf
+
+    def __get_sized_path(self, db_string, size):
+        """
+            Returns the path of the on-disk variant of a cover
+        """
+        if isinstance(db_string, unicode):
+            db_string = db_string.encode('utf-8')
+        return os.path.join(self.__sized_dir, '%dx%d' % size,
+            hashlib.sha256(db_string).hexdigest())
+
+    def __get_sized(self, db_string, size):
+        """
+            Retrieves a scaled cover from memory, disk or by scaling
+            the full size cover. Returns None if there is no cover.
+
+            :param db_string: the cover to get, None for the default
+        """
+        key = (db_string, size)
+
+        with self.__sized_lock:
+            try:
+                return self.__sized[key]
+            except KeyError:
+                pass
+
+        if db_string is None:
+            pixbuf = _pixbuf_from_data(self.get_default_cover(), size)
+        else:
+            path = self.__get_sized_path(db_string, size)
+            pixbuf = None
+
+            if os.path.exists(path):
+                try:
+                    pixbuf = GdkPixbuf.Pixbuf.new_from_file(path)
+                except GLib.GError:
+                    logger.warning("Could not load scaled cover %s", path)
+
+            if pixbuf is None:
+                data = self.get_cover_data(db_string)
+                if data:
+                    pixbuf = _pixbuf_from_data(data, size)
+                if pixbuf is not None:
+                    self.__save_sized(pixbuf, path)
+
+        if pixbuf is not None:
+            with self.__sized_lock:
+                self.__sized[key] = pixbuf
+
+        return pixbuf
+
+    def __save_sized(self, pixbuf, path):
+        """
+            Stores a scaled cover on disk
+        """
+        try:
+            os.makedirs(os.path.dirname(path))
+        except OSError:
+            pass
+
+        if pixbuf.get_has_alpha():
+            filetype, keys, values = 'png', [], []
+        else:
+            filetype, keys, values = 'jpeg', ['quality'], ['90']
+
+        try:
+            # write to a temporary file so readers never see partial data
+            pixbuf.savev(path + '.new', filetype, keys, values)
+            os.rename(path + '.new', path)
+        except (GLib.GError, OSError):
+            logger.warning("Could not save scaled cover %s", path)
+
+    def __remove_sized(self, db_string):
+        """
+            Forgets the scaled variants of a cover
+        """
+        with self.__sized_lock:
+            for key in self.__sized.keys():
+                if key[0] == db_string:
+                    del self.__sized[key]
+
+        try:
+            sizes = os.listdir(self.__sized_dir)
+        except OSError:
+            return
+
+        for size in sizes:
+            try:
+                size = tuple(int(n) for n in size.split('x'))
+            except ValueError:
+                continue
+            try:
+                os.remove(self.__get_sized_path(db_string, size))
+            except OSError:
+                pass
+
     def get_default_cover(self):
         """
             Get the raw image data for the cover to show if there is no
@@ -347,26 +779,72 @@ class CoverManager(providers.ProviderHandler):
 
     def load(self):
         """
-            Load the saved db
+            Opens the saved db, converting it if it was written by an
+            older version of Exaile
         """
         path = os.path.join(self.location, 'covers.db')
-        data = None
-        for loc in [path, path+".old", path+".new"]:
+        if not _is_sqlite_db(path):
+            covers = self._load_pickle(path, ['', '.old', '.new'])
+            misses = self._load_pickle(
+                    os.path.join(self.location, 'misses.db'), [''])
+            if covers is not None or misses is not None:
+                if not self._import_pickle(path, covers or {}, misses or {}):
+                    # keep working from memory, the import will be
+                    # retried on the next start
+                    self.db = CoverDB(':memory:', 'covers')
+                    self.db.update(covers or {})
+                    self.misses = CoverDB(':memory:', 'misses')
+                    self.misses.update(misses or {})
+                    return
+
+        self.db = CoverDB(path, 'covers')
+        self.misses = CoverDB(path, 'misses')
+
+    def _load_pickle(self, path, suffixes):
+        """
+            Loads a dict pickled by older versions of Exaile, trying
+            path with each of the given suffixes
+        """
+        for suffix in suffixes:
             try:
-                f = open(loc, 'rb')
-                data = pickle.load(f)
-                f.close()
+                with open(path + suffix, 'rb') as f:
+                    data = pickle.load(f)
             except IOError:
-                pass
-            except EOFError:
-                try:
-                    os.remove(loc)
-                except Exception:
-                    pass
+                continue
+            except Exception:
+                logger.warning("Could not read %s", path + suffix)
+                continue
             if data:
-                break
-        if data:
-            self.db = data
+                return data
+        return None
+
+    def _import_pickle(self, path, covers, misses):
+        """
+            Writes the contents of an old pickled db to a new store at
+            path, keeping the old file as covers.db-pickle.bak
+
+            :returns: whether the import succeeded
+        """
+        logger.info("Converting cover DB to the new storage format...")
+        newpath = path + '.new'
+        try:
+            if os.path.exists(newpath):
+                os.remove(newpath)
+            for table, data in (('covers', covers), ('misses', misses)):
+                db = CoverDB(newpath, table)
+                db.update(data)
+                db.close()
+            if os.path.exists(path):
+                os.rename(path, path + '-pickle.bak')
+            for old in (path + '.old',
+                    os.path.join(self.location, 'misses.db')):
+                if os.path.exists(old):
+                    os.remove(old)
+            os.rename(newpath, path)
+        except Exception:
+            logger.exception("Failed to convert cover DB, keeping the old one.")
+            return False
+        return True
 
     @common.glib_wait_seconds(60)
     def timeout_save(self):
@@ -374,24 +852,10 @@ class CoverManager(providers.ProviderHandler):
 
     def save(self):
         """
-            Save the db
+            Writes the changes made to the db since it was last saved
         """
-        path = os.path.join(self.location, 'covers.db')
-        try:
-            f = open(path + ".new", 'wb')
-            pickle.dump(self.db, f, common.PICKLE_PROTOCOL)
-            f.close()
-        except IOError:
-            return
-        try:
-            os.rename(path, path + ".old")
-        except OSError:
-            pass # if it doesn'texist we don't care
-        os.rename(path + ".new", path)
-        try:
-            os.remove(path + ".old")
-        except OSError:
-            pass
+        self.db.save()
+        self.misses.save()
 
     def on_provider_added(self, provider):
         self.methods[provider.name] = provider
@@ -419,6 +883,93 @@ class CoverManager(providers.ProviderHandler):
         settings.set_option('covers/preferred_order', list(order))
 
 
+class CoverPrefetchThread(common.ProgressThread):
+    """
+        Fetches the covers of all albums in a collection which have
+        none yet, searching several albums at once
+    """
+    #: Number of covers after which the db is saved
+    save_interval = 50
+
+    def __init__(self, collection, workers=4, local_only=False):
+        """
+            :param collection: the collection to fetch covers for
+            :param workers: the number of albums to search at once
+            :param local_only: If True, will only search local sources.
+        """
+        common.ProgressThread.__init__(self)
+
+        self.collection = collection
+        self.workers = workers
+        self.local_only = local_only
+        self.stopper = threading.Event()
+
+    def stop(self):
+        """
+            Stops the thread
+        """
+        self.stopper.set()
+        common.ProgressThread.stop(self)
+
+    def run(self):
+        """
+            Runs the thread
+        """
+        tracks = MANAGER.get_albums_without_cover(
+            self.collection.get_tracks())
+        total = len(tracks)
+        logger.info("Fetching covers for %d albums", total)
+
+        # local files are searched once per directory rather than once
+        # per album
+        found_in_bulk = MANAGER.find_covers_in_bulk(tracks, limit=1)
+
+        pending = Queue.Queue()
+        for track in tracks:
+            pending.put(track)
+        results = Queue.Queue()
+
+        def fetch():
+            while not self.stopper.is_set():
+                try:
+                    track = pending.get_nowait()
+                except Queue.Empty:
+                    return
+                try:
+                    found = MANAGER.fetch_cover(track, self.local_only,
+                        found_in_bulk)
+                except Exception:
+                    logger.exception("Error fetching cover for %s", track)
+                    found = False
+                results.put(found)
+
+        for i in range(min(self.workers, total)):
+            thread = threading.Thread(target=fetch,
+                name='CoverPrefetch-%d' % i)
+            thread.daemon = True
+            thread.start()
+
+        found = 0
+        for i in xrange(total):
+            # wake up now and then to notice a stop request
+            while not self.stopper.is_set():
+                try:
+                    found += results.get(timeout=0.5)
+                    break
+                except Queue.Empty:
+                    pass
+            else:
+                break
+            self.emit('progress-update', (i + 1) * 100.0 / total)
+            if (i + 1) % self.save_interval == 0:
+                MANAGER.save()
+
+        MANAGER.save()
+        logger.info("Found covers for %d of %d albums", found, total)
+
+        if not self.stopper.is_set():
+            self.emit('done')
+
 class CoverSearchMethod(object):
     """
         Base class for creating cover search methods.
@@ -511,6 +1062,11 @@ class LocalFileCoverFetcher(CoverSearchMethod):
     def __init__(self):
         CoverSearchMethod.__init__(self)
 
+        # directory uri -> (modification time, [(basename, uri)]) of
+        # the image files in the directory, see _get_candidates
+        self._candidates = {}
+        self._candidates_lock = threading.Lock()
+
         event.add_callback(self.on_option_set, 'covers_localfile_option_set')
         self.on_option_set('covers_localfile_option_set', settings, 'covers/localfile/preferred_names')
 
@@ -521,31 +1077,105 @@ class LocalFileCoverFetcher(CoverSearchMethod):
         if track.get_type() not in self.uri_types:
             return []
         basedir = Gio.File.new_for_uri(track.get_loc_for_io()).get_parent()
-        try:
-            if not basedir.query_info("standard::type", Gio.FileQueryInfoFlags.NONE, None).get_file_type() == \
-                    Gio.FileType.DIRECTORY:
-                return []
-        except GLib.Error:
-            return []
-        covers = []
-        for fileinfo in basedir.enumerate_children("standard::type"
-                ",standard::name", Gio.FileQueryInfoFlags.NONE, None):
-            gloc = basedir.get_child(fileinfo.get_name())
-            if not fileinfo.get_file_type() == Gio.FileType.REGULAR:
-                continue
-            filename = gloc.get_basename()
-            base, ext = os.path.splitext(filename)
-            if ext.lower() not in self.extensions:
+        return self._get_covers(basedir, limit)
+
+    def find_covers_for_tracks(self, tracks, limit=-1):
+        """
+            Find the covers for several tracks at once, looking into
+            the directory of tracks sharing one only once.
+
+            :param tracks: The tracks to find covers for.
+            :param limit: Maximal number of covers to return per track.
+            :returns: A dictionary mapping each track to a list of
+                    strings that can be passed to get_cover_data.
+        """
+        directories = {}
+        results = {}
+
+        for track in tracks:
+            if track.get_type() not in self.uri_types:
+                results[track] = []
                 continue
+            gloc = Gio.File.new_for_uri(track.get_loc_for_io())
+            basedir = track.get_tag_raw('__basedir')
+            if basedir is None:
+                # not scanned yet or not a local file
+                basedir = gloc.get_parent().get_uri()
+            try:
+                directories[basedir][1].append(track)
+            except KeyError:
+                directories[basedir] = (gloc.get_parent(), [track])
+
+        for gdir, dirtracks in directories.itervalues():
+            covers = self._get_covers(gdir, limit)
+            for track in dirtracks:
+                results[track] = covers[:]
+
+        return results
+
+    def _get_covers(self, basedir, limit):
+        """
+            Returns the cover images in a directory, the preferred
+            ones first
+        """
+        candidates = self._get_candidates(basedir)
+        covers = []
+        for base, uri in candidates:
             if base in self.preferred_names:
-                covers.insert(0, gloc.get_uri())
+                covers.insert(0, uri)
             else:
-                covers.append(gloc.get_uri())
+                covers.append(uri)
         if limit == -1:
             return covers
         else:
             return covers[:limit]
 
+    def _get_candidates(self, basedir):
+        """
+            Returns the (basename, uri) tuples of the image files in a
+            directory. Listings are cached until the modification time
+            of the directory changes.
+        """
+        try:
+            info = basedir.query_info("standard::type,time::modified,"
+                "time::modified-usec", Gio.FileQueryInfoFlags.NONE, None)
+        except GLib.Error:
+            return []
+        if not info.get_file_type() == Gio.FileType.DIRECTORY:
+            return []
+
+        uri = basedir.get_uri()
+        mtime = (info.get_attribute_uint64('time::modified'),
+            info.get_attribute_uint32('time::modified-usec'))
+
+        cached = self._candidates.get(uri)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+
+        candidates = []
+        try:
+            for fileinfo in basedir.enumerate_children("standard::type"
+                    ",standard::name", Gio.FileQueryInfoFlags.NONE, None):
+                if not fileinfo.get_file_type() == Gio.FileType.REGULAR:
+                    continue
+                gloc = basedir.get_child(fileinfo.get_name())
+                filename = gloc.get_basename()
+                base, ext = os.path.splitext(filename)
+                if ext.lower() not in self.extensions:
+                    continue
+                candidates.append((base, gloc.get_uri()))
+        except GLib.Error:
+            return []
+
+        with self._candidates_lock:
+            if uri not in self._candidates and \
+                    len(self._candidates) >= DIRECTORY_CACHE_SIZE:
+                # Evicting an arbitrary directory is good enough here
+                self._candidates.popitem()
+            self._candidates[uri] = (mtime, candidates)
+
+        return candidates
+
     def get_cover_data(self, db_string):
         try:
             data = Gio.File.new_for_uri(db_string).load_contents(None)[1]
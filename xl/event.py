@@ -129,6 +129,40 @@ def add_ui_callback(function, evty=None, obj=None, *args, **kwargs):
     global EVENT_MANAGER
     return EVENT_MANAGER.add_callback(function, evty, obj, args, kwargs, ui=True)
 
+def add_batched_callback(function, evty, obj=None, delay=100, *args, **kwargs):
+    """
+        Adds a callback that receives the events of a type in batches,
+        for listeners that would otherwise have to handle large numbers
+        of events one by one, e.g. `track_tags_changed` during a
+        collection scan.
+
+        The callback is called on the UI thread, at most once per
+        *delay* milliseconds, with all the events emitted since the
+        previous call::
+
+            function(evty, events, *args, **kwargs)
+
+        where events is a list of (object, data) tuples in the order
+        the events were emitted.
+
+        :param function: the function to call with the collected events
+        :type function: callable
+        :param evty: the *type* or *name* of the event to listen for
+        :type evty: string
+        :param obj: the object to listen to events from. Defaults to
+                any object if not specified.
+        :type obj: object
+        :param delay: milliseconds to collect events for
+        :type delay: int
+
+        Any additional parameters will be passed to the callback.
+
+        :returns: a convenience function that you can call to remove the callback.
+    """
+    global EVENT_MANAGER
+    return EVENT_MANAGER.add_batched_callback(function, evty, obj, delay,
+            args, kwargs)
+
 def remove_callback(function, evty=None, obj=None):
     """
         Removes a callback. Can remove both ui and non-ui callbacks.
@@ -162,7 +196,7 @@ class Callback(object):
         Represents a callback
     """
     
-    __slots__ = ['wfunction', 'time', 'args', 'kwargs']
+    __slots__ = ['wfunction', 'time', 'args', 'kwargs', 'name']
     
     def __init__(self, function, time, args, kwargs):
         """
@@ -173,6 +207,7 @@ class Callback(object):
         self.time = time
         self.args = args
         self.kwargs = kwargs
+        self.name = _get_function_name(function)
         
     def __repr__(self):
         return '<Callback %s>' % self.wfunction()
@@ -225,6 +260,61 @@ class _WeakMethod(object):
         """Return true if we are storing same object referred to by weakRef."""
         return self.objRef == weakRef
 
+def _get_function_name(function):
+    """
+        Returns a readable name of a callback function, such as
+        "xl.collection.Collection.on_foo"
+    """
+    if ismethod(function):
+        name = '%s.%s' % (function.im_class.__name__, function.__name__)
+    else:
+        name = getattr(function, '__name__', repr(function))
+    module = getattr(function, '__module__', None)
+    if module:
+        name = '%s.%s' % (module, name)
+    return name
+
+class _EventBatcher(object):
+    """
+        Collects the events for a callback added by add_batched_callback
+    """
+    def __init__(self, manager, key, function, delay, args, kwargs):
+        self.manager = manager
+        self.key = key
+        self.wfunction = _getWeakRef(function)
+        self.delay = delay
+        self.args = args
+        self.kwargs = kwargs
+        self.events = []
+        self.lock = threading.Lock()
+
+    def collect(self, evty, obj, data):
+        """
+            Called for each event, in the thread emitting it
+        """
+        with self.lock:
+            self.events.append((obj, data))
+            if len(self.events) > 1:
+                return # already scheduled
+        GLib.timeout_add(self.delay, self.flush)
+
+    def flush(self):
+        """
+            Passes the collected events to the callback
+        """
+        with self.lock:
+            events = self.events
+            self.events = []
+        fn = self.wfunction()
+        if fn is None:
+            self.manager._remove_batcher(self.key)
+        elif events:
+            try:
+                fn(self.key[1], events, *self.args, **self.kwargs)
+            except Exception:
+                logger.exception("Event callback exception caught!")
+        return False
+
 def _getWeakRef(obj, notifyDead=None):
     """
         Get a weak reference to obj. If obj is a bound method, a _WeakMethod
@@ -264,6 +354,26 @@ class EventManager(object):
         self.pending_ui = []
         self.pending_ui_lock = threading.Lock()
 
+        # (callback table, event type) -> (callbacks for any object,
+        # tables of callbacks for specific objects). emit reads it
+        # without locking, so it is replaced rather than modified
+        # whenever callbacks are added or removed. See _get_dispatch.
+        self._dispatch = {}
+        # (function weakref, event type, object) -> _EventBatcher
+        self._batchers = {}
+
+        #: number of events emitted per event type
+        self.event_counts = {}
+        #: whether to measure the time spent in callbacks
+        self.measure_callbacks = False
+        #: (event type, callback name) -> [number of calls, total seconds,
+        #: longest call in seconds], only collected while
+        #: measure_callbacks is True
+        self.callback_times = {}
+        #: measured callbacks taking longer than this many seconds
+        #: are logged as warnings
+        self.slow_callback_threshold = 0.1
+
     def emit(self, event):
         """
             Emits an Event, calling any registered callbacks.
@@ -274,6 +384,10 @@ class EventManager(object):
         emit_logmsg = self.use_logger and (not self.logger_filter or \
                    re.search(self.logger_filter, event.type))
         emit_verbose = emit_logmsg and self.use_verbose_logger
+
+        # not locked, so a concurrent emit may be missed now and then
+        counts = self.event_counts
+        counts[event.type] = counts.get(event.type, 0) + 1
         
         global _UiThread
         is_ui_thread = (threading.current_thread() == _UiThread)
@@ -302,24 +416,60 @@ class EventManager(object):
         for event in events:
             self._emit(*event)
     
+    def _get_dispatch(self, exc_callbacks, evty):
+        """
+            Returns the callbacks of a table that listen to events of
+            the given type from any object, and the tables holding the
+            callbacks listening to specific objects.
+
+            Callbacks for specific objects are looked up on each emit,
+            caching them would keep the objects alive.
+        """
+        key = (id(exc_callbacks), evty)
+        entry = self._dispatch.get(key)
+        if entry is None:
+            with self.lock:
+                entry = self._dispatch.get(key)
+                if entry is None:
+                    callbacks = []
+                    obj_tables = []
+                    for tcall in [_NONE, evty]:
+                        tcb = exc_callbacks.get(tcall)
+                        if tcb is None:
+                            continue
+                        ocb = tcb.get(_NONE)
+                        if ocb is not None:
+                            callbacks.extend(ocb)
+                        if len(tcb) > (ocb is not None):
+                            obj_tables.append(tcb)
+                    entry = (tuple(callbacks), tuple(obj_tables))
+                    self._dispatch[key] = entry
+        return entry
+
+    def _invalidate_dispatch(self):
+        """
+            Drops the cached callbacks, call with the lock held
+        """
+        self._dispatch = {}
+
     def _emit(self, event, exc_callbacks, emit_logmsg, emit_verbose):
         
-        # Accumulate in this set to ensure callbacks only get called once
-        callbacks = set()
-        
-        with self.lock:
-            for tcall in [_NONE, event.type]:
-                tcb = exc_callbacks.get(tcall)
-                if tcb is not None:
-                    for ocall in [_NONE, event.object]:
-                        ocb = tcb.get(ocall)
-                        if ocb is not None:
-                            callbacks.update(ocb)
+        callbacks, obj_tables = self._get_dispatch(exc_callbacks, event.type)
+        if obj_tables:
+            callbacks = list(callbacks)
+            for tcb in obj_tables:
+                try:
+                    ocb = tcb.get(event.object)
+                except TypeError: # not weakly referenceable
+                    continue
+                if ocb:
+                    callbacks.extend(ocb)
         
-        # However, do not actually call the callbacks from within the lock
+        # Callbacks are not called from within the lock
         # -> Otherwise non-ui threads could accidentally block the UI if
         #    they decide to run for too long
 
+        measure = self.measure_callbacks
         for cb in callbacks:
             try:
                 fn = cb.wfunction()
@@ -332,6 +482,7 @@ class EventManager(object):
                             exc_callbacks[event.type][event.object].remove(cb)
                         except (KeyError, ValueError):
                             pass
+                        self._invalidate_dispatch()
                 elif event.time >= cb.time:
                     if emit_verbose:
                         logger.debug("Attempting to call "
@@ -339,8 +490,17 @@ class EventManager(object):
                                 "to %(event)s." % {
                                     'function': fn,
                                     'event': event.type})
-                    fn.__call__(event.type, event.object,
-                                event.data, *cb.args, **cb.kwargs)
+                    if measure:
+                        start = time.time()
+                        try:
+                            fn.__call__(event.type, event.object,
+                                        event.data, *cb.args, **cb.kwargs)
+                        finally:
+                            self._record_time(event, cb,
+                                    time.time() - start)
+                    else:
+                        fn.__call__(event.type, event.object,
+                                    event.data, *cb.args, **cb.kwargs)
                 fn = None
             except Exception:
                 # something went wrong inside the function we're calling
@@ -352,6 +512,53 @@ class EventManager(object):
                         {'type' : event.type, 'object' : repr(event.object),
                         'data' : repr(event.data)})
 
+    def _record_time(self, event, cb, elapsed):
+        """
+            Adds the time spent in a callback to callback_times
+        """
+        key = (event.type, cb.name)
+        stats = self.callback_times.get(key)
+        if stats is None:
+            stats = self.callback_times.setdefault(key, [0, 0.0, 0.0])
+        stats[0] += 1
+        stats[1] += elapsed
+        if elapsed > stats[2]:
+            stats[2] = elapsed
+        if elapsed > self.slow_callback_threshold:
+            logger.warning("Slow callback %s took %.0f ms to handle %s",
+                    cb.name, elapsed * 1000, event.type)
+
+    def reset_stats(self):
+        """
+            Clears the event counts and callback times
+        """
+        self.event_counts = {}
+        self.callback_times = {}
+
+    def format_stats(self):
+        """
+            Returns the event counts and callback times as a table, the
+            callbacks that took the most time in total first
+        """
+        lines = ['%-40s %8s' % ('Event', 'Count')]
+        for evty, count in sorted(self.event_counts.items(),
+                key=lambda item: -item[1]):
+            lines.append('%-40s %8d' % (evty, count))
+        if self.callback_times:
+            lines.append('')
+            lines.append('%-32s %8s %10s %10s %10s  %s' % ('Event', 'Calls',
+                'Total ms', 'Mean ms', 'Max ms', 'Callback'))
+            for (evty, name), (calls, total, longest) in sorted(
+                    self.callback_times.items(), key=lambda item: -item[1][1]):
+                lines.append('%-32s %8d %10.1f %10.2f %10.1f  %s' % (evty,
+                    calls, total * 1000, total * 1000 / calls,
+                    longest * 1000, name))
+        elif not self.measure_callbacks:
+            lines.append('')
+            lines.append('Callback times are not measured, start '
+                    'with --profile-events to enable.')
+        return '\n'.join(lines)
+
     def emit_async(self, event):
         """
             Same as emit(), but does not block.
@@ -394,6 +601,7 @@ class EventManager(object):
     
                 # add the actual callback
                 callbacks.append(cb)
+            self._invalidate_dispatch()
 
         if self.use_logger:
             if not self.logger_filter or re.search(self.logger_filter, evty):
@@ -402,6 +610,35 @@ class EventManager(object):
                 
         return lambda: self.remove_callback(function, evty, obj)
 
+    def add_batched_callback(self, function, evty, obj, delay, args, kwargs):
+        """
+            Registers a callback receiving events in batches, see
+            :func:`add_batched_callback`.
+
+            Returns a convenience function that you can call to
+            remove the callback.
+        """
+        key = (_getWeakRef(function), evty, _NONE if obj is None else obj)
+        batcher = _EventBatcher(self, key, function, delay, args, kwargs)
+        with self.lock:
+            old = self._batchers.get(key)
+            self._batchers[key] = batcher
+        if old is not None:
+            self.remove_callback(old.collect, evty, obj)
+        self.add_callback(batcher.collect, evty, obj, (), {})
+        return lambda: self.remove_callback(function, evty, obj)
+
+    def _remove_batcher(self, key):
+        """
+            Unregisters the batcher of a batched callback
+        """
+        with self.lock:
+            batcher = self._batchers.pop(key, None)
+        if batcher is not None:
+            obj = key[2]
+            self.remove_callback(batcher.collect, key[1],
+                    None if obj is _NONE else obj)
+
     def remove_callback(self, function, evty=None, obj=None):
         """
             Unsets a callback
@@ -411,8 +648,19 @@ class EventManager(object):
         """
         if obj is None:
             obj = _NONE
+
+        if self._batchers:
+            try:
+                key = (_getWeakRef(function), evty, obj)
+            except TypeError:
+                pass
+            else:
+                if key in self._batchers:
+                    self._remove_batcher(key)
+                    return
         
         with self.lock:
+            self._invalidate_dispatch()
             for cbs in [self.callbacks, self.all_callbacks, self.ui_callbacks]:
                 remove = []
                 try:
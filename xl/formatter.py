@@ -35,6 +35,7 @@ from gi.repository import Gio
 from gi.repository import GLib
 from gi.repository import GObject
 import re
+import weakref
 from string import Template, _TemplateMetaclass
 
 from xl import (
@@ -156,6 +157,151 @@ class ParameterTemplate(Template):
 
         return self.pattern.sub(convert, self.template)
 
+def _parse_parameters(parameters):
+    """
+        Turns the parameters of a braced identifier into a dictionary,
+        e.g. "prefix=\\,, pad=2" into {'prefix': ',', 'pad': '2'}.
+        Parameters without argument are set to True.
+    """
+    # Split parameters on unescaped comma
+    parameters = [p.lstrip() \
+        for p in re.split(r'(?<!\\),', parameters)]
+    # Split arguments on unescaped equals sign
+    parameters = [(re.split(r'(?<!\\)=', p, 1) + [True])[:2] \
+        for p in parameters]
+    # Turn list of lists into a proper dictionary
+    parameters = dict(parameters)
+
+    # Remove now obsolete escapes
+    for p in parameters:
+        argument = parameters[p]
+
+        if type(argument) is not bool:
+            argument = argument.replace(r'\,', ',')
+            argument = argument.replace(r'\}', '}')
+            argument = argument.replace(r'\=', '=')
+            parameters[p] = argument
+
+    return parameters
+
+class _Field(object):
+    """
+        An identifier of a compiled template
+    """
+    __slots__ = ['needle', 'identifier', 'parameters', 'arguments',
+                 'prefix', 'suffix', 'pad', 'padstring', 'text']
+
+    def __init__(self, needle, identifier, parameters, text):
+        """
+            :param needle: the identifier including its parameters
+            :param identifier: the bare identifier
+            :param parameters: the parsed parameters
+            :param text: the text to output if there is no substitute
+        """
+        self.needle = needle
+        self.identifier = identifier
+        self.parameters = parameters
+        self.text = text
+
+        # The parameters handled by Formatter.format itself
+        arguments = dict(parameters)
+        self.prefix = arguments.pop('prefix', '')
+        self.suffix = arguments.pop('suffix', '')
+        self.pad = arguments.pop('pad', 0)
+        self.padstring = arguments.pop('padstring', '')
+        self.arguments = arguments
+
+# template -> (segments, tail, fields), see _compile_template
+_compiled_templates = {}
+
+def _compile_template(template):
+    """
+        Splits a template into its literal text and its identifiers
+
+        :returns: a list of (literal, field index) tuples, the literal
+            text after the last identifier and the list of distinct
+            identifiers as :class:`_Field` objects
+    """
+    compiled = _compiled_templates.get(template)
+    if compiled is not None:
+        return compiled
+
+    delimiter = ParameterTemplate.delimiter
+    segments = []
+    fields = []
+    indexes = {}
+    literal = []
+    position = 0
+
+    for match in ParameterTemplate.pattern.finditer(template):
+        literal.append(template[position:match.start()])
+        position = match.end()
+        groups = match.groupdict()
+
+        identifier = groups['braced'] or groups['named']
+
+        if identifier is None:
+            # Escaped and invalid delimiters are output as is
+            literal.append(delimiter)
+            continue
+
+        parameters = {}
+
+        if groups['named'] is not None:
+            needle = identifier
+            text = delimiter + needle
+        else:
+            identifier_parts = [identifier]
+
+            if groups['parameters'] is not None:
+                parameters = _parse_parameters(groups['parameters'])
+                identifier_parts += [groups['parameters']]
+
+            needle = ':'.join(identifier_parts)
+            text = delimiter + '{' + needle + '}'
+
+        # Multiple occurences of the same identifier with the
+        # same parameters are only formatted once
+        index = indexes.get(needle)
+
+        if index is None:
+            index = indexes[needle] = len(fields)
+            fields.append(_Field(needle, identifier, parameters, text))
+
+        segments.append((''.join(literal), index))
+        literal = []
+
+    literal.append(template[position:])
+    compiled = (segments, ''.join(literal), fields)
+
+    # Templates rarely change, this only prevents unbounded growth
+    if len(_compiled_templates) >= 256:
+        _compiled_templates.clear()
+    _compiled_templates[template] = compiled
+
+    return compiled
+
+def _render_template(compiled, values):
+    """
+        Joins a compiled template with the formatted values of its
+        identifiers, None meaning that an identifier is output as is
+    """
+    segments, tail, fields = compiled
+    parts = []
+
+    for literal, index in segments:
+        parts.append(literal)
+        value = values[index]
+
+        if value is None:
+            parts.append(fields[index].text)
+        else:
+            parts.append(value)
+
+    parts.append(tail)
+
+    return ''.join(parts)
+
 class Formatter(GObject.GObject):
     """
         A generic text formatter based on a format string
@@ -189,6 +335,7 @@ class Formatter(GObject.GObject):
 
         self._template = ParameterTemplate(format)
         self._substitutions = {}
+        self._compiled = None
 
     def do_get_property(self, property):
         """
@@ -244,25 +391,7 @@ class Formatter(GObject.GObject):
             parameters = {}
 
             if groups['parameters'] is not None:
-                # Split parameters on unescaped comma
-                parameters = [p.lstrip() \
-                    for p in re.split(r'(?<!\\),', groups['parameters'])]
-                # Split arguments on unescaped equals sign
-                parameters = [(re.split(r'(?<!\\)=', p, 1) + [True])[:2] \
-                    for p in parameters]
-                # Turn list of lists into a proper dictionary
-                parameters = dict(parameters)
-
-                # Remove now obsolete escapes
-                for p in parameters:
-                    argument = parameters[p]
-
-                    if type(argument) is not bool:
-                        argument = argument.replace(r'\,', ',')
-                        argument = argument.replace(r'\}', '}')
-                        argument = argument.replace(r'\=', '=')
-                        parameters[p] = argument
-
+                parameters = _parse_parameters(groups['parameters'])
                 identifier_parts += [groups['parameters']]
 
             # Required to make multiple occurences of the same
@@ -271,6 +400,57 @@ class Formatter(GObject.GObject):
 
         return extractions
 
+    def _get_compiled(self):
+        """
+            Retrieves the format string split into literal text
+            and identifiers, compiled once per format string
+
+            :returns: a list of (literal, field index) tuples, the
+                literal text after the last identifier and the list
+                of distinct identifiers
+            :rtype: tuple
+        """
+        template = self._template.template
+        compiled = self._compiled
+
+        if compiled is None or compiled[0] is not template:
+            compiled = self._compiled = (template,
+                _compile_template(template))
+
+        return compiled[1]
+
+    def _format_field(self, field, substitute):
+        """
+            Applies the common parameters of an identifier,
+            see :class:`Formatter`
+
+            :param field: the identifier
+            :param substitute: the value of the identifier
+            :returns: the formatted text
+            :rtype: string
+        """
+        if field.pad:
+            pad = int(field.pad)
+            padstring = field.padstring
+
+            if pad > 0 and padstring:
+                # Decrease pad length by value length
+                pad = max(0, pad - len(substitute))
+                # Retrieve the maximum multiplier for the pad string
+                padcount = pad / len(padstring) + 1
+                # Generate pad string
+                padstring = padcount * padstring
+                # Clamp pad string
+                padstring = padstring[0:pad]
+                substitute = '%s%s' % (padstring, substitute)
+
+        if substitute:
+            substitute = '%s%s%s' % (field.prefix, substitute, field.suffix)
+
+        # We use this idiom instead of str() because the latter
+        # will fail if substitute is a Unicode containing non-ASCII
+        return '%s' % (substitute,)
+
     def format(self, *args):
         """
             Returns a string by formatting the passed data
@@ -279,43 +459,25 @@ class Formatter(GObject.GObject):
             :returns: the formatted text
             :rtype: string
         """
-        extractions = self.extract()
-        substitutions = {}
+        compiled = self._get_compiled()
+        substitutions = self._substitutions
+        values = []
 
-        for needle, (identifier, parameters) in extractions.iteritems():
-            substitute = None
-
-            if needle in self._substitutions:
-                substitute = self._substitutions[needle]
-            elif identifier in self._substitutions:
-                substitute = self._substitutions[identifier]
+        for field in compiled[2]:
+            if field.needle in substitutions:
+                substitute = substitutions[field.needle]
+            else:
+                substitute = substitutions.get(field.identifier)
 
             if substitute is not None:
-                prefix = parameters.pop('prefix', '')
-                suffix = parameters.pop('suffix', '')
-                pad = int(parameters.pop('pad', 0))
-                padstring = parameters.pop('padstring', '')
-
                 if callable(substitute):
-                    substitute = substitute(*args, **parameters)
+                    substitute = substitute(*args, **field.arguments)
 
-                if pad > 0 and padstring:
-                    # Decrease pad length by value length
-                    pad = max(0, pad - len(substitute))
-                    # Retrieve the maximum multiplier for the pad string
-                    padcount = pad / len(padstring) + 1
-                    # Generate pad string
-                    padstring = padcount * padstring
-                    # Clamp pad string
-                    padstring = padstring[0:pad]
-                    substitute = '%s%s' % (padstring, substitute)
+                substitute = self._format_field(field, substitute)
 
-                if substitute:
-                    substitute = '%s%s%s' % (prefix, substitute, suffix)
+            values.append(substitute)
 
-                substitutions[needle] = substitute
-
-        return self._template.safe_substitute(substitutions)
+        return _render_template(compiled, values)
 
 class ProgressTextFormatter(Formatter):
     """
@@ -371,10 +533,58 @@ class ProgressTextFormatter(Formatter):
 
         return Formatter.format(self)
 
+# tag -> tag-formatting provider or None, see _get_tag_provider
+_tag_providers = {}
+# Incremented whenever tag-formatting providers are (un)registered
+_tag_providers_changed = [0]
+
+def _get_tag_provider(tag):
+    """
+        Returns the tag-formatting provider for a tag
+    """
+    try:
+        return _tag_providers[tag]
+    except KeyError:
+        provider = _tag_providers[tag] = \
+            providers.get_provider('tag-formatting', tag)
+        return provider
+
+def _on_tag_providers_changed(type, manager, data):
+    """
+        Forgets the tag-formatting providers looked up so far
+    """
+    _tag_providers.clear()
+    _tag_providers_changed[0] += 1
+
+event.add_callback(_on_tag_providers_changed,
+    'tag-formatting_provider_added')
+event.add_callback(_on_tag_providers_changed,
+    'tag-formatting_provider_removed')
+
 class TrackFormatter(Formatter):
     """
         A formatter for track data
+
+        Optionally keeps the formatted strings of a bounded number
+        of tracks until their tags or the format change. The cache
+        does not keep tracks alive.
     """
+    def __init__(self, format, cache_size=0):
+        """
+            :param format: the initial format, see the documentation
+                of :class:`string.Template` for details
+            :type format: string
+            :param cache_size: the number of tracks to keep formatted
+                strings for, 0 to disable caching
+            :type cache_size: int
+        """
+        Formatter.__init__(self, format)
+
+        # track -> {markup_escape: (track revision, compiled template,
+        # providers serial, formatted text)}
+        self._cache = weakref.WeakKeyDictionary() if cache_size > 0 else None
+        self._cache_size = cache_size
+
     def format(self, track, markup_escape=False):
         """
             Returns a string for places where
@@ -392,28 +602,64 @@ class TrackFormatter(Formatter):
             raise TypeError('First argument to format() needs '
                             'to be of type xl.trax.Track')
 
-        extractions = self.extract()
-        self._substitutions = {}
+        compiled = self._get_compiled()
+        cache = self._cache
+
+        if cache is not None:
+            revision = track._revision
+            serial = _tag_providers_changed[0]
+            entries = cache.get(track)
+            entry = None if entries is None else entries.get(markup_escape)
+
+            if entry is not None and entry[0] == revision and \
+                    entry[1] is compiled and entry[2] == serial:
+                return entry[3]
+
+        values = []
+        cacheable = True
 
-        for identifier, (tag, parameters) in extractions.iteritems():
-            provider = providers.get_provider('tag-formatting', tag)
+        for field in compiled[2]:
+            provider = _get_tag_provider(field.identifier)
 
             if provider is None:
-                substitute = track.get_tag_display(tag)
+                substitute = track.get_tag_display(field.identifier)
             else:
-                substitute = provider.format(track, parameters)
+                substitute = provider.format(track, dict(field.parameters))
+                cacheable = cacheable and \
+                    getattr(provider, 'cacheable', False)
 
-            if markup_escape:
-                substitute = GLib.markup_escape_text(substitute).decode('utf-8')
+            if substitute is not None:
+                if markup_escape:
+                    substitute = GLib.markup_escape_text(substitute) \
+                        .decode('utf-8')
 
-            self._substitutions[identifier] = substitute
+                substitute = self._format_field(field, substitute)
 
-        return Formatter.format(self)
+            values.append(substitute)
+
+        text = _render_template(compiled, values)
+
+        if cache is not None and cacheable:
+            if entries is None:
+                if len(cache) >= self._cache_size:
+                    # Evicting an arbitrary entry is good enough here
+                    try:
+                        cache.popitem()
+                    except KeyError:
+                        pass
+                entries = cache[track] = {}
+            entries[markup_escape] = (revision, compiled, serial, text)
+
+        return text
 
 class TagFormatter(object):
     """
         A formatter provider for a tag of a track
     """
+    #: whether the formatted value depends on nothing but the tags
+    #: of the track and can be cached until they change
+    cacheable = True
+
     def __init__(self, name):
         """
             :param name: the name of the tag
@@ -640,6 +886,9 @@ class RatingTagFormatter(TagFormatter):
         
         Will return glyphs representing the rating like ★★★☆☆
     """
+    # depends on the rating/maximum setting
+    cacheable = False
+
     def __init__(self):
         TagFormatter.__init__(self, '__rating')
 
@@ -689,6 +938,9 @@ class DateTagFormatter(TagFormatter):
         Will return the localized string for *Today*, *Yesterday*
         or the respective localized date for earlier dates
     """
+    # depends on the current date
+    cacheable = False
+
     def __init__(self, name):
         """
             :param name: the name of the tag
@@ -28,9 +28,12 @@ from datetime import (
     datetime,
     timedelta
 )
+import logging
 import os
+import Queue
 import re
 import shelve
+import time
 import zlib
 import threading
 
@@ -43,6 +46,8 @@ from xl import (
     xdg
 )
 
+logger = logging.getLogger(__name__)
+
 class LyricsNotFoundException(Exception):
     pass
 
@@ -50,13 +55,21 @@ class LyricsCache:
     '''
         Basically just a thread-safe shelf for convinience.  
         Supports container syntax.
+
+        Writes are kept in memory and written to the shelf at once
+        after flush_delay seconds, or when :meth:`flush` is called.
     '''
-    def __init__(self, location, default=None):
+    _deleted = object()
+
+    def __init__(self, location, default=None, flush_delay=30):
         '''
             @param location: specify the shelve file location
             
             @param default: can specify a default to return from getter when
                 there is nothing in the shelve
+
+            @param flush_delay: seconds after which pending writes are
+                written to the shelve
         '''
         self.location = location
         try:
@@ -67,24 +80,70 @@ class LyricsCache:
             self.db = shelve.Shelf(_db, protocol=common.PICKLE_PROTOCOL)
         self.lock = threading.Lock()
         self.default = default
+        self.flush_delay = flush_delay
+        # key -> value or _deleted, not yet written to the shelve
+        self._pending = {}
+        self._timer = None
 
     def keys(self):
         '''
             Return the shelve keys
         '''
-        return self.db.keys()
+        with self.lock:
+            keys = set(self.db.keys())
+            for key, value in self._pending.iteritems():
+                if value is self._deleted:
+                    keys.discard(key)
+                else:
+                    keys.add(key)
+        return list(keys)
         
     def _get(self, key, default=None):
+        if default is None:
+            default = self.default
+        # pending values are served without waiting for the lock
+        value = self._pending.get(key)
+        if value is not None:
+            return default if value is self._deleted else value
         with self.lock:
+            value = self._pending.get(key)
+            if value is not None:
+                return default if value is self._deleted else value
             try:
                 return self.db[key]
             except Exception:
-                return default if default is not None else self.default
+                return default
                 
     def _set(self, key, value):
         with self.lock:
-            self.db[key] = value
-            # force save, wasn't auto-saving...
+            self._pending[key] = value
+            self._schedule_flush()
+
+    def _schedule_flush(self):
+        if self._timer is None:
+            self._timer = threading.Timer(self.flush_delay, self.flush)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def flush(self):
+        '''
+            Writes all pending changes to the shelve
+        '''
+        with self.lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if not self._pending:
+                return
+            for key, value in self._pending.iteritems():
+                try:
+                    if value is self._deleted:
+                        del self.db[key]
+                    else:
+                        self.db[key] = value
+                except KeyError:
+                    pass
+            self._pending = {}
             self.db.sync()
                 
     def __getitem__(self, key):
@@ -94,17 +153,18 @@ class LyricsCache:
         self._set(key, value)
         
     def __contains__(self, key):
-        return key in self.db
+        return self._get(key, self._deleted) is not self._deleted
 
     def __delitem__(self, key):
-        with self.lock:
-            del self.db[key]
+        if key not in self:
+            raise KeyError(key)
+        self._set(key, self._deleted)
 
     def __iter__(self):
-        return self.db.__iter__()
+        return iter(self.keys())
         
     def __len__(self):
-        return len(self.db)
+        return len(self.keys())
 
 class LyricsManager(providers.ProviderHandler):
     """
@@ -120,6 +180,7 @@ class LyricsManager(providers.ProviderHandler):
         self.cache = LyricsCache(os.path.join(xdg.get_cache_dir(), 'lyrics.cache'))
 
         event.add_callback(self.on_track_tags_changed, 'track_tags_changed')
+        event.add_callback(self.on_quit_application, 'quit_application')
 
     def __get_cache_key(self, track, provider):
         """
@@ -169,15 +230,8 @@ class LyricsManager(providers.ProviderHandler):
             :raise LyricsNotFoundException: when lyrics are not
                 found
         """
-        lyrics = None
-        source = None
-        url = None
-
-        for method in self.get_providers():
-            try:
-                (lyrics, source, url) = self._find_cached_lyrics(method, track, refresh)
-            except LyricsNotFoundException:
-                continue
+        for method, result in self._find_concurrently(track, refresh):
+            (lyrics, source, url) = result
             break
         else:
             # This only happens if all providers raised LyricsNotFoundException.
@@ -206,14 +260,8 @@ class LyricsManager(providers.ProviderHandler):
         """
         lyrics_found=[]
 
-        for method in self.get_providers():
-            lyrics = None
-            source = None
-            url = None
-            try:
-                (lyrics, source, url) = self._find_cached_lyrics(method, track, refresh)
-            except LyricsNotFoundException:
-                continue
+        for method, (lyrics, source, url) in \
+                self._find_concurrently(track, refresh):
             lyrics = lyrics.strip()
             lyrics_found.append((method.display_name, lyrics, source, url))
 
@@ -222,7 +270,63 @@ class LyricsManager(providers.ProviderHandler):
             raise LyricsNotFoundException()
 
         return lyrics_found
-        
+
+    def _get_methods(self):
+        """
+            Returns the providers, sorted by preference
+        """
+        methods = self.get_providers()
+        order = self.preferred_order
+        methods.sort(key=lambda m: order.index(m.name)
+                if m.name in order else len(order))
+        return methods
+
+    def _find_concurrently(self, track, refresh=False):
+        """
+            Queries all providers at once and yields (provider, result)
+            for each provider that found lyrics, in the preferred order.
+            Each result is yielded as soon as it and the results of all
+            more preferred providers are known, so callers only
+            interested in the best result can stop early.
+
+            Providers which did not answer within lyrics/timeout
+            seconds are skipped; they keep running in the background
+            and still update the cache.
+        """
+        methods = self._get_methods()
+        results = Queue.Queue()
+        for i, method in enumerate(methods):
+            self.__find_in_thread(results, i, method, track, refresh)
+
+        deadline = time.time() + settings.get_option('lyrics/timeout', 15)
+        done = {}
+        for i, method in enumerate(methods):
+            while i not in done:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                try:
+                    j, result = results.get(timeout=remaining)
+                except Queue.Empty:
+                    break
+                done[j] = result
+            result = done.get(i)
+            if result is not None:
+                yield method, result
+            elif i not in done:
+                logger.debug("Lyrics provider %s timed out", method.name)
+
+    @common.threaded
+    def __find_in_thread(self, results, i, method, track, refresh):
+        result = None
+        try:
+            result = self._find_cached_lyrics(method, track, refresh)
+        except LyricsNotFoundException:
+            pass
+        except Exception:
+            logger.exception("Error fetching lyrics from %s", method.name)
+        results.put((i, result))
+
     def _find_cached_lyrics(self, method, track, refresh=False):
         """
             Checks the cache for lyrics.  If found and not expired, returns
@@ -281,6 +385,12 @@ class LyricsManager(providers.ProviderHandler):
         except (ValueError, AttributeError):
             pass
 
+    def on_quit_application(self, e, exaile, data):
+        """
+            Writes the pending cache entries
+        """
+        self.cache.flush()
+
     def on_track_tags_changed(self, e, track, tag):
         """
             Updates the internal cache upon lyric tag changes
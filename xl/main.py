@@ -203,6 +203,13 @@ def create_argument_parser():
     group.add_argument("--eventdebug-full", dest="DebugEventFull",
         action="store_true", default=False, help=_("Enable full debugging of"
         " xl.event. Generates LOTS of output"))
+    group.add_argument("--profile-events", dest="ProfileEvents",
+        action="store_true", default=False, help=_("Measure the time spent in"
+        " xl.event callbacks, warn about slow ones and log the totals on"
+        " exit"))
+    group.add_argument("--startup-profile", dest="StartupProfile",
+        action="store_true", default=False, help=_("Print the time taken by"
+        " each startup phase and by enabling each plugin"))
     group.add_argument("--threaddebug", dest="DebugThreads",
         action="store_true", default=False, help=_("Add thread name to logging"
         " messages."))
@@ -307,6 +314,9 @@ class Exaile(object):
     
             if self.options.DebugEventFull:
                 event.EVENT_MANAGER.use_verbose_logger = True
+
+            if self.options.ProfileEvents:
+                event.EVENT_MANAGER.measure_callbacks = True
     
             # initial mainloop setup. The actual loop is started later,
             # if necessary
@@ -420,90 +430,127 @@ class Exaile(object):
         from gi.repository import Gst
         Gst.init(None)
 
+        # Independent parts of the startup run in parallel: the loading
+        # of the collection, covers, playlists and plugin modules as well
+        # as device probing happen in worker threads, while the main
+        # thread sets up the player and enables plugins. The GUI is
+        # built as soon as everything it uses is there.
+        from xl import event, startup
+        self.startup = startup.PhaseRunner()
+        add_phase = self.startup.add
+
         # Initialize plugin manager
         from xl import plugins
         self.plugins = plugins.PluginsManager(self)
-        
-        if not self.options.SafeMode:
-            logger.info("Loading plugins...")
-            self.plugins.load_enabled()
-        else:
-            logger.info("Safe mode enabled, not loading plugins.")
 
-        # Initialize the collection
-        logger.info("Loading collection...")
-        from xl import collection
-        try:
+        def load_player():
+            # Set up the player and playback queue
+            from xl import player
+            event.log_event("player_loaded", player.PLAYER, None)
+        add_phase('player', load_player, main_thread=True)
+
+        def load_collection():
+            logger.info("Loading collection...")
+            from xl import collection
             self.collection = collection.Collection("Collection",
                     location=os.path.join(xdg.get_data_dir(), 'music.db'))
-        except common.VersionError:
-            logger.exception("VersionError loading collection")
-            sys.exit(1)
-
-        from xl import event
-        # Set up the player and playback queue
-        from xl import player
-        event.log_event("player_loaded", player.PLAYER, None)
-
-        # Initalize playlist manager
-        from xl import playlist
-        self.playlists = playlist.PlaylistManager()
-        self.smart_playlists = playlist.SmartPlaylistManager('smart_playlists',
-            collection=self.collection)
-        if firstrun:
-            self._add_default_playlists()
-        event.log_event("playlists_loaded", self, None)
-
-        # Initialize dynamic playlist support
-        from xl import dynamic
-        dynamic.MANAGER.collection = self.collection
+        add_phase('collection', load_collection)
 
-        # Initalize device manager
-        logger.info("Loading devices...")
-        from xl import devices
-        self.devices = devices.DeviceManager()
-        event.log_event("device_manager_ready", self, None)
+        def load_covers():
+            from xl import covers
+        add_phase('covers', load_covers)
 
-        # Initialize dynamic device discovery interface
-        # -> if initialized and connected, then the object is not None
-        
-        self.udisks2 = None
-        self.udisks = None
-        self.hal = None
-        
-        if self.options.Hal:
-            from xl import hal
-                
-            udisks2 = hal.UDisks2(self.devices)
-            if udisks2.connect():
-                self.udisks2 = udisks2
-            else:
-                udisks = hal.UDisks(self.devices)
-                if udisks.connect():
-                    self.udisks = udisks
-                else:
-                    self.hal = hal.HAL(self.devices)
-                    self.hal.connect()
+        if not self.options.SafeMode:
+            # Importing plugins may import the player, hence the order
+            logger.info("Loading plugins...")
+            add_phase('plugin-imports', self.plugins.preload_enabled,
+                    requires=['player'])
+            add_phase('plugins', self.plugins.load_enabled,
+                    requires=['plugin-imports'], main_thread=True)
         else:
+            logger.info("Safe mode enabled, not loading plugins.")
+            add_phase('plugins', lambda: None)
+
+        def load_playlists():
+            # Initalize playlist manager
+            from xl import playlist
+            self.playlists = playlist.PlaylistManager()
+            self.stations = playlist.PlaylistManager('radio_stations')
+        add_phase('playlists', load_playlists)
+
+        def load_smart_playlists():
+            from xl import playlist
+            self.smart_playlists = playlist.SmartPlaylistManager(
+                    'smart_playlists', collection=self.collection)
+            if firstrun:
+                self._add_default_playlists()
+            event.log_event("playlists_loaded", self, None)
+
+            # Initialize dynamic playlist support
+            from xl import dynamic
+            dynamic.MANAGER.collection = self.collection
+        add_phase('smart-playlists', load_smart_playlists,
+                requires=['collection', 'playlists'])
+
+        def load_radio():
+            # Radio Manager
+            from xl import radio
+            self.radio = radio.RadioManager()
+        add_phase('radio', load_radio, requires=['playlists'])
+
+        def load_devices():
+            # Initalize device manager
+            logger.info("Loading devices...")
+            from xl import devices
+            self.devices = devices.DeviceManager()
+            event.log_event("device_manager_ready", self, None)
+
+            # Initialize dynamic device discovery interface
+            # -> if initialized and connected, then the object is not None
+
+            self.udisks2 = None
+            self.udisks = None
             self.hal = None
 
-        # Radio Manager
-        from xl import radio
-        self.stations = playlist.PlaylistManager('radio_stations')
-        self.radio = radio.RadioManager()
+            if self.options.Hal:
+                from xl import hal
+
+                udisks2 = hal.UDisks2(self.devices)
+                if udisks2.connect():
+                    self.udisks2 = udisks2
+                else:
+                    udisks = hal.UDisks(self.devices)
+                    if udisks.connect():
+                        self.udisks = udisks
+                    else:
+                        self.hal = hal.HAL(self.devices)
+                        self.hal.connect()
+        add_phase('devices', load_devices)
 
         self.gui = None
         # Setup GUI
         if self.options.StartGui:
-            logger.info("Loading interface...")
+            def load_gui():
+                logger.info("Loading interface...")
 
-            import xlgui
-            self.gui = xlgui.Main(self)
-            self.gui.main.window.show_all()
-            event.log_event("gui_loaded", self, None)
+                import xlgui
+                self.gui = xlgui.Main(self)
+                self.gui.main.window.show_all()
+                event.log_event("gui_loaded", self, None)
+
+                if splash is not None:
+                    splash.destroy()
+            # the GUI lists the devices found so far and then follows
+            # the changes, so probing has to be done first
+            add_phase('gui', load_gui, requires=['player', 'collection',
+                'covers', 'plugins', 'smart-playlists', 'radio', 'devices'],
+                main_thread=True)
 
-            if splash is not None:
-                splash.destroy()
+        try:
+            self.startup.run()
+        except common.VersionError:
+            logger.exception("VersionError loading collection")
+            sys.exit(1)
 
         if firstrun:
             settings.set_option("general/first_run", False)
@@ -530,11 +577,28 @@ class Exaile(object):
             self.gui.rescan_collection_with_progress(True)
 
         if restore:
+            from xl import player
             player.QUEUE._restore_player_state(
                     os.path.join(xdg.get_data_dir(), 'player.state'))
 
+        if self.options.StartupProfile:
+            self._print_startup_profile()
+
         # pylint: enable-msg=W0201
 
+    def _print_startup_profile(self):
+        """
+            Prints the time taken by the startup phases and plugins
+        """
+        print(self.startup.report())
+        times = self.plugins.enable_times
+        if times:
+            print("Plugins (import + enable):")
+            for name in sorted(times, key=times.get, reverse=True):
+                print("  %-16s %7.0f ms + %5.0f ms" % (name,
+                    self.plugins.load_times.get(name, 0) * 1000,
+                    times[name] * 1000))
+
     def version(self):
         from xl.version import __version__
         print("Exaile", __version__)
@@ -674,6 +738,10 @@ class Exaile(object):
         # below.
         event.log_event("quit_application", self, None)
 
+        if self.options.ProfileEvents:
+            logger.info("Event statistics:\n%s",
+                    event.EVENT_MANAGER.format_stats())
+
         logger.info("Saving state...")
         self.plugins.save_enabled()
 
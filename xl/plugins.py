@@ -31,6 +31,9 @@ import os
 import shutil
 import sys
 import tarfile
+import time
+
+from gi.repository import GLib
 
 from xl.nls import gettext as _
 from xl import ( 
@@ -63,6 +66,11 @@ class PluginsManager(object):
 
         self.exaile = exaile
         self.enabled_plugins = {}
+        # seconds taken to import and to enable each plugin
+        self.load_times = {}
+        self.enable_times = {}
+        # lazy plugins waiting to be enabled once Exaile has loaded
+        self.deferred_plugins = []
 
         self.load = load
 
@@ -73,6 +81,7 @@ class PluginsManager(object):
                 return path
         return None
     
+    @common.synchronized
     def load_plugin(self, pluginname, reload=False):
         if not reload and pluginname in self.loaded_plugins:
             return self.loaded_plugins[pluginname]
@@ -80,11 +89,16 @@ class PluginsManager(object):
         path = self.__findplugin(pluginname)
         if path is None:
             return False
+        start = time.time()
         sys.path.insert(0, path)
-        plugin = imp.load_source(pluginname, os.path.join(path,'__init__.py'))
-        if hasattr(plugin, 'plugin_class'):
-            plugin = plugin.plugin_class()
-        sys.path = sys.path[1:]
+        try:
+            plugin = imp.load_source(pluginname,
+                    os.path.join(path,'__init__.py'))
+            if hasattr(plugin, 'plugin_class'):
+                plugin = plugin.plugin_class()
+        finally:
+            sys.path.remove(path)
+        self.load_times[pluginname] = time.time() - start
         self.loaded_plugins[pluginname] = plugin
         return plugin
 
@@ -141,13 +155,17 @@ class PluginsManager(object):
         return False
 
     def enable_plugin(self, pluginname):
+        if pluginname in self.deferred_plugins:
+            self.deferred_plugins.remove(pluginname)
         try:
             plugin = self.load_plugin(pluginname)
             if not plugin:
                 raise Exception("Error loading plugin")
+            start = time.time()
             plugin.enable(self.exaile)
             if not inspect.ismodule(plugin):
                 self.__enable_new_plugin(plugin)
+            self.enable_times[pluginname] = time.time() - start
             self.enabled_plugins[pluginname] = plugin
             logger.debug("Loaded plugin %s" % pluginname)
             self.save_enabled()
@@ -157,6 +175,11 @@ class PluginsManager(object):
             raise e
 
     def disable_plugin(self, pluginname):
+        if pluginname in self.deferred_plugins:
+            self.deferred_plugins.remove(pluginname)
+            self.save_enabled()
+            event.log_event('plugin_disabled', self, pluginname)
+            return True
         try:
             plugin = self.enabled_plugins[pluginname]
             del self.enabled_plugins[pluginname]
@@ -200,7 +223,8 @@ class PluginsManager(object):
             try:
                 key, val = line.split("=",1)
                 # restricted eval - no bult-in funcs. marginally more secure.
-                infodict[key] = eval(val, {'__builtins__': None, '_': _}, {})
+                infodict[key] = eval(val, {'__builtins__': None, '_': _,
+                    'True': True, 'False': False}, {})
             except ValueError:
                 pass # this happens on blank lines
         return infodict
@@ -251,6 +275,16 @@ class PluginsManager(object):
             
         return False
 
+    def is_lazy(self, pluginname):
+        """
+            Returns True if the plugin declares Lazy=True in its
+            PLUGININFO, asking to be enabled only once Exaile has loaded
+        """
+        try:
+            return bool(self.get_plugin_info(pluginname).get('Lazy', False))
+        except Exception:
+            return False
+
     def get_plugin_default_preferences(self, pluginname):
         """
             Returns the default preferences for a plugin
@@ -273,15 +307,73 @@ class PluginsManager(object):
 
     def save_enabled(self):
         if self.load:
-            settings.set_option("plugins/enabled", self.enabled_plugins.keys())
+            settings.set_option("plugins/enabled",
+                    self.enabled_plugins.keys() + self.deferred_plugins)
 
-    def load_enabled(self):
+    def __get_startup_plugins(self):
+        """
+            Returns the enabled plugins to enable at startup, putting
+            the lazy ones aside in :attr:`deferred_plugins`
+        """
         to_enable = settings.get_option("plugins/enabled", [])
-        for plugin in to_enable:
+        self.deferred_plugins = [plugin for plugin in to_enable
+                if self.is_lazy(plugin)]
+        return [plugin for plugin in to_enable
+                if plugin not in self.deferred_plugins]
+
+    def preload_enabled(self):
+        """
+            Imports the enabled plugins without enabling them, which is
+            safe to do in another thread. Failures are reported once
+            :meth:`load_enabled` tries again.
+
+            Lazy plugins are left alone, :meth:`load_enabled` takes
+            care of them.
+        """
+        for plugin in self.__get_startup_plugins():
+            try:
+                self.load_plugin(plugin)
+            except Exception:
+                logger.debug("Unable to import plugin %s", plugin,
+                        exc_info=True)
+
+    def load_enabled(self):
+        """
+            Enables the enabled plugins. Lazy plugins are imported in
+            the background and enabled one at a time when idle, once
+            Exaile has finished loading. Enabling one explicitly before
+            that happens at once.
+        """
+        for plugin in self.__get_startup_plugins():
             try:
                 self.enable_plugin(plugin)
             except Exception:
                 pass
+        if self.deferred_plugins:
+            event.add_callback(self.__on_exaile_loaded, 'exaile_loaded')
+
+    def __on_exaile_loaded(self, eventname, exaile, nothing):
+        event.remove_callback(self.__on_exaile_loaded, 'exaile_loaded')
+        self.__load_deferred(list(self.deferred_plugins))
+
+    @common.threaded
+    def __load_deferred(self, pluginnames):
+        for plugin in pluginnames:
+            try:
+                self.load_plugin(plugin)
+            except Exception:
+                logger.debug("Unable to import plugin %s", plugin,
+                        exc_info=True)
+            GLib.idle_add(self.__enable_deferred, plugin)
+
+    def __enable_deferred(self, pluginname):
+        # it may have been enabled or disabled meanwhile
+        if pluginname in self.deferred_plugins:
+            try:
+                self.enable_plugin(pluginname)
+            except Exception:
+                pass
+        return False
 
 # vim: et sts=4 sw=4
 
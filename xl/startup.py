@@ -0,0 +1,181 @@
+# Copyright (C) 2008-2010 Adam Olsen
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2, or (at your option)
+# any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+#
+#
+# The developers of the Exaile media player hereby grant permission
+# for non-GPL compatible GStreamer and Exaile plugins to be used and
+# distributed together with GStreamer and Exaile. This permission is
+# above and beyond the permissions granted by the GPL license by which
+# Exaile is covered. If you modify this code, you may extend this
+# exception to your version of the code, but you are not obligated to
+# do so. If you do not wish to do so, delete this exception statement
+# from your version.
+
+
+"""
+    Runs the steps of Exaile's startup as phases with dependencies, so
+    that independent steps can overlap.
+"""
+
+import logging
+import Queue
+import sys
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class Phase(object):
+    """
+        A step of the startup and the time it took
+    """
+    def __init__(self, name, func, requires, main_thread):
+        self.name = name
+        self.func = func
+        self.requires = requires
+        self.main_thread = main_thread
+        #: seconds since the start of the run, None until run
+        self.start = None
+        self.end = None
+
+    @property
+    def duration(self):
+        if self.start is None or self.end is None:
+            return None
+        return self.end - self.start
+
+
+class PhaseRunner(object):
+    """
+        Runs phases once the phases they require are done.
+
+        Phases added with main_thread=True run in the thread calling
+        :meth:`run`, in the order they were added as far as their
+        requirements allow; anything touching the GUI belongs there.
+        The other phases each run in a thread of their own as soon as
+        they can.
+
+        >>> runner = PhaseRunner()
+        >>> runner.add('load', lambda: None)
+        >>> runner.add('show', lambda: None, requires=['load'],
+        ...         main_thread=True)
+        >>> runner.run()
+    """
+    def __init__(self):
+        self.phases = []
+        self._names = {}
+        self.duration = None
+
+    def add(self, name, func, requires=(), main_thread=False):
+        """
+            Adds a phase. Required phases must have been added before,
+            which also rules out cycles.
+
+            :param func: the callable doing the work
+            :param requires: the names of the phases to wait for
+        """
+        if name in self._names:
+            raise ValueError("Duplicate startup phase %s" % name)
+        for req in requires:
+            if req not in self._names:
+                raise ValueError("Startup phase %s requires unknown phase %s"
+                        % (name, req))
+        phase = Phase(name, func, tuple(requires), main_thread)
+        self.phases.append(phase)
+        self._names[name] = phase
+
+    def run(self):
+        """
+            Runs all phases, returning once they are done. An exception
+            raised by a phase is raised again here, without waiting for
+            the phases still running.
+        """
+        self._start = time.time()
+        waiting = list(self.phases)
+        done = set()
+        finished = Queue.Queue()
+        running = 0
+
+        while waiting or running:
+            ready = [p for p in waiting if done.issuperset(p.requires)]
+            for phase in ready:
+                if not phase.main_thread:
+                    waiting.remove(phase)
+                    running += 1
+                    thread = threading.Thread(target=self.__run_in_thread,
+                            args=(phase, finished),
+                            name='Startup phase %s' % phase.name)
+                    thread.daemon = True
+                    thread.start()
+
+            main = [p for p in ready if p.main_thread]
+            if main:
+                waiting.remove(main[0])
+                self.__run_phase(main[0])
+                done.add(main[0].name)
+                block = False
+            else:
+                block = True
+
+            # collect the finished threads, waiting for one if there is
+            # nothing else to do
+            while running:
+                try:
+                    phase, exc_info = finished.get(block)
+                except Queue.Empty:
+                    break
+                running -= 1
+                if exc_info is not None:
+                    raise exc_info[0], exc_info[1], exc_info[2]
+                done.add(phase.name)
+                block = False
+
+        self.duration = time.time() - self._start
+
+    def __run_phase(self, phase):
+        logger.debug("Starting startup phase %s", phase.name)
+        phase.start = time.time() - self._start
+        try:
+            phase.func()
+        finally:
+            phase.end = time.time() - self._start
+        logger.debug("Startup phase %s took %.3fs", phase.name,
+                phase.duration)
+
+    def __run_in_thread(self, phase, finished):
+        try:
+            self.__run_phase(phase)
+        except Exception:
+            logger.exception("Startup phase %s failed", phase.name)
+            finished.put((phase, sys.exc_info()))
+        else:
+            finished.put((phase, None))
+
+    def report(self):
+        """
+            Returns the timings of the phases as text
+        """
+        lines = ["Startup: %.0f ms" % ((self.duration or 0) * 1000)]
+        for phase in sorted(self.phases, key=lambda p: p.start):
+            if phase.start is None:
+                continue
+            lines.append("  %-16s %7.0f ms  (at %5.0f ms, %s)" % (
+                phase.name, phase.duration * 1000, phase.start * 1000,
+                'main thread' if phase.main_thread else 'worker thread'))
+        return '\n'.join(lines)
+
+# vim: et sts=4 sw=4
@@ -24,10 +24,17 @@
 # do so. If you do not wish to do so, delete this exception statement
 # from your version.
 
+from gi.repository import Gio
 from gi.repository import Gst
 
-from xl.nls import gettext as _
 import logging
+import multiprocessing
+import os
+import Queue
+import threading
+
+from xl import common, metadata
+from xl.nls import gettext as _
 
 logger = logging.getLogger(__name__)
 
@@ -115,7 +122,8 @@ FORMATS = {
         }
 
 # NOTE: the transcoder is NOT designed to transfer tags. You will need to
-# manually write the tags after transcoding has completed.
+# manually write the tags after transcoding has completed, or use
+# TranscodeQueue which does it for you.
 
 
 def get_formats():
@@ -138,11 +146,20 @@ def add_format(name, fmt):
 class TranscodeError(Exception):
     pass
 
+def _quote(location):
+    """
+        Quotes a location for use as a property value in a pipeline
+        description
+    """
+    return '"%s"' % location.replace('\\', '\\\\').replace('"', '\\"')
+
 class Transcoder(object):
-    def __init__(self, destformat, quality, error_callback, end_callback):
+    def __init__(self, destformat, quality, error_callback=None,
+            end_callback=None):
         self.src = None
         self.sink = None
         self.set_format(destformat)
+        self.quality = FORMATS[self.dest_format]['default']
         self.set_quality(quality)
         self.input = None
         self.output = None
@@ -153,6 +170,7 @@ class Transcoder(object):
         self.__last_time = 0.0
         self.error_cb = error_callback
         self.end_cb = end_callback
+        self._cancelled = False
 
     def set_format(self, name):
         if name in FORMATS:
@@ -168,18 +186,18 @@ class Transcoder(object):
         self.encoder = fmt["command"]%quality
 
     def set_input(self, uri):
-        self.input = """filesrc location="%s" """%uri
+        self.input = "filesrc location=%s" % _quote(uri)
 
     def set_raw_input(self, raw):
         self.input = raw
 
     def set_output(self, uri):
-        self.output = """filesink location="%s" """%uri
+        self.output = "filesink location=%s" % _quote(uri)
 
     def set_output_raw(self, raw):
         self.output = raw
 
-    def start_transcode(self):
+    def _build_pipeline(self):
         self._construct_encoder()
         elements = [ self.input, "decodebin name=\"decoder\"", "audioconvert",
                 self.encoder, self.output ]
@@ -188,6 +206,10 @@ class Transcoder(object):
         pipe = Gst.parse_launch(pipestr)
         self.pipe = pipe
         self.bus = pipe.get_bus()
+        return pipe
+
+    def start_transcode(self):
+        pipe = self._build_pipeline()
         self.bus.add_signal_watch()
         self.bus.connect('message::error', self.on_error)
         self.bus.connect('message::eos', self.on_eof)
@@ -196,17 +218,98 @@ class Transcoder(object):
         self.running = True
         return pipe
 
+    def transcode(self):
+        """
+            Transcodes the input synchronously, watching the pipeline
+            bus from the calling thread so that no main loop is needed.
+            The callbacks are not called.
+
+            :returns: True once the output is complete, False if
+                :meth:`cancel` was called meanwhile
+            :raises TranscodeError: if the pipeline fails
+        """
+        pipe = self._build_pipeline()
+        self._cancelled = False
+        pipe.set_state(Gst.State.PLAYING)
+        self.running = True
+        try:
+            while not self._cancelled:
+                # wake up now and then to notice a cancellation
+                message = self.bus.timed_pop_filtered(500 * Gst.MSECOND,
+                        Gst.MessageType.ERROR | Gst.MessageType.EOS)
+                if message is None:
+                    continue
+                if message.type == Gst.MessageType.ERROR:
+                    gerror, message_string = message.parse_error()
+                    logger.debug(message_string)
+                    raise TranscodeError(gerror.message)
+                return True
+            return False
+        finally:
+            pipe.set_state(Gst.State.NULL)
+            self.running = False
+            self.__last_time = 0.0
+
+    def transcode_file(self, source, dest, tags=True, overwrite=True):
+        """
+            Transcodes the file at source to dest, creating its directory
+            if needed. The output is written next to dest, optionally
+            tagged like the source and then renamed into place, so an
+            interrupted call never leaves a truncated file at dest.
+
+            :param tags: copy the tags of source to dest
+            :param overwrite: replace dest if it exists
+            :returns: False if :meth:`cancel` was called meanwhile
+            :raises TranscodeError: if the pipeline fails, or dest exists
+                and overwrite is False
+        """
+        partial = _partial_path(dest)
+        dirname = os.path.dirname(dest)
+        if dirname and not os.path.isdir(dirname):
+            try:
+                os.makedirs(dirname)
+            except OSError:
+                # another thread may have created it meanwhile
+                if not os.path.isdir(dirname):
+                    raise
+        try:
+            self.set_input(source)
+            self.set_output(partial)
+            if not self.transcode():
+                return False
+            if tags:
+                try:
+                    copy_tags(source, partial)
+                except metadata.NotWritable:
+                    logger.info("Cannot copy the tags of %s to %s",
+                            source, dest)
+            if not overwrite and os.path.exists(dest):
+                raise TranscodeError(_('%s already exists') % dest)
+            os.rename(partial, dest)
+            return True
+        finally:
+            if os.path.exists(partial):
+                os.remove(partial)
+
+    def cancel(self):
+        """
+            Makes a running :meth:`transcode` call return early
+        """
+        self._cancelled = True
+
     def stop(self):
         self.pipe.set_state(Gst.State.NULL)
         self.running = False
         self.__last_time = 0.0
-        self.end_cb()
+        if self.end_cb is not None:
+            self.end_cb()
 
     def on_error(self, bus, message):
         self.pipe.set_state(Gst.State.NULL)
         self.running = False
         gerror, message_string = message.parse_error()
-        self.error_cb(gerror, message_string)
+        if self.error_cb is not None:
+            self.error_cb(gerror, message_string)
         logger.error(message_string)
         raise gerror
 
@@ -226,3 +329,245 @@ class Transcoder(object):
 
     def is_running(self):
         return self.running
+
+
+def is_up_to_date(source, dest):
+    """
+        Returns True if dest exists and was modified after source
+    """
+    try:
+        return os.path.getmtime(dest) >= os.path.getmtime(source)
+    except OSError:
+        return False
+
+def copy_tags(source, dest):
+    """
+        Copies the tags of the file at source to the file at dest
+
+        :raises NotWritable: if the tags of dest cannot be written
+    """
+    src = metadata.get_format(Gio.File.new_for_path(source).get_uri())
+    dst = metadata.get_format(Gio.File.new_for_path(dest).get_uri())
+    if src is None or dst is None:
+        raise metadata.NotWritable
+    dst.write_tags(src.read_all())
+
+def _partial_path(dest):
+    # keeps the extension, which tells xl.metadata the format
+    dirname, basename = os.path.split(dest)
+    root, ext = os.path.splitext(basename)
+    return os.path.join(dirname, '.%s.part%s' % (root, ext))
+
+class TranscodeQueue(common.ProgressThread):
+    """
+        Transcodes many files to one format, running several pipelines
+        at once.
+
+        Jobs whose output is newer than their source are skipped. Each
+        output is written next to its final location, tagged like its
+        source and then renamed into place, so interrupted jobs never
+        leave a truncated file that looks up to date.
+
+        Once done, :attr:`transcoded`, :attr:`skipped` and :attr:`failed`
+        list the jobs by outcome, the latter as (job, error) pairs.
+    """
+
+    def __init__(self, jobs, destformat, quality=None, workers=None,
+            overwrite=False, tags=True):
+        """
+            :param jobs: (source, dest) pairs of file paths
+            :param destformat: a key of :data:`FORMATS`
+            :param quality: one of the format's raw_steps, or None for
+                its default
+            :param workers: how many pipelines to run at once, defaults
+                to the number of CPUs
+            :param overwrite: transcode even up to date outputs
+            :param tags: copy the tags of each source to its output
+        """
+        common.ProgressThread.__init__(self)
+        self.jobs = list(jobs)
+        self.destformat = destformat
+        if quality is None:
+            quality = FORMATS[destformat]['default']
+        self.quality = quality
+        if workers is None:
+            try:
+                workers = multiprocessing.cpu_count()
+            except NotImplementedError:
+                workers = 1
+        self.workers = workers
+        self.overwrite = overwrite
+        self.tags = tags
+        self.transcoded = []
+        self.skipped = []
+        self.failed = []
+        self.stopper = threading.Event()
+        self._running = set()
+        self._lock = threading.Lock()
+
+    def stop(self):
+        self.stopper.set()
+        with self._lock:
+            for transcoder in self._running:
+                transcoder.cancel()
+        common.ProgressThread.stop(self)
+
+    def run(self):
+        pending = Queue.Queue()
+        for job in self.jobs:
+            if not self.overwrite and is_up_to_date(*job):
+                self.skipped.append(job)
+            else:
+                pending.put(job)
+        total = len(self.jobs)
+        count = pending.qsize()
+
+        results = Queue.Queue()
+        for i in xrange(min(self.workers, count)):
+            thread = threading.Thread(target=self._work,
+                    args=(pending, results),
+                    name='TranscodeQueue worker %d' % i)
+            thread.daemon = True
+            thread.start()
+
+        for i in xrange(count):
+            # wake up now and then to notice a stop request
+            while not self.stopper.is_set():
+                try:
+                    job, error = results.get(timeout=0.5)
+                    break
+                except Queue.Empty:
+                    pass
+            else:
+                return
+            if error is None:
+                self.transcoded.append(job)
+            else:
+                self.failed.append((job, error))
+            self.emit('progress-update',
+                    (len(self.skipped) + i + 1) * 100.0 / total)
+        self.emit('done')
+
+    def _work(self, pending, results):
+        transcoder = Transcoder(self.destformat, self.quality)
+        with self._lock:
+            self._running.add(transcoder)
+        try:
+            while not self.stopper.is_set():
+                try:
+                    job = pending.get_nowait()
+                except Queue.Empty:
+                    return
+                error = self._transcode(transcoder, *job)
+                if not self.stopper.is_set():
+                    results.put((job, error))
+        finally:
+            with self._lock:
+                self._running.discard(transcoder)
+
+    def _transcode(self, transcoder, source, dest):
+        """
+            Runs one job, returning the error it failed with or None
+        """
+        try:
+            if not transcoder.transcode_file(source, dest, self.tags):
+                return TranscodeError(_('Cancelled'))
+        except Exception as e:
+            logger.warning("Failed to transcode %s: %s", source, e)
+            return e
+
+
+def get_jobs(source, dest, destformat, extensions=None):
+    """
+        Returns the (source, dest) jobs mirroring the files below the
+        source directory to the dest directory, with the extension of
+        destformat.
+
+        :param extensions: the lowercase extensions (without the dot)
+            of the files to transcode, defaults to the formats known to
+            :mod:`xl.metadata`
+    """
+    if extensions is None:
+        extensions = metadata.formats.keys()
+    extensions = set(extensions)
+    newext = '.' + FORMATS[destformat]['extension']
+    jobs = []
+    for dirpath, dirnames, filenames in os.walk(source):
+        dirnames.sort()
+        reldir = os.path.relpath(dirpath, source)
+        for filename in sorted(filenames):
+            root, ext = os.path.splitext(filename)
+            if ext[1:].lower() not in extensions:
+                continue
+            jobs.append((os.path.join(dirpath, filename),
+                os.path.normpath(os.path.join(dest, reldir, root + newext))))
+    return jobs
+
+
+def main(args=None):
+    """
+        Command line interface: transcodes a directory tree without
+        starting Exaile. Run ``python -m xl.transcoder --help`` from the
+        source directory for usage.
+    """
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser(prog='python -m xl.transcoder',
+            description=_('Transcodes the audio files below SOURCE to '
+                'the same layout below DEST.'))
+    parser.add_argument('source', metavar='SOURCE')
+    parser.add_argument('dest', metavar='DEST')
+    parser.add_argument('-f', '--format', default='Ogg Vorbis',
+            help=_('output format, one of: %s') % ', '.join(sorted(FORMATS)))
+    parser.add_argument('-q', '--quality', type=float,
+            help=_('encoder setting, defaults to the format default'))
+    parser.add_argument('-j', '--jobs', type=int,
+            help=_('pipelines to run at once, defaults to the CPU count'))
+    parser.add_argument('--overwrite', action='store_true',
+            help=_('also transcode files whose output is up to date'))
+    parser.add_argument('--no-tags', dest='tags', action='store_false',
+            help=_('do not copy tags'))
+    args = parser.parse_args(args)
+
+    Gst.init(None)
+    formats = get_formats()
+    if args.format not in formats:
+        parser.error(_('Unsupported format: %s') % args.format)
+    quality = args.quality
+    if quality is not None:
+        steps = formats[args.format]['raw_steps']
+        quality = type(steps[0])(quality)
+        if quality not in steps:
+            parser.error(_('Quality must be one of: %s') %
+                    ', '.join(str(s) for s in steps))
+
+    jobs = get_jobs(args.source, args.dest, args.format)
+    queue = TranscodeQueue(jobs, args.format, quality, args.jobs,
+            args.overwrite, args.tags)
+
+    def on_progress(thread, percent):
+        sys.stdout.write('\r%3d%%' % percent)
+        sys.stdout.flush()
+
+    queue.connect('progress-update', on_progress)
+    queue.start()
+    try:
+        # a timeout keeps the main thread responsive to Ctrl+C
+        while queue.is_alive():
+            queue.join(0.5)
+    except KeyboardInterrupt:
+        queue.stop()
+        queue.join()
+    sys.stdout.write('\n')
+
+    for (source, dest), error in queue.failed:
+        sys.stderr.write('%s: %s\n' % (source, error))
+    print(_('%d transcoded, %d up to date, %d failed') % (
+        len(queue.transcoded), len(queue.skipped), len(queue.failed)))
+    return 1 if queue.failed else 0
+
+
+if __name__ == '__main__':
+    import sys
+    sys.exit(main())
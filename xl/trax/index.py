@@ -0,0 +1,251 @@
+# Copyright (C) 2008-2010 Adam Olsen
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2, or (at your option)
+# any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+#
+#
+# The developers of the Exaile media player hereby grant permission
+# for non-GPL compatible GStreamer and Exaile plugins to be used and
+# distributed together with GStreamer and Exaile. This permission is
+# above and beyond the permissions granted by the GPL license by which
+# Exaile is covered. If you modify this code, you may extend this
+# exception to your version of the code, but you are not obligated to
+# do so. If you do not wish to do so, delete this exception statement
+# from your version.
+
+"""
+Inverted index over the tag values of a set of tracks, used to speed
+up searches through a :class:`xl.trax.TrackDB`.
+"""
+
+from bisect import bisect_left, bisect_right
+import logging
+
+from xl import common
+
+logger = logging.getLogger(__name__)
+
+# Internal tags holding numbers. These are additionally kept as sorted
+# arrays so that < and > can be answered with a binary search.
+NUMERIC_TAGS = ('__rating', '__playcount', '__length', '__date_added',
+        '__last_played')
+
+# Indexed tags whose search value is derived from other tags, keyed by
+# the tag whose change affects them. See Track.get_tag_search.
+_DERIVED_TAGS = {
+    'artist': ('albumartist',),
+    '__compilation': ('albumartist',),
+    '__loc': ('__basename',),
+}
+
+
+def _search_values(track, tag):
+    """
+        Returns the values of tag as seen by the search matchers, as a
+        tuple. Missing tags are represented by None, and empty lists by
+        an empty tuple.
+    """
+    try:
+        vals = track.get_tag_search(tag, format=False)
+    except Exception:
+        logger.exception("Error indexing %s of %s", tag, track)
+        return (None,)
+    if vals == '__null__':
+        return (None,)
+    if isinstance(vals, list):
+        # an empty list matches nothing, not even __null__, just like
+        # in the matchers
+        return tuple(vals)
+    return (vals,)
+
+
+class TrackIndex(object):
+    """
+        Maps the search values of a set of tags to the tracks having
+        them.
+
+        Tags are indexed lazily the first time a search needs them and
+        are then kept up to date through :meth:`add_tracks`,
+        :meth:`remove_tracks` and :meth:`update_track`.
+
+        All lookup methods return the exact set of indexed tracks
+        matching the given condition.
+    """
+    def __init__(self, tracks=()):
+        self.tracks = set(tracks)
+        # tag -> {value: track or set of tracks}
+        self._values = {}
+        # track -> list of value tuples, one per indexed tag
+        self._track_values = {}
+        self._tag_pos = {}
+        # tag -> (sorted floats, values in the same order), None if stale
+        self._sorted = {}
+
+    @common.synchronized
+    def set_tracks(self, tracks):
+        """
+            Replaces the indexed tracks, dropping all indexed tags.
+        """
+        self.tracks = set(tracks)
+        self._values = {}
+        self._track_values = {}
+        self._tag_pos = {}
+        self._sorted = {}
+
+    @common.synchronized
+    def add_tracks(self, tracks):
+        for tr in tracks:
+            if tr in self.tracks:
+                self.update_track(tr)
+                continue
+            self.tracks.add(tr)
+            if self._tag_pos:
+                self._track_values[tr] = [None] * len(self._tag_pos)
+                for tag, pos in self._tag_pos.iteritems():
+                    self.__insert(tr, tag, pos)
+
+    @common.synchronized
+    def remove_tracks(self, tracks):
+        for tr in tracks:
+            try:
+                self.tracks.remove(tr)
+            except KeyError:
+                continue
+            values = self._track_values.pop(tr, None)
+            if values is None:
+                continue
+            for tag, pos in self._tag_pos.iteritems():
+                self.__discard(tr, tag, values[pos])
+
+    @common.synchronized
+    def update_track(self, track, tag=None):
+        """
+            Re-indexes a track after a tag changed.
+
+            :param tag: the tag that changed, or None to re-index all
+                indexed tags
+        """
+        if track not in self.tracks or not self._tag_pos:
+            return
+        if tag is None:
+            tags = self._tag_pos.keys()
+        else:
+            tags = (tag,) + _DERIVED_TAGS.get(tag, ())
+        values = self._track_values[track]
+        for tag in tags:
+            pos = self._tag_pos.get(tag)
+            if pos is None:
+                continue
+            self.__discard(track, tag, values[pos])
+            self.__insert(track, tag, pos)
+
+    def is_numeric(self, tag):
+        return tag in NUMERIC_TAGS
+
+    @common.synchronized
+    def match_values(self, tag, func):
+        """
+            Returns the tracks having at least one value of tag for which
+            func returns True. func is called once per distinct value,
+            with None standing for tracks that do not have the tag.
+        """
+        result = set()
+        for value, tracks in self.__get_values(tag).iteritems():
+            if func(value):
+                self.__update(result, tracks)
+        return result
+
+    @common.synchronized
+    def match_range(self, tag, low=None, high=None, include_null=False):
+        """
+            Returns the tracks having a numeric value of tag strictly
+            between low and high. Either bound may be None.
+
+            :param include_null: also return tracks without the tag
+        """
+        values = self.__get_values(tag)
+        floats, ordered = self.__get_sorted(tag)
+        start = 0 if low is None else bisect_right(floats, low)
+        end = len(floats) if high is None else bisect_left(floats, high)
+        result = set()
+        for value in ordered[start:end]:
+            self.__update(result, values[value])
+        if include_null and None in values:
+            self.__update(result, values[None])
+        return result
+
+    def __get_values(self, tag):
+        values = self._values.get(tag)
+        if values is None:
+            values = self._values[tag] = {}
+            pos = self._tag_pos[tag] = len(self._tag_pos)
+            for tr in self.tracks:
+                self._track_values.setdefault(tr, []).append(None)
+                self.__insert(tr, tag, pos)
+        return values
+
+    def __get_sorted(self, tag):
+        result = self._sorted.get(tag)
+        if result is None:
+            pairs = []
+            for value in self._values[tag]:
+                try:
+                    f = float(value)
+                except (TypeError, ValueError):
+                    continue
+                if f == f: # skip NaN, it can't be ordered
+                    pairs.append((f, value))
+            pairs.sort()
+            result = self._sorted[tag] = ([p[0] for p in pairs],
+                    [p[1] for p in pairs])
+        return result
+
+    @staticmethod
+    def __update(result, tracks):
+        if isinstance(tracks, set):
+            result.update(tracks)
+        else:
+            result.add(tracks)
+
+    def __insert(self, track, tag, pos):
+        vals = _search_values(track, tag)
+        self._track_values[track][pos] = vals
+        values = self._values[tag]
+        for val in vals:
+            # Most values belong to a single track, so avoid the
+            # overhead of a set until a second one shows up.
+            current = values.get(val)
+            if current is None:
+                values[val] = track
+                self._sorted.pop(tag, None)
+            elif isinstance(current, set):
+                current.add(track)
+            elif current is not track:
+                values[val] = set((current, track))
+
+    def __discard(self, track, tag, vals):
+        if vals is None:
+            return
+        values = self._values[tag]
+        for val in vals:
+            current = values.get(val)
+            if current is track:
+                del values[val]
+                self._sorted.pop(tag, None)
+            elif isinstance(current, set):
+                current.discard(track)
+                if len(current) == 1:
+                    values[val] = current.pop()
+
+# vim: et sts=4 sw=4
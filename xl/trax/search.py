@@ -42,6 +42,27 @@ class SearchResultTrack(object):
         self.track = track
         self.on_tags = []
 
+def _lower(value):
+    return value.lower()
+
+def _identity(value):
+    return value
+
+def _get_values(track, tag, lower):
+    """
+        Returns the search values of tag as a list passed through lower,
+        with None standing for a missing tag. This is what
+        :meth:`_Matcher.match` looks at.
+    """
+    vals = track.get_tag_search(tag, format=False)
+    if vals == '__null__':
+        return [None]
+    elif not isinstance(vals, list):
+        vals = [vals]
+    if lower is _identity:
+        return vals
+    return [None if v is None else lower(v) for v in vals]
+
 class _Matcher(object):
     """
         Base class for match conditions
@@ -72,10 +93,34 @@ class _Matcher(object):
     def _matches(self, value):
         raise NotImplementedError
 
+    def _value_matches(self, value):
+        if value is not None:
+            value = self.lower(value)
+        return self._matches(value)
+
+    def candidates(self, index):
+        """
+            Returns the set of tracks in a
+            :class:`xl.trax.index.TrackIndex` that match this
+            condition, or None if the index cannot be used.
+        """
+        return index.match_values(self.tag, self._value_matches)
+
 class _ExactMatcher(_Matcher):
     """
         Condition for exact matches
     """
+    def candidates(self, index):
+        if index.is_numeric(self.tag) and self.content is not None:
+            try:
+                content = float(self.content)
+            except (TypeError, ValueError):
+                pass
+            else:
+                return index.match_range(self.tag, content - 0.0001,
+                        content + 0.0001)
+        return _Matcher.candidates(self, index)
+
     def _matches(self, value):
         if self.tag.startswith("__"):
             try:
@@ -110,6 +155,9 @@ class _RegexMatcher(_Matcher):
         _Matcher.__init__(self, tag, content, lower)
         self._re = re.compile(content)
 
+    def candidates(self, index):
+        return None
+
     def _matches(self, value):
         if not value:
             return False
@@ -122,6 +170,15 @@ class _GtMatcher(_Matcher):
     """
         Condition for greater than matches.
     """
+    def candidates(self, index):
+        if not index.is_numeric(self.tag):
+            return _Matcher.candidates(self, index)
+        try:
+            content = float(self.content)
+        except (TypeError, ValueError):
+            return set()
+        return index.match_range(self.tag, low=content)
+
     def _matches(self, value):
         try:
             value = float(value)
@@ -134,6 +191,17 @@ class _LtMatcher(_Matcher):
     """
         Condition for less than matches.
     """
+    def candidates(self, index):
+        if not index.is_numeric(self.tag):
+            return _Matcher.candidates(self, index)
+        try:
+            content = float(self.content)
+        except (TypeError, ValueError):
+            return set()
+        # tracks without the tag count as 0
+        return index.match_range(self.tag, high=content,
+                include_null=0 < content)
+
     def _matches(self, value):
         try:
             if value is None:
@@ -157,6 +225,12 @@ class _NotMetaMatcher(object):
     def match(self, srtrack):
         return not self.matcher.match(srtrack)
 
+    def candidates(self, index):
+        found = _get_candidates(self.matcher, index)
+        if found is None:
+            return None
+        return index.tracks - found
+
 class _OrMetaMatcher(object):
     """
         Condition for boolean OR
@@ -169,6 +243,15 @@ class _OrMetaMatcher(object):
     def match(self, srtrack):
         return self.left.match(srtrack) or self.right.match(srtrack)
 
+    def candidates(self, index):
+        left = _get_candidates(self.left, index)
+        if left is None:
+            return None
+        right = _get_candidates(self.right, index)
+        if right is None:
+            return None
+        return left | right
+
 class _MultiMetaMatcher(object):
     """
         Condition for boolean AND
@@ -184,6 +267,17 @@ class _MultiMetaMatcher(object):
                 return False
         return True
 
+    def candidates(self, index):
+        result = None
+        for ma in self.matchers:
+            found = _get_candidates(ma, index)
+            if found is None:
+                return None
+            result = found if result is None else result & found
+        if result is None:
+            return set(index.tracks)
+        return result
+
 class _ManyMultiMetaMatcher(object):
     """
         TODO: think of a proper docstring for this
@@ -211,12 +305,21 @@ class _ManyMultiMetaMatcher(object):
                     self.tags.update(ma.tags)
         return matched
 
+    def candidates(self, index):
+        result = set()
+        for ma in self.matchers:
+            found = _get_candidates(ma, index)
+            if found is None:
+                return None
+            result |= found
+        return result
+
 class TracksMatcher(object):
     """
         Holds criteria and determines whether
         a given track matches those criteria.
     """
-    __slots__ = ['matchers', 'case_sensitive', 'keyword_tags']
+    __slots__ = ['matchers', 'case_sensitive', 'keyword_tags', '_compiled']
     def __init__(self, search_string, case_sensitive=True, keyword_tags=None):
         """
             :param search_string: a string describing the match conditions
@@ -230,8 +333,8 @@ class TracksMatcher(object):
         search_string = shave_marks(search_string)
         tokens = self.__tokenize_query(search_string)
         tokens = self.__red(tokens)
-        tokens = self.__optimize_tokens(tokens)
         self.matchers = self.__tokens_to_matchers(tokens)
+        self._compiled = None
 
     def append_matcher(self, matcher, or_match=False):
         '''Here so you can use playlist matchers. Probably needs better impl'''
@@ -239,6 +342,7 @@ class TracksMatcher(object):
             self.matchers.append(matcher)
         else:
             self.matchers[-1] = _OrMetaMatcher(self.matchers[-1], matcher)
+        self._compiled = None
 
     def prepend_matcher(self, matcher, or_match=False):
         '''Here so you can use playlist matchers. Probably needs better impl'''
@@ -246,12 +350,22 @@ class TracksMatcher(object):
             self.matchers.insert(0, matcher)
         else:
             self.matchers[0] = _OrMetaMatcher(matcher, self.matchers[0])
+        self._compiled = None
 
     def match(self, srtrack):
         """
             Determine whether a given SearchResultTrack's internal
             Track object matches this search condition.
         """
+        if self._compiled is None:
+            self._compiled = _compile_query(self.matchers)
+        return self._compiled(srtrack)
+
+    def _match_uncompiled(self, srtrack):
+        """
+            Same as :meth:`match`, but checks each condition in turn
+            instead of using the compiled query plan.
+        """
         for ma in self.matchers:
             if not ma.match(srtrack):
                 break
@@ -306,10 +420,12 @@ class TracksMatcher(object):
 
         # normal token
         else:
+            # use module-level functions so that conditions of the same
+            # query can share cached tag values
             if not self.case_sensitive:
-                lower = lambda x: x.lower()
+                lower = _lower
             else:
-                lower = lambda x: x
+                lower = _identity
 
             # TODO: this stuff is kinda repetitive, can we consolidate
             # it? Maybe move some of this into the matcher classes?
@@ -454,15 +570,6 @@ class TracksMatcher(object):
 
         return self.__red(tokens)
 
-    def __optimize_tokens(self, tokens):
-        """
-            Attempt to optimize tokens, to speed up matching.
-        """
-        # longer queries tend to reject more tracks, which speeds up
-        # processing, so we put them first.
-        tokens.sort(key=len)
-        return tokens
-
 
 class TracksInList(object):
     '''
@@ -480,6 +587,9 @@ class TracksInList(object):
     def match(self, track):
         return track.track in self._tracks
 
+    def candidates(self, index):
+        return index.tracks & self._tracks
+
 
 class TracksNotInList(TracksInList):
     '''
@@ -488,17 +598,209 @@ class TracksNotInList(TracksInList):
     def match(self, track):
         return track.track not in self._tracks
 
+    def candidates(self, index):
+        return index.tracks - self._tracks
+
 
-def search_tracks(trackiter, trackmatchers):
+def _estimate_cost(matcher):
+    """
+        Rough guess of how expensive a condition is to check relative
+        to how many tracks it rejects. Cheap and selective conditions
+        are checked first.
+    """
+    if isinstance(matcher, _ExactMatcher):
+        return 1
+    elif isinstance(matcher, _InMatcher):
+        return 2
+    elif isinstance(matcher, (_GtMatcher, _LtMatcher)):
+        return 4
+    elif isinstance(matcher, _RegexMatcher):
+        return 8
+    elif isinstance(matcher, _ManyMultiMetaMatcher):
+        return 2 * len(matcher.matchers)
+    elif isinstance(matcher, _MultiMetaMatcher):
+        return min([_estimate_cost(ma) for ma in matcher.matchers] or [1])
+    elif isinstance(matcher, _OrMetaMatcher):
+        return _estimate_cost(matcher.left) + _estimate_cost(matcher.right)
+    elif isinstance(matcher, _NotMetaMatcher):
+        # negated conditions usually let most tracks through
+        return 10 + _estimate_cost(matcher.matcher)
+    return 5
+
+def _compile_query(matchers):
+    """
+        Compiles the conditions of a :class:`TracksMatcher` into a single
+        callable that behaves like :meth:`TracksMatcher.match`.
+
+        Tag values are fetched at most once per track, and the tags that
+        matched are only worked out for tracks that match as a whole.
+    """
+    match = _compile_all(matchers)
+    recorders = []
+    for ma in matchers:
+        tag = getattr(ma, 'tag', None)
+        if tag is not None:
+            recorders.append(lambda srtr, cache, tag=tag: (tag,))
+        elif type(ma) is _ManyMultiMetaMatcher and \
+                _is_simple_keyword(ma):
+            tagfuncs = [(m.tag, _compile(m)) for m in ma.matchers]
+            recorders.append(lambda srtr, cache, tagfuncs=tagfuncs:
+                    [tag for tag, func in tagfuncs if func(srtr, cache)])
+        elif hasattr(ma, 'tags'):
+            # evaluated by its own match(), which stored the tags
+            recorders.append(lambda srtr, cache, ma=ma: ma.tags)
+
+    def match_query(srtr):
+        cache = {}
+        if not match(srtr, cache):
+            return False
+        on_tags = srtr.on_tags
+        for recorder in recorders:
+            for tag in recorder(srtr, cache):
+                if tag not in on_tags:
+                    on_tags.append(tag)
+        return True
+    return match_query
+
+def _is_simple_keyword(matcher):
+    """
+        Whether all parts of a keyword matcher are plain tag conditions
+    """
+    return all(isinstance(ma, _Matcher) and ma.tag
+            for ma in matcher.matchers)
+
+def _compile_all(matchers):
+    """
+        Compiles a list of conditions that must all match into a single
+        callable taking a SearchResultTrack and a dict used to cache tag
+        values.
+    """
+    funcs = tuple(_compile(ma) for ma in
+            sorted(matchers, key=_estimate_cost))
+    if len(funcs) == 1:
+        return funcs[0]
+    def match_all(srtr, cache):
+        for func in funcs:
+            if not func(srtr, cache):
+                return False
+        return True
+    return match_all
+
+def _compile(matcher):
+    """
+        Compiles a condition into a callable taking a SearchResultTrack
+        and a dict used to cache tag values. Unlike the match() methods,
+        the result does not keep track of which tags matched.
+    """
+    cls = type(matcher)
+    if isinstance(matcher, _Matcher):
+        tag, lower, content = matcher.tag, matcher.lower, matcher.content
+        key = (tag, lower)
+        def values(srtr, cache):
+            vals = cache.get(key)
+            if vals is None:
+                vals = cache[key] = _get_values(srtr.track, tag, lower)
+            return vals
+
+    if cls is _ExactMatcher and not tag.startswith('__'):
+        return lambda srtr, cache: content in values(srtr, cache)
+    elif cls is _InMatcher:
+        def match_in(srtr, cache):
+            for value in values(srtr, cache):
+                if value:
+                    try:
+                        if content in value:
+                            return True
+                    except TypeError:
+                        pass
+            return False
+        return match_in
+    elif isinstance(matcher, _Matcher):
+        matches = matcher._matches
+        def match_values(srtr, cache):
+            for value in values(srtr, cache):
+                if matches(value):
+                    return True
+            return False
+        return match_values
+    elif cls is _NotMetaMatcher:
+        inner = _compile(matcher.matcher)
+        return lambda srtr, cache: not inner(srtr, cache)
+    elif cls is _OrMetaMatcher:
+        left, right = _compile(matcher.left), _compile(matcher.right)
+        return lambda srtr, cache: left(srtr, cache) or right(srtr, cache)
+    elif cls is _MultiMetaMatcher:
+        return _compile_all(matcher.matchers)
+    elif cls is _ManyMultiMetaMatcher and _is_simple_keyword(matcher):
+        # stop at the first tag that matches; the tags are only needed
+        # for tracks that end up matching
+        funcs = tuple(_compile(ma) for ma in matcher.matchers)
+        def match_any(srtr, cache):
+            for func in funcs:
+                if func(srtr, cache):
+                    return True
+            return False
+        return match_any
+    return lambda srtr, cache: matcher.match(srtr)
+
+def _get_candidates(matcher, index):
+    """
+        Returns the exact set of indexed tracks matching matcher, or None
+        if that cannot be determined from the index.
+    """
+    candidates = getattr(matcher, 'candidates', None)
+    if candidates is None:
+        return None
+    try:
+        return candidates(index)
+    except Exception:
+        # let the linear search deal with (and report) this
+        return None
+
+def _find_candidates(trackmatchers, index):
+    """
+        Returns a set holding at least all indexed tracks matching all of
+        trackmatchers, or None if the index does not narrow them down.
+    """
+    result = None
+    for tma in trackmatchers:
+        if isinstance(tma, TracksMatcher):
+            found = _find_candidates(tma.matchers, index)
+        else:
+            found = _get_candidates(tma, index)
+        if found is not None:
+            result = found if result is None else result & found
+    return result
+
+def search_tracks(trackiter, trackmatchers, index=None):
     """
         Search a set of tracks for those that match specified conditions.
 
         :param trackiter: An iterable object returning Track objects
         :param trackmatchers: A list of TrackMatcher objects
+        :param index: A :class:`xl.trax.index.TrackIndex` used to skip
+            tracks that cannot match. Defaults to the index of trackiter
+            if it is a :class:`xl.trax.TrackDB`.
     """
+    if index is None:
+        index = getattr(trackiter, 'tag_index', None)
+    candidates = None
+    if index is not None:
+        candidates = _find_candidates(trackmatchers, index)
+        if candidates is not None and index is getattr(trackiter,
+                'tag_index', None):
+            # only the candidates can match, no need to look further
+            trackiter = candidates
+            indexed = ()
+        else:
+            indexed = index.tracks
+
     for srtr in trackiter:
         if not isinstance(srtr, SearchResultTrack):
             srtr = SearchResultTrack(srtr)
+        if candidates is not None and srtr.track in indexed and \
+                srtr.track not in candidates:
+            continue
         for tma in trackmatchers:
             if not tma.match(srtr):
                 break
@@ -515,7 +817,7 @@ def search_tracks(trackiter, trackmatchers):
 
 
 def search_tracks_from_string(trackiter, search_string,
-        case_sensitive=True, keyword_tags=None):
+        case_sensitive=True, keyword_tags=None, index=None):
     """
         Convenience wrapper around search_tracks that builds matchers
         automatically from the search string.
@@ -525,7 +827,7 @@ def search_tracks_from_string(trackiter, search_string,
     """
     matchers = [TracksMatcher(search_string, case_sensitive=case_sensitive,
         keyword_tags=keyword_tags)]
-    return search_tracks(trackiter, matchers)
+    return search_tracks(trackiter, matchers, index)
 
 
 def match_track_from_string(track, search_string,
@@ -25,7 +25,6 @@
 # do so. If you do not wish to do so, delete this exception statement
 # from your version.
 
-from copy import deepcopy
 from gi.repository import Gio
 from gi.repository import GLib
 import logging
@@ -68,6 +67,63 @@ _UNKNOWNSTR = _("Unknown")
 #TRANSLATORS: String multiple tag values will be joined by
 _JOINSTR = _(u' / ')
 
+# Internal tags holding numbers, stored as such whatever they are set to
+NUMERIC_TAGS = frozenset(('__length', '__playcount', '__rating',
+    '__modified', '__date_added', '__last_played'))
+
+# Tags whose values tend to be shared by many tracks. Their values are
+# stored once in _POOL, along with all tag names.
+SHARED_TAGS = frozenset(('artist', 'albumartist', 'album', 'genre',
+    'date', 'originaldate', 'composer', 'performer', 'arranger',
+    'conductor', 'lyricist', 'originalartist', 'originalalbum',
+    'grouping', 'label', 'organization', 'language', 'version',
+    'tracknumber', 'discnumber', 'artistsort', 'albumartistsort',
+    'albumsort', 'composersort', '__basedir', '__encoding'))
+
+_POOL = {}
+
+def _intern(value):
+    """
+        Returns the pooled copy of a tag name or value
+    """
+    return _POOL.setdefault(value, value)
+
+def _to_number(value):
+    if isinstance(value, list) and len(value) == 1:
+        value = value[0]
+    if isinstance(value, basestring):
+        try:
+            return int(value)
+        except ValueError:
+            try:
+                return float(value)
+            except ValueError:
+                pass
+    return value
+
+def _compact(tag, values):
+    """
+        Returns the representation of a tag value kept by a Track.
+
+        Values of normal tags are given as lists. A single value is
+        stored by itself and several values as a tuple, both of which
+        :meth:`Track.__get` turns back into a list.
+    """
+    if tag.startswith('__'):
+        if tag in NUMERIC_TAGS:
+            return _to_number(values)
+        if tag in SHARED_TAGS and isinstance(values, basestring):
+            return _intern(values)
+        return values
+    if not isinstance(values, list):
+        return values
+    if tag in SHARED_TAGS:
+        values = [_intern(v) if isinstance(v, basestring) else v
+                for v in values]
+    if len(values) == 1:
+        return values[0]
+    return tuple(values)
+
 
 class _MetadataCacher(object):
     """
@@ -132,7 +188,7 @@ class Track(object):
     """
     # save a little memory this way
     __slots__ = ["__tags", "_scan_valid",
-            "_dirty", "__weakref__", "_init"]
+            "_dirty", "__weakref__", "_init", "_sort_cache", "_revision"]
     # this is used to enforce the one-track-per-uri rule
     __tracksdict = weakref.WeakValueDictionary()
     # store a copy of the settings values here - much faster (0.25 cpu
@@ -223,6 +279,8 @@ class Track(object):
         self.__tags = {}
         self._scan_valid = None # whether our last tag read attempt worked
         self._dirty = False
+        self._sort_cache = None # see __get_sort_cache
+        self._revision = 0 # incremented on every tag change
 
         if _unpickles:
             self._unpickles(_unpickles)
@@ -260,6 +318,8 @@ class Track(object):
         self.__unregister()
         gloc = Gio.File.new_for_commandline_arg(loc)
         self.__tags['__loc'] = gloc.get_uri()
+        self._sort_cache = None
+        self._revision += 1
         self.__register()
         event.log_event('track_tags_changed', self, '__loc')
 
@@ -342,7 +402,7 @@ class Track(object):
             f = metadata.get_format(self.get_loc_for_io())
             if f is None:
                 return False # not a supported type
-            f.write_tags(self.__tags)
+            f.write_tags(self._pickles())
             return f
         except IOError as e:
             # error writing to the file, probably
@@ -437,7 +497,7 @@ class Track(object):
 
             internal use only please
         """
-        return deepcopy(self.__tags)
+        return dict((tag, self.__get(tag)) for tag in self.__tags)
 
     def _unpickles(self, pickle_obj):
         """
@@ -445,7 +505,13 @@ class Track(object):
 
             internal use only please
         """
-        self.__tags = deepcopy(pickle_obj)
+        tags = {}
+        for tag, values in pickle_obj.iteritems():
+            if values is not None:
+                tags[_intern(tag)] = _compact(tag, values)
+        self.__tags = tags
+        self._sort_cache = None
+        self._revision += 1
 
     def list_tags(self):
         """
@@ -494,8 +560,11 @@ class Track(object):
             except KeyError:
                 pass
         else:
-            self.__tags[tag] = values
+            self.__tags[_intern(tag)] = _compact(tag, values)
 
+        # sort values may depend on other tags, so drop them all
+        self._sort_cache = None
+        self._revision += 1
         self._dirty = True
         if notify_changed:
             event.log_event("track_tags_changed", self, tag)
@@ -514,13 +583,28 @@ class Track(object):
         elif tag == '__startoffset': # necessary?
             value = self.__tags.get(tag, 0)
         else:
-            value = self.__tags.get(tag)
+            value = self.__get(tag)
 
         if join and value and not tag.startswith('__'):
             return self.join_values(value)
 
         return value
 
+    def __get(self, tag, default=None):
+        """
+            Returns the stored value of a tag, normal tags as a new list
+        """
+        value = self.__tags.get(tag)
+        if value is None:
+            return default
+        if tag.startswith('__'):
+            if isinstance(value, list):
+                return list(value)
+            return value
+        if isinstance(value, tuple):
+            return list(value)
+        return [value]
+
     def get_tag_sort(self, tag, join=True, artist_compilations=False,
             extend_title=True):
         """
@@ -534,20 +618,63 @@ class Track(object):
                 tag=="albumartist".
             :param extend_title: If the title tag is unknown, try to
                 add some identifying information to it.
+
+            Joined values are cached until a tag of the track or the
+            list of strings to cut from the start of values changes.
+        """
+        if not join:
+            return self.__get_tag_sort(tag, False, artist_compilations)
+        cache = self.__get_sort_cache()
+        key = (tag, artist_compilations)
+        value = cache.get(key, cache)
+        if value is cache:
+            value = cache[key] = self.__get_tag_sort(tag, True,
+                    artist_compilations)
+        return value
+
+    def get_sort_key(self, fields, artist_compilations=False):
+        """
+            Get the sort values of several tags at once, as used by
+            :func:`xl.trax.sort_tracks`. Cached like :meth:`get_tag_sort`.
+
+            :param fields: tuple of tag names
+            :param artist_compilations: see :meth:`get_tag_sort`
+            :returns: tuple of sort values
+        """
+        cache = self.__get_sort_cache()
+        key = (fields, artist_compilations)
+        value = cache.get(key)
+        if value is None:
+            value = cache[key] = tuple([self.get_tag_sort(field,
+                artist_compilations=artist_compilations)
+                for field in fields])
+        return value
+
+    def __get_sort_cache(self):
         """
+            Returns the dictionary caching the sort values of this track
+        """
+        # The values depend on the_cuts, which _the_cuts_cb replaces
+        # by a new list when the setting changes.
+        cache = self._sort_cache
+        if cache is None or cache[0] is not self.__the_cuts:
+            cache = self._sort_cache = (self.__the_cuts, {})
+        return cache[1]
+
+    def __get_tag_sort(self, tag, join, artist_compilations):
         # The two magic values here are to ensure that compilations
         # and unknown values are always sorted below all normal
         # values.
         value = None
-        sorttag = self.__tags.get(tag + "sort")
+        sorttag = self.__get(tag + "sort")
         if sorttag and tag != "albumartist":
             value = sorttag
         elif tag == "albumartist":
-            if artist_compilations and self.__tags.get('__compilation'):
-                value = self.__tags.get('albumartist',
+            if artist_compilations and self.__get('__compilation'):
+                value = self.__get('albumartist',
                         u"\uffff\uffff\uffff\ufffe")
             else:
-                value = self.__tags.get('artist',
+                value = self.__get('artist',
                         u"\uffff\uffff\uffff\uffff")
             if sorttag and value not in (u"\uffff\uffff\uffff\ufffe",
                     u"\uffff\uffff\uffff\uffff"):
@@ -555,21 +682,21 @@ class Track(object):
             else:
                 sorttag = None
         elif tag in ('tracknumber', 'discnumber'):
-            value = self.split_numerical(self.__tags.get(tag))[0]
+            value = self.split_numerical(self.__get(tag))[0]
         elif tag in ('__length', '__playcount'):
-            value = self.__tags.get(tag, 0)
+            value = self.__get(tag, 0)
         elif tag == 'bpm':
             try:
-                value = int(self.__tags.get(tag, [0])[0])
+                value = int(self.__get(tag, [0])[0])
             except ValueError:
-                digits = re.search(r'\d+\.?\d*', self.__tags.get(tag, [0])[0])
+                digits = re.search(r'\d+\.?\d*', self.__get(tag, [0])[0])
                 if digits:
                     value = float(digits.group())
         elif tag == '__basename':
             # TODO: Check if unicode() is required
             value = self.get_basename()
         else:
-            value = self.__tags.get(tag)
+            value = self.__get(tag)
 
         if not value:
             value = u"\uffff\uffff\uffff\uffff" # unknown
@@ -610,16 +737,16 @@ class Track(object):
 
         value = None
         if tag == "albumartist":
-            if artist_compilations and self.__tags.get('__compilation'):
-                value = self.__tags.get('albumartist', _VARIOUSARTISTSSTR)
+            if artist_compilations and self.__get('__compilation'):
+                value = self.__get('albumartist', _VARIOUSARTISTSSTR)
             else:
-                value = self.__tags.get('artist', _UNKNOWNSTR)
+                value = self.__get('artist', _UNKNOWNSTR)
         elif tag in ('tracknumber', 'discnumber'):
-            value = self.split_numerical(self.__tags.get(tag))[0] or u""
+            value = self.split_numerical(self.__get(tag))[0] or u""
         elif tag in ('__length', '__startoffset', '__stopoffset'):
-            value = self.__tags.get(tag, u"")
+            value = self.__get(tag, u"")
         elif tag in ('__rating', '__playcount'):
-            value = self.__tags.get(tag, u"0")
+            value = self.__get(tag, u"0")
         elif tag == '__bitrate':
             try:
                 value = int(self.__tags['__bitrate']) // 1000
@@ -633,7 +760,7 @@ class Track(object):
         elif tag == '__basename':
             value = self.get_basename_display()
         else:
-            value = self.__tags.get(tag)
+            value = self.__get(tag)
 
         if value is None:
             value = ''
@@ -669,16 +796,16 @@ class Track(object):
         """
         extraformat = ""
         if tag == "albumartist":
-            if artist_compilations and self.__tags.get('__compilation'):
-                value = self.__tags.get('albumartist', None)
+            if artist_compilations and self.__get('__compilation'):
+                value = self.__get('albumartist', None)
                 tag = 'albumartist'
                 extraformat += " ! __compilation==__null__"
             else:
-                value = self.__tags.get('artist')
+                value = self.__get('artist')
         elif tag in ('tracknumber', 'discnumber'):
-            value = self.split_numerical(self.__tags.get(tag))[0]
+            value = self.split_numerical(self.__get(tag))[0]
         elif tag in ('__length', '__playcount', '__rating', '__startoffset', '__stopoffset'):
-            value = self.__tags.get(tag, 0)
+            value = self.__get(tag, 0)
         elif tag == '__bitrate':
             try:
                 value = int(self.__tags['__bitrate']) // 1000
@@ -691,7 +818,7 @@ class Track(object):
         elif tag == '__basename':
             value = self.get_basename()
         else:
-            value = self.__tags.get(tag)
+            value = self.__get(tag)
 
         # Quote arguments
         if value is None:
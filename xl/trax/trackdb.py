@@ -26,16 +26,19 @@
 
 from __future__ import absolute_import
 
+import cPickle
 import logging
+import os
 import shelve
-
-from copy import deepcopy
+import sqlite3
+import whichdb
 
 from gi.repository import GLib
 
 from xl import common, event
 from xl.nls import gettext as _
 
+from xl.trax.index import TrackIndex
 from xl.trax.track import Track
 from xl.trax.util import sort_tracks
 from xl.trax.search import search_tracks_from_string
@@ -43,6 +46,31 @@ from xl.trax.search import search_tracks_from_string
 logger = logging.getLogger(__name__)
 
 
+def _is_shelve_db(location):
+    """
+        Returns whether location holds a database in the old shelve
+        based format.
+    """
+    # whichdb returns None for missing files and '' for files it does
+    # not know about, which includes SQLite databases.
+    return bool(whichdb.whichdb(location))
+
+def _open_store(location):
+    """
+        Opens (and if necessary creates) the SQLite database used to
+        store a :class:`TrackDB`.
+
+        Every track is kept in its own row keyed by the TrackDB key, so
+        that changed tracks can be written without touching the rest.
+    """
+    db = sqlite3.connect(location)
+    db.execute('CREATE TABLE IF NOT EXISTS tracks '
+            '(key INTEGER PRIMARY KEY, data BLOB NOT NULL)')
+    db.execute('CREATE TABLE IF NOT EXISTS meta '
+            '(name TEXT PRIMARY KEY, data BLOB NOT NULL)')
+    return db
+
+
 class TrackHolder(object):
     def __init__(self, track, key, **kwargs):
         self._track = track
@@ -103,6 +131,9 @@ class TrackDB(object):
         self._dbversion = 2.0
         self._dbminorversion = 0
         self._deleted_keys = []
+        #: :class:`xl.trax.index.TrackIndex` used to speed up searches
+        self.tag_index = TrackIndex()
+        event.add_callback(self._on_track_tags_changed, 'track_tags_changed')
         if location:
             self.load_from_location()
             self._timeout_save()
@@ -163,8 +194,13 @@ class TrackDB(object):
     @common.synchronized
     def load_from_location(self, location=None):
         """
-            Restores :class:`TrackDB` state from the pickled representation
-            stored at the specified location.
+            Restores :class:`TrackDB` state from the database stored at
+            the specified location.
+
+            Databases written by older versions of Exaile (a shelve of
+            pickled tracks) are migrated and converted to the current
+            storage format on the fly; the original file is kept next
+            to the new one with a ``-shelve.bak`` suffix.
 
             :param location: the location to load the data from
             :type location: string
@@ -176,7 +212,78 @@ class TrackDB(object):
                     _("You did not specify a location to load the db from"))
 
         logger.debug("Loading %s DB from %s." % (self.name, location))
-                    
+
+        if _is_shelve_db(location):
+            if not self._load_from_shelve(location):
+                return
+            self._convert_shelve_db(location)
+        elif not self._load_from_store(location):
+            return
+
+        self.tag_index.set_tracks(tr._track for tr in self.tracks.itervalues())
+        self._dirty = False
+
+    def _load_from_store(self, location):
+        """
+            Loads all tracks and attributes from the database at
+            location in one pass.
+
+            :returns: whether loading succeeded
+        """
+        try:
+            db = _open_store(location)
+        except Exception:
+            logger.exception("Failed to open music DB.")
+            return False
+
+        try:
+            meta = dict((name, cPickle.loads(str(data))) for name, data in
+                    db.execute('SELECT name, data FROM meta'))
+            dbversion = meta.get('_dbversion', self._dbversion)
+            if int(dbversion) > int(self._dbversion):
+                raise common.VersionError(
+                        "DB was created on a newer Exaile version.")
+
+            for attr in self.pickle_attrs:
+                try:
+                    if 'tracks' == attr:
+                        data = {}
+                        rows = db.execute('SELECT key, data FROM tracks').fetchall()
+                        for key, row in rows:
+                            p = cPickle.loads(str(row))
+                            tr = Track(_unpickles=p[0])
+                            loc = tr.get_loc_for_io()
+                            if loc not in data:
+                                data[loc] = TrackHolder(tr, p[1], **p[2])
+                            else:
+                                logger.warning("Duplicate track found: %s" % loc)
+                                # presumably the second track was written
+                                # because of an error, so use the first
+                                # track found.
+                                self._deleted_keys.append(key)
+                        setattr(self, attr, data)
+                    elif attr in meta:
+                        setattr(self, attr, meta[attr])
+                except Exception:
+                    # FIXME: Do something about this
+                    logger.exception("Exception occurred while loading %s" % location)
+        except common.VersionError:
+            raise
+        except Exception:
+            logger.exception("Failed to read music DB.")
+            return False
+        finally:
+            db.close()
+
+        return True
+
+    def _load_from_shelve(self, location):
+        """
+            Loads a database stored in the old shelve format, running
+            any migrations needed to bring it up to date.
+
+            :returns: whether loading succeeded
+        """
         try:
             try:
                 pdata = shelve.open(location, flag='c',
@@ -201,7 +308,7 @@ class TrackDB(object):
             raise
         except Exception:
             logger.exception("Failed to open music DB.")
-            return
+            return False
 
         for attr in self.pickle_attrs:
             try:
@@ -229,13 +336,42 @@ class TrackDB(object):
 
         pdata.close()
 
-        self._dirty = False
+        return True
+
+    def _convert_shelve_db(self, location):
+        """
+            Writes the freshly loaded contents of an old shelve database
+            to a new store and moves the old files out of the way.
+        """
+        logger.info("Converting %s DB to the new storage format..." % self.name)
+        newloc = location + ".new"
+        try:
+            if os.path.exists(newloc):
+                os.remove(newloc)
+            self._write_store(newloc, full=True)
+
+            # shelve may have used a dbm flavour that spreads the
+            # database over several files, so move all of them.
+            for ext in ('', '.db', '.pag', '.dir', '.dat', '.bak'):
+                if os.path.isfile(location + ext):
+                    backup = location + ext + "-shelve.bak"
+                    if os.path.exists(backup):
+                        os.remove(backup)
+                    os.rename(location + ext, backup)
+            os.rename(newloc, location)
+        except Exception:
+            logger.exception("Failed to convert music DB, keeping the old one.")
+            return
+
+        self._deleted_keys = []
 
     @common.synchronized
     def save_to_location(self, location=None):
         """
-            Saves a pickled representation of this :class:`TrackDB` to the
-            specified location.
+            Saves this :class:`TrackDB` to the specified location.
+
+            Only tracks that were modified or added since the last save
+            and tracks that were removed are written.
 
             :param location: the location to save the data to
             :type location: string
@@ -262,48 +398,72 @@ class TrackDB(object):
         logger.debug("Saving %s DB to %s." % (self.name, location))
 
         try:
-            try:
-                pdata = shelve.open(location, flag='c',
-                        protocol=common.PICKLE_PROTOCOL)
-            except ImportError:
-                import bsddb3
-                _db = bsddb3.hashopen(location, 'c')
-                pdata = shelve.Shelf(_db, protocol=common.PICKLE_PROTOCOL)
-            if pdata.get('_dbversion', self._dbversion) > self._dbversion:
+            if not self._write_store(location):
+                return
+        finally:
+            self._saving = False
+
+        for track in self.tracks.itervalues():
+            track._track._dirty = False
+
+        self._deleted_keys = []
+        self._dirty = False
+
+    def _write_store(self, location, full=False):
+        """
+            Writes changed tracks and attributes to the store at
+            location in a single transaction.
+
+            :param full: write every track, not just the changed ones
+            :returns: whether writing succeeded
+        """
+        try:
+            db = _open_store(location)
+            row = db.execute('SELECT data FROM meta WHERE name = ?',
+                    ('_dbversion',)).fetchone()
+            if row and cPickle.loads(str(row[0])) > self._dbversion:
                 raise common.VersionError("DB was created on a newer Exaile.")
         except Exception:
             logger.exception("Failed to open music DB for writing.")
-            return
+            return False
 
-        for attr in self.pickle_attrs:
-            # bad hack to allow saving of lists/dicts of Tracks
-            if 'tracks' == attr:
-                for k, track in self.tracks.iteritems():
-                    key = "tracks-%s" % track._key
-                    if track._track._dirty or key not in pdata:
-                        pdata[key] = (
-                            track._track._pickles(),
-                            track._key,
-                            deepcopy(track._attrs)
-                        )
-            else:
-                pdata[attr] = deepcopy(getattr(self, attr))
-
-        pdata['_dbversion'] = self._dbversion
-
-        for key in self._deleted_keys:
-            key = "tracks-%s" % key
-            if key in pdata:
-                del pdata[key]
-
-        pdata.sync()
-        pdata.close()
+        def dumps(obj):
+            return sqlite3.Binary(cPickle.dumps(obj, common.PICKLE_PROTOCOL))
 
-        for track in self.tracks.itervalues():
-            track._track._dirty = False
+        try:
+            with db:
+                stored = set()
+                if not full:
+                    stored.update(k for (k,) in
+                            db.execute('SELECT key FROM tracks'))
+
+                for attr in self.pickle_attrs:
+                    # bad hack to allow saving of lists/dicts of Tracks
+                    if 'tracks' == attr:
+                        db.executemany('INSERT OR REPLACE INTO tracks '
+                                '(key, data) VALUES (?, ?)',
+                            ((track._key, dumps((track._track._pickles(),
+                                track._key, track._attrs)))
+                            for track in self.tracks.itervalues()
+                            if full or track._track._dirty or
+                                track._key not in stored))
+                    else:
+                        db.execute('INSERT OR REPLACE INTO meta (name, data) '
+                                'VALUES (?, ?)',
+                                (attr, dumps(getattr(self, attr))))
+
+                db.execute('INSERT OR REPLACE INTO meta (name, data) '
+                        'VALUES (?, ?)', ('_dbversion', dumps(self._dbversion)))
+
+                db.executemany('DELETE FROM tracks WHERE key = ?',
+                        ((key,) for key in self._deleted_keys))
+        except Exception:
+            logger.exception("Failed to write music DB.")
+            return False
+        finally:
+            db.close()
 
-        self._dirty = False
-        self._saving = False
+        return True
 
     def get_track_by_loc(self, loc, raw=False):
         """
@@ -361,6 +521,7 @@ class TrackDB(object):
             self.tracks[location] = TrackHolder(tr, self._key)
             self._key += 1
 
+        self.tag_index.add_tracks(tracks)
         event.log_event('tracks_added', self, locations)
 
         self._dirty = True
@@ -386,6 +547,7 @@ class TrackDB(object):
             self._deleted_keys.append(self.tracks[location]._key)
             del self.tracks[location]
 
+        self.tag_index.remove_tracks(tracks)
         event.log_event('tracks_removed', self, locations)
 
         self._dirty = True
@@ -393,6 +555,23 @@ class TrackDB(object):
     def get_tracks(self):
         return list(self)
 
+    def close(self):
+        """
+            Stops following tag changes of the tracks in this
+            :class:`TrackDB`, call this when it is no longer used
+        """
+        event.remove_callback(self._on_track_tags_changed,
+            'track_tags_changed')
+
+    def _on_track_tags_changed(self, type, track, tag):
+        """
+            Keeps the search index up to date
+        """
+        holder = self.tracks.get(track.get_loc_for_io())
+        if holder is None or holder._track is not track:
+            return
+        self.tag_index.update_track(track, tag)
+
 
     def search(self, query, sort_fields=[], return_lim=-1,
             tracks=None, reverse=False):
@@ -104,11 +104,13 @@ def sort_tracks(fields, iter, trackfunc=None, reverse=False, artist_compilations
         :param reverse: whether to sort in reversed order
         :type reverse: boolean
     """
-    fields = list(fields) # we need the index method
+    fields = tuple(fields)
+    # the keys are cached by the tracks, see Track.get_sort_key
     if trackfunc is None:
-        trackfunc = lambda tr: tr
-    keyfunc = lambda tr: [trackfunc(tr).get_tag_sort(field,
-        artist_compilations=artist_compilations) for field in fields]
+        keyfunc = lambda tr: tr.get_sort_key(fields, artist_compilations)
+    else:
+        keyfunc = lambda tr: trackfunc(tr).get_sort_key(fields,
+                artist_compilations)
     
     return sorted(iter, key=keyfunc, reverse=reverse)
 
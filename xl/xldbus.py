@@ -540,6 +540,18 @@ class DbusManager(dbus.service.Object):
         """
         return self.exaile.get_version()
 
+    @dbus.service.method('org.exaile.Exaile', None, 's')
+    def GetEventStats(self):
+        """
+            Returns a table of the events emitted so far and, when
+            Exaile was started with --profile-events, of the time
+            spent in each event callback
+
+            :returns: the statistics
+            :rtype: string
+        """
+        return event.EVENT_MANAGER.format_stats()
+
     @dbus.service.method('org.exaile.Exaile', 's')
     def PlayFile(self, filename):
         """
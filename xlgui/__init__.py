@@ -318,6 +318,17 @@ class Main(object):
             self.progress_manager.add_monitor(thread,
                 _("Scanning collection..."), Gtk.STOCK_REFRESH)
 
+    def on_fetch_covers(self, *e):
+        """
+            Called when the user wishes to fetch the covers of all
+            albums in the collection
+        """
+        from xl.covers import CoverPrefetchThread
+
+        thread = CoverPrefetchThread(self.exaile.collection)
+        self.progress_manager.add_monitor(thread,
+            _("Fetching covers..."), Gtk.STOCK_FIND)
+
     def on_rescan_done(self, thread):
         """
             Called when the rescan has finished
@@ -128,8 +128,8 @@ class CoverManager(GObject.GObject):
         self.outstanding_text = _('{outstanding} covers left to fetch')
         self.completed_text = _('All covers fetched')
         self.cover_size = (90, 90)
-        self.default_cover_pixbuf = icons.MANAGER.pixbuf_from_data(
-            COVER_MANAGER.get_default_cover(), self.cover_size)
+        self.default_cover_pixbuf = COVER_MANAGER.get_cover_pixbuf(None,
+            self.cover_size, use_default=True)
 
         builder = Gtk.Builder()
         builder.add_from_file(xdg.get_data_path('ui', 'covermanager.ui'))
@@ -199,8 +199,7 @@ class CoverManager(GObject.GObject):
 
         outstanding = []
         # Speed up the following loop
-        get_cover = COVER_MANAGER.get_cover
-        pixbuf_from_data = icons.MANAGER.pixbuf_from_data
+        get_cover_pixbuf = COVER_MANAGER.get_cover_pixbuf
         default_cover_pixbuf = self.default_cover_pixbuf
         cover_size = self.cover_size
 
@@ -210,13 +209,10 @@ class CoverManager(GObject.GObject):
             if self.stopper.is_set():
                 return
 
-            cover_data = get_cover(self.album_tracks[album][0], set_only=True)
-            cover_pixbuf = pixbuf_from_data(cover_data) if cover_data else None
+            thumbnail_pixbuf = get_cover_pixbuf(self.album_tracks[album][0],
+                cover_size, set_only=True)
 
-            try:
-                thumbnail_pixbuf = cover_pixbuf.scale_simple(*cover_size,
-                    interp_type=GdkPixbuf.InterpType.BILINEAR)
-            except AttributeError: # cover_pixbuf is None
+            if thumbnail_pixbuf is None:
                 thumbnail_pixbuf = default_cover_pixbuf
                 outstanding.append(album)
 
@@ -236,17 +232,17 @@ class CoverManager(GObject.GObject):
         self.emit('fetch-started', len(self.outstanding))
 
         # Speed up the following loop
-        get_cover = COVER_MANAGER.get_cover
+        get_cover_pixbuf = COVER_MANAGER.get_cover_pixbuf
         save = COVER_MANAGER.save
-        pixbuf_from_data = icons.MANAGER.pixbuf_from_data
+        cover_size = self.cover_size
 
         for i, album in enumerate(self.outstanding[:]):
             if self.stopper.is_set():
                 # Allow for "fetch-completed" signal to be emitted
                 break
 
-            cover_data = get_cover(self.album_tracks[album][0], save_cover=True)
-            cover_pixbuf = pixbuf_from_data(cover_data) if cover_data else None
+            cover_pixbuf = get_cover_pixbuf(self.album_tracks[album][0],
+                cover_size, set_only=False)
 
             self.emit('fetch-progress', i + 1)
 
@@ -764,7 +760,13 @@ class CoverWidget(Gtk.EventBox):
             return
         
         width = settings.get_option('gui/cover_width', 100)
-        pixbuf = icons.MANAGER.pixbuf_from_data(cover_data, (width, width))
+        pixbuf = COVER_MANAGER.get_cover_pixbuf(track, (width, width))
+
+        if pixbuf is None:
+            # covers of tracks without album info are not stored
+            pixbuf = icons.MANAGER.pixbuf_from_data(cover_data,
+                (width, width))
+
         self.image.set_from_pixbuf(pixbuf)
         self.set_drag_source_enabled(True)
         self.cover_data = cover_data
@@ -781,7 +783,7 @@ class CoverWidget(Gtk.EventBox):
             if not cover_data:
                 return
 
-            GLib.idle_add(self.on_cover_chosen, None, cover_data)
+            GLib.idle_add(self.on_cover_chosen, None, track, cover_data)
 
     def on_quit_application(self, type, exaile, nothing):
         """
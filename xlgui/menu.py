@@ -224,6 +224,9 @@ def __create_tools_menu():
     items.append(_smi('slow-scan-collection', [items[-1].name], _('Rescan Collection (_slow)'),
         'view-refresh', get_main().controller.on_rescan_collection_forced))
 
+    items.append(_smi('fetch-covers', [items[-1].name], _('_Fetch Covers'),
+        'image-x-generic', get_main().controller.on_fetch_covers))
+
     for item in items:
         providers.register('menubar-tools-menu', item)
 
@@ -24,6 +24,7 @@
 # do so. If you do not wish to do so, delete this exception statement
 # from your version.
 
+from bisect import bisect_right
 from gi.repository import Gdk
 from gi.repository import GdkPixbuf
 from gi.repository import GLib
@@ -152,6 +153,152 @@ DEFAULT_ORDERS = [
             (("discnumber", "tracknumber", "title"), "$title", ("title",)))),
 ]
 
+class CollectionNode(object):
+    """
+        A node of a :class:`CollectionHierarchy`, standing for a row
+        of the collection tree
+    """
+    __slots__ = ['parent', 'ident', 'key', 'label', 'match_query', 'char',
+            'tracks', 'children', 'keys', 'by_ident', 'expand', 'iter',
+            'loaded']
+
+    def __init__(self, parent=None, ident=None, key=None, label=None,
+            match_query=None):
+        self.parent = parent
+        self.ident = ident
+        #: sort key of the node, used to keep its siblings in order
+        self.key = key
+        self.label = label
+        self.match_query = match_query
+        #: first meaningful character of the sort value, for separators
+        self.char = None
+        #: the tracks below this node
+        self.tracks = set()
+        self.children = []
+        self.keys = []
+        self.by_ident = {}
+        #: whether the node should be expanded to show search results
+        self.expand = False
+        #: the Gtk.TreeIter of the row showing this node, if any
+        self.iter = None
+        #: whether the rows of the children have been created
+        self.loaded = False
+
+class CollectionHierarchy(object):
+    """
+        Tracks arranged in a tree according to an :class:`Order`.
+
+        Each level groups the tracks of its parent by the values the
+        level displays and searches for, and keeps the groups sorted by
+        the sort tags of the level, so that expanding a node in the
+        collection tree only needs to look at its children.
+    """
+    def __init__(self, order):
+        self.order = order
+        self.root = CollectionNode()
+        # location -> leaf node of the track
+        self._leaves = {}
+        self._levels = []
+        for depth in range(len(order)):
+            deeper = []
+            for i in range(depth + 1, len(order)):
+                deeper.extend(order.get_sort_tags(i))
+            self._levels.append((order.get_sort_tags(depth), deeper))
+
+    def __len__(self):
+        return len(self._leaves)
+
+    def add_tracks(self, srtrs):
+        """
+            Adds search results to the hierarchy
+
+            :param srtrs: iterable of :class:`xl.trax.SearchResultTrack`
+            :returns: the set of nodes whose children changed, and the
+                set of nodes whose track count changed
+        """
+        relist = set()
+        counted = set()
+        last = len(self._levels) - 1
+        for srtr in srtrs:
+            track = srtr.track
+            loc = track.get_loc_for_io()
+            if loc in self._leaves:
+                self.__remove(loc, relist, counted)
+            node = self.root
+            for depth, (tags, deeper) in enumerate(self._levels):
+                bottom = depth == last
+                label = self.order.format_track(depth, track)
+                match_query = " ".join([track.get_tag_search(t, format=True)
+                    for t in tags])
+                if bottom:
+                    match_query += " " + \
+                            track.get_tag_search("__loc", format=True)
+                    ident = loc
+                else:
+                    ident = (match_query, label)
+                child = node.by_ident.get(ident)
+                if child is None:
+                    key = [track.get_tag_sort(t) for t in tags]
+                    child = CollectionNode(node, ident, key, label,
+                            match_query)
+                    if depth == 0:
+                        child.char = first_meaningful_char(key[0])
+                    # stays stable for equal keys, like sorting does
+                    pos = bisect_right(node.keys, key)
+                    node.children.insert(pos, child)
+                    node.keys.insert(pos, key)
+                    node.by_ident[ident] = child
+                    relist.add(node)
+                child.tracks.add(track)
+                counted.add(child)
+                if not child.expand and srtr.on_tags:
+                    for tag in deeper:
+                        if tag in srtr.on_tags:
+                            child.expand = True
+                            break
+                node = child
+            self.root.tracks.add(track)
+            self._leaves[loc] = node
+        return relist, counted
+
+    def remove_tracks(self, locs):
+        """
+            Removes tracks from the hierarchy
+
+            :param locs: the locations of the tracks
+            :returns: see :meth:`add_tracks`
+        """
+        relist = set()
+        counted = set()
+        for loc in locs:
+            self.__remove(loc, relist, counted)
+        return relist, counted
+
+    def __remove(self, loc, relist, counted):
+        node = self._leaves.pop(loc, None)
+        if node is None:
+            return
+        track = next(iter(node.tracks))
+        while node.parent is not None:
+            parent = node.parent
+            node.tracks.discard(track)
+            if node.tracks:
+                counted.add(node)
+            else:
+                pos = parent.children.index(node)
+                del parent.children[pos]
+                del parent.keys[pos]
+                del parent.by_ident[node.ident]
+                relist.add(parent)
+            node = parent
+        self.root.tracks.discard(track)
+
+    def get_tracks(self):
+        """
+            Returns all tracks of the hierarchy
+        """
+        return list(self.root.tracks)
+
 class CollectionPanel(panel.Panel):
     """
         The collection panel
@@ -193,8 +340,13 @@ class CollectionPanel(panel.Panel):
         self._setup_images()
         self._connect_events()
         self.order = None
-        self.tracks = []
-        self.sorted_tracks = []
+        self.hierarchy = None
+        self._matcher = None
+        self._hierarchy_num = 0
+        # locations of tracks added, changed or removed since the tree
+        # was last updated
+        self._added_locs = set()
+        self._removed_locs = set()
 
         event.add_ui_callback(self._check_collection_empty, 'libraries_modified',
             collection)
@@ -257,7 +409,8 @@ class CollectionPanel(panel.Panel):
             'on_add_music_button_clicked': self.on_add_music_button_clicked
         })
         self.tree.connect('key-release-event', self.on_key_released)
-        event.add_ui_callback(self.refresh_tags_in_tree, 'track_tags_changed')
+        event.add_batched_callback(self.refresh_tags_in_tree,
+            'track_tags_changed')
         event.add_ui_callback(self.refresh_tracks_in_tree, 
             'tracks_added', self.collection)
         event.add_ui_callback(self.refresh_tracks_in_tree, 
@@ -399,7 +552,8 @@ class CollectionPanel(panel.Panel):
         self.tree.set_row_separator_func(
             (lambda m, i, d: m.get_value(i, 1) is None), None)
 
-        self.model = Gtk.TreeStore(GdkPixbuf.Pixbuf, str, object)
+        # icon, label, search query, CollectionNode
+        self.model = Gtk.TreeStore(GdkPixbuf.Pixbuf, str, object, object)
 
         self.tree.connect("row-expanded", self.on_expanded)
 
@@ -407,11 +561,10 @@ class CollectionPanel(panel.Panel):
         """
             finds tracks matching a given iter.
         """
-        self.load_subtree(iter)
-        search = self.get_node_search_terms(iter)
-        matcher = trax.TracksMatcher(search)
-        srtrs = trax.search_tracks(self.tracks, [matcher])
-        return [ x.track for x in srtrs ]
+        node = self.model.get_value(iter, 3)
+        if node is None:
+            return []
+        return list(node.tracks)
 
     def append_to_playlist(self, item=None, event=None, replace=False):
         """
@@ -479,42 +632,70 @@ class CollectionPanel(panel.Panel):
 
         return " ".join(queries)
 
-    def refresh_tags_in_tree(self, type, track, tag):
-        if settings.get_option('gui/sync_on_tag_change', True) and \
-            tag in self.order.all_sort_tags() and \
-            self.collection.loc_is_member(track.get_loc_for_io()):
-            self._refresh_tags_in_tree()
-
-    def refresh_tracks_in_tree(self, type, obj, loc):
-        self._refresh_tags_in_tree()
+    def refresh_tags_in_tree(self, type, events):
+        """
+            Called with batches of (track, tag) tuples of changed tags
+        """
+        if not settings.get_option('gui/sync_on_tag_change', True):
+            return
+        sort_tags = set(self.order.all_sort_tags())
+        changed = False
+        for track, tag in events:
+            if tag not in sort_tags:
+                continue
+            loc = track.get_loc_for_io()
+            if self.collection.loc_is_member(loc):
+                self._added_locs.add(loc)
+                changed = True
+        if changed:
+            self._update_tree()
+
+    def refresh_tracks_in_tree(self, type, obj, locs):
+        if type == 'tracks_added':
+            self._added_locs.update(locs)
+        else:
+            self._added_locs.difference_update(locs)
+            self._removed_locs.update(locs)
+        self._update_tree()
 
     @common.glib_wait(500)
-    def _refresh_tags_in_tree(self):
+    def _update_tree(self):
         """
-            Callback for when tags have changed and the tree
-            needs reloading.
+            Moves the tracks added, changed or removed since the last
+            call to their place in the hierarchy, and updates the rows
+            of the affected nodes only
         """
-        # Trying to reload while we're rescanning is really inefficient,
-        # so we delay it until we're done scanning.
-        if self.collection._scanning:
+        # wait for the scan to finish and the hierarchy to be built
+        if self.collection._scanning or self.hierarchy is None:
             return True
-        self.resort_tracks()
-        self.load_tree()
-        return False
 
-    def resort_tracks(self):
-#        import time
-#        print "sorting...", time.clock()
-        self.sorted_tracks = trax.sort_tracks(self.order.get_sort_tags(0),
-            self.collection.get_tracks())
-#        print "sorted.", time.clock()
+        removed, self._removed_locs = self._removed_locs, set()
+        added, self._added_locs = self._added_locs, set()
+        relist, counted = self.hierarchy.remove_tracks(removed | added)
+
+        tracks = []
+        for loc in added:
+            track = self.collection.get_track_by_loc(loc)
+            if track is not None:
+                tracks.append(track)
+        srtrs = trax.search_tracks(tracks, [self._matcher])
+        more_relist, more_counted = self.hierarchy.add_tracks(srtrs)
+        relist |= more_relist
+        counted |= more_counted
+
+        if relist or counted:
+            self._update_rows(relist, counted)
+            self.emit('collection-tree-loaded')
+        return False
 
     def load_tree(self):
         """
             Loads the Gtk.TreeView for this collection panel.
 
             Loads tracks based on the current keyword, or all the tracks in
-            the collection associated with this panel
+            the collection associated with this panel. The tracks are
+            arranged in a :class:`CollectionHierarchy` in the background,
+            rows are created from it when their parent is expanded.
         """
         logger.debug("Reloading collection tree")
         self.current_start_count = self.start_count
@@ -522,12 +703,8 @@ class CollectionPanel(panel.Panel):
         self.model.clear()
 
         self.root = None
-        oldorder = self.order
         self.order = self.orders[self.choice.get_active()]
 
-        if not oldorder or oldorder != self.order:
-            self.resort_tracks()
-
         # save the active view setting
         settings.set_option(
                 'gui/collection_active_view',
@@ -538,15 +715,38 @@ class CollectionPanel(panel.Panel):
         tags += self.order.all_search_tags()
         tags = list(set(tags)) # uniquify list to speed up search
 
-        self.tracks = list(
-                trax.search_tracks_from_string(self.sorted_tracks,
-                    keyword, case_sensitive=False, keyword_tags=tags) )
-
+        self._matcher = trax.TracksMatcher(keyword, case_sensitive=False,
+                keyword_tags=tags)
+        self.hierarchy = None
+        self._added_locs.clear()
+        self._removed_locs.clear()
+        self._hierarchy_num += 1
+        self._build_hierarchy(self._hierarchy_num, self.order, self._matcher,
+                self.collection.get_tracks())
+
+    @common.threaded
+    def _build_hierarchy(self, num, order, matcher, tracks):
+        """
+            Arranges the tracks matching the current search
+        """
+        srtrs = trax.search_tracks(tracks, [matcher],
+                self.collection.tag_index)
+        # add in sort order, so that equal keys keep their usual order
+        srtrs = trax.sort_result_tracks(order.get_sort_tags(0), srtrs)
+        hierarchy = CollectionHierarchy(order)
+        hierarchy.add_tracks(srtrs)
+        GLib.idle_add(self._on_hierarchy_built, num, hierarchy)
+
+    def _on_hierarchy_built(self, num, hierarchy):
+        if num != self._hierarchy_num:
+            return # a newer search is being built
+        self.hierarchy = hierarchy
         self.load_subtree(None)
-
         self.tree.set_model(self.model)
-
         self.emit('collection-tree-loaded')
+        # apply changes that happened while building
+        if self._added_locs or self._removed_locs:
+            self._update_tree()
 
     def _expand_node_by_name(self, search_num, parent, name, rest=None):
         """
@@ -585,130 +785,140 @@ class CollectionPanel(panel.Panel):
 
             @param node: the node
         """
-        previously_loaded = False # was the subtree already loaded
+        if self.hierarchy is None:
+            return
+        if parent is None:
+            node = self.hierarchy.root
+        else:
+            node = self.model.get_value(parent, 3)
+        if node is None or node.loaded:
+            return
+
         iter_sep = None
-        if parent == None:
+        if parent is not None:
+            iter_sep = self.model.iter_children(parent)
+
+        to_expand = self._append_children(parent, node)
+
+        if iter_sep is not None:
+            self.model.remove(iter_sep)
+
+        if settings.get_option("gui/expand_enabled", True) and \
+            len(to_expand) < \
+                    settings.get_option("gui/expand_maximum_results", 100) and \
+            len(self.keyword.strip()) >= \
+                    settings.get_option("gui/expand_minimum_term_length", 2):
+            for iter in to_expand:
+                GLib.idle_add(self.tree.expand_row,
+                        self.model.get_path(iter), False)
+
+    def _append_children(self, parent, node):
+        """
+            Appends rows for the children of a node
+
+            :param parent: the Gtk.TreeIter of the node, None for the root
+            :param node: the :class:`CollectionNode`
+            :returns: the iters of the rows to expand for search results
+        """
+        if parent is None:
             depth = 0
         else:
-            if self.model.iter_n_children(parent) != 1 or \
-                self.model.get_value(
-                    self.model.iter_children(parent), 1) != None:
-                previously_loaded = True
-            iter_sep = self.model.iter_children(parent)
             depth = self.model.iter_depth(parent) + 1
-        if previously_loaded:
-            return
+        node.loaded = True
+        if depth >= len(self.order):
+            return [] # at the bottom of the tree
 
-        search = self.get_node_search_terms(parent)
-
-        try:
-            tags = self.order.get_sort_tags(depth)
-            matchers = [trax.TracksMatcher(search)]
-            srtrs = trax.search_tracks(self.tracks, matchers)
-            # sort only if we are not on top level, because tracks are 
-            # already sorted by fist order
-            if depth > 0:
-                srtrs = trax.sort_result_tracks(tags, srtrs)
-        except IndexError:
-            return # at the bottom of the tree
+        tags = self.order.get_sort_tags(depth)
         try:
             image = getattr(self, "%s_image"%tags[-1])
         except Exception:
             image = None
-        bottom = False
-        if depth == len(self.order)-1:
-            bottom = True
-
+        bottom = depth == len(self.order) - 1
 
         display_counts = settings.get_option('gui/display_track_counts', True)
-        draw_seps = settings.get_option('gui/draw_separators', True)
-        last_char = ''
-        last_val = ''
-        last_dval = ''
-        last_matchq = ''
-        count = 0
-        first = True
-        path = None
-        expanded = False
+        draw_seps = depth == 0 and \
+                settings.get_option('gui/draw_separators', True)
+        last_char = None
         to_expand = []
 
-        for srtr in srtrs:
-            stagvals = [unicode(srtr.track.get_tag_sort(x)) for x in tags]
-            stagval = " ".join(stagvals)
-            if (last_val != stagval or bottom):
-                tagval = self.order.format_track(depth, srtr.track)
-                match_query = " ".join([
-                    srtr.track.get_tag_search(t, format=True) for t in tags])
-                if bottom:
-                    match_query += " " + \
-                            srtr.track.get_tag_search("__loc", format=True)
-
-                # Different *sort tags can cause stagval to not match
-                # but the below code will produce identical entries in
-                # the displayed tree.  This condition checks to ensure
-                # that new entries are added if and only if they will
-                # display different results, avoiding that problem.
-                if match_query != last_matchq or tagval != last_dval or bottom:
-                    if display_counts and path and not bottom:
-                        iter = self.model.get_iter(path)
-                        val = self.model.get_value(iter, 1)
-                        val = "%s (%s)"%(val, count)
-                        self.model.set_value(iter, 1, val)
-                        count = 0
-
-                    last_val = stagval
-                    last_dval = tagval
-                    if depth == 0 and draw_seps:
-                        val = srtr.track.get_tag_sort(tags[0])
-                        char = first_meaningful_char(val)
-                        if first:
-                            last_char = char
-                        else:
-                            if char != last_char and last_char != '':
-                                self.model.append(parent, [None, None, None])
-                            last_char = char
-                    first = False
-
-                    last_matchq = match_query
-                    iter = self.model.append(parent, 
-                        [image, tagval, match_query])
-                    path = self.model.get_path(iter)
-                    expanded = False
-                    if not bottom:
-                        self.model.append(iter, [None, None, None])
-            count += 1
-            if not expanded:
-                alltags = []
-                for i in range(depth+1, len(self.order)):
-                    alltags.extend(self.order.get_sort_tags(i))
-                for t in alltags:
-                    if t in srtr.on_tags:
-                        # keep original path intact for following block
-                        newpath = path
-                        if depth > 0:
-                            # for some reason, nested iters are always
-                            # off by one in the terminal entry.
-                            newpath = Gtk.TreePath.new_from_indices(newpath[:-1] + [newpath[-1]-1])
-                        to_expand.append(newpath)
-                        expanded = True
-
-        if display_counts and path and not bottom:
-            iter = self.model.get_iter(path)
-            val = self.model.get_value(iter, 1)
-            val = "%s (%s)"%(val, count)
-            self.model.set_value(iter, 1, val)
-            count = 0
+        for child in node.children:
+            if draw_seps:
+                if last_char and child.char != last_char:
+                    self.model.append(parent, [None, None, None, None])
+                last_char = child.char
+
+            label = child.label
+            if display_counts and not bottom:
+                label = "%s (%s)" % (label, len(child.tracks))
+            child.iter = self.model.append(parent,
+                [image, label, child.match_query, child])
+            if not bottom:
+                self.model.append(child.iter, [None, None, None, None])
+            if child.expand:
+                to_expand.append(child.iter)
+        return to_expand
+
+    def _update_rows(self, relist, counted):
+        """
+            Brings the rows of changed nodes up to date
+
+            :param relist: nodes whose children changed
+            :param counted: nodes whose track count changed
+        """
+        if settings.get_option('gui/display_track_counts', True):
+            for node in counted:
+                if node.iter is None or not node.children:
+                    continue
+                self.model.set_value(node.iter, 1,
+                        "%s (%s)" % (node.label, len(node.tracks)))
+
+        for node in relist:
+            # nodes below another relisted node are rebuilt with it
+            parent = node.parent
+            while parent is not None and parent not in relist:
+                parent = parent.parent
+            if parent is not None or not node.loaded:
+                continue
+            if node.parent is None:
+                self._reload_children(None, node)
+            elif node.iter is not None:
+                self._reload_children(node.iter, node)
+
+    def _reload_children(self, parent, node):
+        """
+            Replaces the rows below a node, keeping expanded rows
+            expanded
+        """
+        # collapsed rows keep their children, so every descendant has to
+        # forget its row, which is about to be removed
+        expanded = []
+        stack = [node]
+        while stack:
+            current = stack.pop()
+            for child in current.children:
+                if child.iter is None and not child.loaded:
+                    continue
+                if child.iter is not None and child.loaded and \
+                        self.tree.row_expanded(
+                            self.model.get_path(child.iter)):
+                    expanded.append(child)
+                stack.append(child)
+                child.iter = None
+                child.loaded = False
+
+        if parent is None:
+            self.model.clear()
+        else:
+            while self.model.iter_has_child(parent):
+                self.model.remove(self.model.iter_children(parent))
 
-        if settings.get_option("gui/expand_enabled", True) and \
-            len(to_expand) < \
-                    settings.get_option("gui/expand_maximum_results", 100) and \
-            len(self.keyword.strip()) >= \
-                    settings.get_option("gui/expand_minimum_term_length", 2):
-            for row in to_expand:
-                GLib.idle_add(self.tree.expand_row, row, False)
+        self._append_children(parent, node)
 
-        if iter_sep is not None:
-            self.model.remove(iter_sep)
+        # parents come before their children, so expanding a row loads
+        # the rows of the following ones
+        for child in expanded:
+            if child.iter is not None:
+                self.tree.expand_row(self.model.get_path(child.iter), False)
 
 class CollectionDragTreeView(DragTreeView):
     """
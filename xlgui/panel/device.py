@@ -31,6 +31,7 @@ from gi.repository import GObject
 from gi.repository import Gtk
 
 from xl import common, event
+from xl.formatter import TimeTagFormatter
 from xl.nls import gettext as _
 from xlgui import panel
 from xlgui.panel.collection import CollectionPanel
@@ -58,6 +59,13 @@ class DeviceTransferThread(common.ProgressThread):
         """
         if progress < 100:
             self.emit('progress-update', progress)
+            if transfer.eta is not None:
+                self.emit('progress-text',
+                    # TRANSLATORS: Transfer rate and remaining time
+                    _('%(rate)s/s, %(eta)s left') % {
+                        'rate': GLib.format_size(int(transfer.rate)),
+                        'eta': TimeTagFormatter.format_value(transfer.eta)
+                    })
         else:
             self.emit('done')
 
@@ -78,6 +78,7 @@ class PluginManager(object):
         self.version_label = builder.get_object('version_label')
         self.author_label = builder.get_object('author_label')
         self.name_label = builder.get_object('name_label')
+        self.timing_label = builder.get_object('timing_label')
         self.description = builder.get_object('description_view')
         
         self.model = builder.get_object('model')
@@ -130,7 +131,8 @@ class PluginManager(object):
             else:
                 icon = Gtk.STOCK_APPLY
 
-            enabled = plugin_name in self.plugins.enabled_plugins
+            enabled = plugin_name in self.plugins.enabled_plugins or \
+                    plugin_name in self.plugins.deferred_plugins
             plugin_data = (plugin_name, info['Name'], str(info['Version']),
                            enabled, icon, broken, compatible, True)
             
@@ -269,6 +271,7 @@ class PluginManager(object):
             self.author_label.set_label('')
             self.description.get_buffer().set_text('')
             self.name_label.set_label('')
+            self.timing_label.set_label('')
             return
         
         info = self.plugins.get_plugin_info(row[0])
@@ -279,6 +282,22 @@ class PluginManager(object):
             info['Description'].replace(r'\n', "\n"))
 
         self.name_label.set_markup("<b>%s</b>" % info['Name'])
+        self.timing_label.set_label(self._get_timing_text(row[0]))
+
+    def _get_timing_text(self, plugin_name):
+        """
+            Describes how long the plugin took to import and enable
+        """
+        if plugin_name in self.plugins.deferred_plugins:
+            return _('Waiting to be enabled after startup')
+        parts = []
+        load_time = self.plugins.load_times.get(plugin_name)
+        if load_time is not None:
+            parts.append(_('Import: %d ms') % (load_time * 1000))
+        enable_time = self.plugins.enable_times.get(plugin_name)
+        if enable_time is not None:
+            parts.append(_('Enable: %d ms') % (enable_time * 1000))
+        return ', '.join(parts)
 
     def on_enabled_cellrenderer_toggled(self, cellrenderer, path):
         """
@@ -308,12 +327,13 @@ class PluginManager(object):
 
     def on_plugin_event(self, evtname, obj, plugin_name, enabled):
 
-        if hasattr(self.plugins.loaded_plugins[plugin_name],
+        if hasattr(self.plugins.loaded_plugins.get(plugin_name),
             'get_preferences_pane'):
             self.preferences._load_plugin_pages()
         
         path = self.plugin_to_path[plugin_name]
         self.model[path][3] = enabled
+        self.on_selection_changed(self.list.get_selection())
         
         
     def on_show_broken_cb_toggled(self, widget):
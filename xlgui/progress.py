@@ -60,6 +60,8 @@ class ProgressMonitor(Gtk.Box):
         self.manager = manager
         self.thread = thread
         self._progress_updated = False
+        self._percent = None
+        self._text = None
 
         if image is not None:
             self.pack_start(image, False, True, 0)
@@ -71,6 +73,8 @@ class ProgressMonitor(Gtk.Box):
         
         self.progress_update_id = self.thread.connect('progress-update',
             self.on_progress_update)
+        self.progress_text_id = self.thread.connect('progress-text',
+            self.on_progress_text)
         self.done_id = self.thread.connect('done', self.on_done)
         self.thread.start()
         
@@ -83,9 +87,11 @@ class ProgressMonitor(Gtk.Box):
 
         if self.progress_update_id is not None:
             self.thread.disconnect(self.progress_update_id)
+            self.thread.disconnect(self.progress_text_id)
             self.thread.disconnect(self.done_id)
             
             self.progress_update_id = None
+            self.progress_text_id = None
             self.done_id = None
 
     def pulsate_progress(self):
@@ -122,7 +128,28 @@ class ProgressMonitor(Gtk.Box):
         fraction = clamp(percent / 100.0, 0, 1)
 
         self.progressbar.set_fraction(fraction)
-        self.progressbar.set_text('%d%%' % percent)
+        self._percent = percent
+        self._update_text()
+
+    @idle_add()
+    def on_progress_text(self, thread, text):
+        """
+            Called when the status text has been updated
+        """
+        self._text = text
+        self._update_text()
+
+    def _update_text(self):
+        """
+            Shows the percentage and the status text, if any
+        """
+        if self._percent is None:
+            self.progressbar.set_text(self._text or '')
+        elif self._text:
+            self.progressbar.set_text('%d%% (%s)' % (self._percent,
+                self._text))
+        else:
+            self.progressbar.set_text('%d%%' % self._percent)
     
     @idle_add()
     def on_done(self, thread):
@@ -45,7 +45,6 @@ from xl import (
 )
 
 from xlgui.guiutil import get_workarea_size, ModifierType
-from xlgui import icons
 
 class AttachedWindow(Gtk.Window):
     """
@@ -290,10 +289,8 @@ class DragTreeView(AutoScrollTreeView):
             for track in tracks:
                 album = track.get_tag_raw('album', join=True)
                 if album not in albums:
-                    image_data = cover_manager.get_cover(track,
-                        set_only=True, use_default=True)
-                    pixbuf = icons.MANAGER.pixbuf_from_data(
-                        image_data, (width, height))
+                    pixbuf = cover_manager.get_cover_pixbuf(track,
+                        (width, height), set_only=True, use_default=True)
 
                     if first_pixbuf is None:
                         first_pixbuf = pixbuf
@@ -50,12 +50,29 @@ logger = logging.getLogger(__name__)
 
 DEFAULT_COLUMNS = ['tracknumber', 'title', 'album', 'artist', '__length']
 
+# Number of formatted values kept per column, see TrackFormatter
+FORMATTER_CACHE_SIZE = 10000
+
+# column name -> formatter shared by the columns of all playlists
+_formatters = {}
+
+def _get_formatter(cls):
+    """
+        Returns the formatter shared by all columns of a class
+    """
+    try:
+        return _formatters[cls.name]
+    except KeyError:
+        formatter = _formatters[cls.name] = TrackFormatter(
+            '$%s' % cls.name, cache_size=FORMATTER_CACHE_SIZE)
+        return formatter
+
 class Column(Gtk.TreeViewColumn):
     name = ''
     display = ''
     menu_title = classproperty(lambda c: c.display)
     renderer = Gtk.CellRendererText
-    formatter = classproperty(lambda c: TrackFormatter('$%s' % c.name))
+    formatter = classproperty(_get_formatter)
     size = 10 # default size
     autoexpand = False # whether to expand to fit space in Autosize mode
     datatype = str
@@ -507,7 +524,8 @@ class CommentColumn(Column):
     size = 200
     autoexpand = True
     # Remove the newlines to fit into the vertical space of rows
-    formatter = TrackFormatter('${comment:newlines=strip}')
+    formatter = TrackFormatter('${comment:newlines=strip}',
+        cache_size=FORMATTER_CACHE_SIZE)
 providers.register('playlist-columns', CommentColumn)
 
 class GroupingColumn(Column):